@@ -0,0 +1,130 @@
+"""Compare the asyncio, generator and list front ends of the IntCode core.
+
+    python bench/adapters.py [--day5 day5/input.txt] [--day7 day7/input.txt]
+
+day5 runs the diagnostic program with inputs 1 and 5, day7 runs every phase
+ordering of the (non feedback) amplifier chain. The list adapter can only feed
+inputs known up front, so it cannot drive the day7 feedback loop.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from typing import Callable
+from typing import List
+
+from IntCode import IntCode
+from IntCode import run_program
+from IntCodeGen import IntCodeGen
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load(path: str) -> List[int]:
+    with open(path) as f:
+        return [int(x) for x in f.read().split(",")]
+
+
+def day5_async(data: List[int]) -> int:
+    async def run(input_value: int) -> int:
+        input_queue: asyncio.Queue[int] = asyncio.Queue()
+        output_queue: asyncio.Queue[int] = asyncio.Queue()
+        input_queue.put_nowait(input_value)
+        await IntCode(data[:], input_queue, output_queue).execute()
+        outputs = [output_queue.get_nowait() for _ in range(output_queue.qsize())]
+        return outputs[-1]
+
+    return asyncio.run(run(1)) + asyncio.run(run(5))
+
+
+def day5_gen(data: List[int]) -> int:
+    result = 0
+    for input_value in (1, 5):
+        program = IntCodeGen(data[:])
+        program.inputs.append(input_value)
+        for _ in program.execute():
+            pass
+        result += program.outputs[-1]
+    return result
+
+
+def day5_list(data: List[int]) -> int:
+    return run_program(data[:], [1])[-1] + run_program(data[:], [5])[-1]
+
+
+def day7_async(data: List[int]) -> int:
+    async def run(ordering: List[int]) -> int:
+        queues: List[asyncio.Queue[int]] = [asyncio.Queue() for _ in range(6)]
+        for queue, phase in zip(queues, ordering):
+            queue.put_nowait(phase)
+        queues[0].put_nowait(0)
+        await asyncio.gather(
+            *(IntCode(data[:], queues[i], queues[i + 1]).execute() for i in range(5))
+        )
+        return queues[-1].get_nowait()
+
+    async def run_all() -> int:
+        orderings = itertools.permutations(range(5))
+        return max([await run(list(ordering)) for ordering in orderings])
+
+    return asyncio.run(run_all())
+
+
+def day7_gen(data: List[int]) -> int:
+    best = 0
+    for ordering in itertools.permutations(range(5)):
+        signal = 0
+        for phase in ordering:
+            program = IntCodeGen(data[:])
+            program.inputs.extend((phase, signal))
+            for _ in program.execute():
+                pass
+            signal = program.outputs[-1]
+        best = max(best, signal)
+    return best
+
+
+def day7_list(data: List[int]) -> int:
+    best = 0
+    for ordering in itertools.permutations(range(5)):
+        signal = 0
+        for phase in ordering:
+            signal = run_program(data[:], [phase, signal])[-1]
+        best = max(best, signal)
+    return best
+
+
+def measure(fn: Callable[[List[int]], int], data: List[int], repeat: int) -> float:
+    fn(data)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day5", default=os.path.join(HERE, "..", "day5", "input.txt"))
+    parser.add_argument("--day7", default=os.path.join(HERE, "..", "day7", "input.txt"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = (
+        ("day5", load(args.day5), (day5_async, day5_gen, day5_list)),
+        ("day7", load(args.day7), (day7_async, day7_gen, day7_list)),
+    )
+    for name, data, fns in cases:
+        answers = {fn(data) for fn in fns}
+        if len(answers) != 1:
+            raise Exception(f"Adapters disagree on {name}: {answers}")
+        for fn in fns:
+            elapsed = measure(fn, data, args.repeat) * 1_000_000
+            print(f"{name} {fn.__name__.split('_')[1]:>6}: {elapsed:10.0f} μs")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
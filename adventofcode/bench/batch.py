@@ -0,0 +1,112 @@
+"""Compare lockstep batches against one VM per permutation / noun-verb pair.
+
+    python bench/batch.py [--day2 day2/input.txt] [--day7 day7/input.txt]
+
+The day2 loop stops at the first noun/verb pair that matches while the batch
+runs all of them, so how the two compare depends on where the answer is.
+"""
+import argparse
+import itertools
+import os
+from typing import List
+from typing import Sequence
+
+from adapters import HERE
+from adapters import load
+from adapters import measure
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from IntCodeBatch import IntCodeBatch
+from IntCodeBatch import run_amplifiers_batch
+
+DAY2_GOAL = 19690720
+
+
+def day7_loop(data: List[int]) -> int:
+    """Both parts, one set of VMs per permutation."""
+    best_1 = max(
+        _chain(data, ordering) for ordering in itertools.permutations(range(5))
+    )
+    best_2 = max(
+        _ring(data, ordering) for ordering in itertools.permutations(range(5, 10))
+    )
+    return best_1 + best_2
+
+
+def _chain(data: List[int], ordering: Sequence[int]) -> int:
+    signal = 0
+    for phase in ordering:
+        signal = run_program(data[:], [phase, signal])[-1]
+    return signal
+
+
+def _ring(data: List[int], ordering: Sequence[int]) -> int:
+    programs = [IntCodeCore(data[:]) for _ in ordering]
+    for program, phase in zip(programs, ordering):
+        program.inputs.append(phase)
+    signal = 0
+    while not programs[-1].finished:
+        for program in programs:
+            program.inputs.append(signal)
+            while program.run() == Status.OUTPUT:
+                assert program.output is not None
+                signal = program.output
+    return signal
+
+
+def day7_batch(data: List[int]) -> int:
+    return max(
+        run_amplifiers_batch(data, list(itertools.permutations(range(5))), False)
+    ) + max(
+        run_amplifiers_batch(data, list(itertools.permutations(range(5, 10))), True)
+    )
+
+
+def day2_loop(data: List[int]) -> int:
+    program = IntCodeCore(data[:])
+    for noun, verb in itertools.product(range(100), repeat=2):
+        program.restore()
+        program.write(1, noun)
+        program.write(2, verb)
+        program.run()
+        if program.data[0] == DAY2_GOAL:
+            return noun * 100 + verb
+    return 0
+
+
+def day2_batch(data: List[int]) -> int:
+    pairs = list(itertools.product(range(100), repeat=2))
+    batch = IntCodeBatch(data, len(pairs))
+    batch.write(1, [noun for noun, _ in pairs])
+    batch.write(2, [verb for _, verb in pairs])
+    batch.run()
+    for (noun, verb), result in zip(pairs, batch.read(0)):
+        if result == DAY2_GOAL:
+            return noun * 100 + verb
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day2", default=os.path.join(HERE, "..", "day2", "input.txt"))
+    parser.add_argument("--day7", default=os.path.join(HERE, "..", "day7", "input.txt"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = (
+        ("day2", load(args.day2), (day2_loop, day2_batch)),
+        ("day7", load(args.day7), (day7_loop, day7_batch)),
+    )
+    for name, data, fns in cases:
+        answers = {fn(data) for fn in fns}
+        if len(answers) != 1:
+            raise Exception(f"Solutions disagree on {name}: {answers}")
+        for fn in fns:
+            elapsed = measure(fn, data, args.repeat) * 1000
+            print(f"{name} {fn.__name__.split('_')[1]:>6}: {elapsed:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,91 @@
+"""Instructions per second of the interpreter and the basic-block compiler,
+with and without the write watch that static analysis can remove.
+
+    python bench/compiler.py [--day5 day5/input.txt] [--loop 200000]
+
+day5 runs the diagnostic program with inputs 1 and 5, loop sums the numbers
+from 1 to --loop in a three instruction loop. Instruction counts come from a
+one lane IntCodeBatch, which counts every instruction it executes.
+"""
+import argparse
+import os
+import time
+from typing import List
+from typing import Sequence
+from typing import Type
+
+from adapters import HERE
+from adapters import load
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCodeBatch import IntCodeBatch
+from IntCodeAnalysis import AnalyzedIntCode
+from IntCodeCompiler import CompiledIntCode
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+BACKENDS = (IntCodeCore, CompiledIntCode, AnalyzedIntCode)
+
+
+def count_instructions(data: List[int], inputs: Sequence[Sequence[int]]) -> int:
+    count = 0
+    for run_inputs in inputs:
+        batch = IntCodeBatch(data, 1)
+        batch.inputs[0].extend(run_inputs)
+        batch.run()
+        count += batch.lane_steps
+    return count
+
+
+def measure(
+    program_class: Type[IntCodeCore],
+    data: List[int],
+    inputs: Sequence[Sequence[int]],
+    repeat: int,
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for run_inputs in inputs:
+            run_program(data[:], run_inputs, program_class)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day5", default=os.path.join(HERE, "..", "day5", "input.txt"))
+    parser.add_argument("--loop", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = (
+        ("day5", load(args.day5), [[1], [5]]),
+        ("loop", SUM_LOOP, [[args.loop]]),
+    )
+    for name, data, inputs in cases:
+        answers = {
+            tuple(
+                tuple(run_program(data[:], run_inputs, program_class))
+                for run_inputs in inputs
+            )
+            for program_class in BACKENDS
+        }
+        if len(answers) != 1:
+            raise Exception(f"Backends disagree on {name}: {answers}")
+        instructions = count_instructions(data, inputs)
+        for program_class in BACKENDS:
+            # The first run compiles every block; later runs hit the cache
+            elapsed = measure(program_class, data, inputs, args.repeat)
+            rate = instructions / elapsed / 1_000_000
+            print(
+                f"{name} {program_class.__name__:>15}: {instructions:9} "
+                f"instructions, {rate:6.2f} M/s"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
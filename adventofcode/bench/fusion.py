@@ -0,0 +1,108 @@
+"""Dispatches and speed of the plain and the superinstruction interpreter.
+
+    python bench/fusion.py [--day5 day5/input.txt] [--loop 200000]
+
+day5 runs the diagnostic program with inputs 1 and 5, loop sums the numbers
+from 1 to --loop in a loop ending in a compare and jump. The most frequent
+opcode pairs and triples are counted by stepping through each run one
+instruction at a time.
+"""
+import argparse
+import os
+import time
+from collections import Counter
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Type
+
+from adapters import HERE
+from adapters import load
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from IntCodeFusion import COUNT_LOOP
+from IntCodeFusion import FusedIntCode
+
+
+def opcode_trace(data: List[int], inputs: Sequence[int]) -> List[int]:
+    program = IntCodeCore(data[:])
+    program.inputs.extend(inputs)
+    op_codes = []
+    while True:
+        op_codes.append(program.data[program.position] % 100)
+        if program.run_for(1) in (Status.HALTED, Status.NEEDS_INPUT):
+            return op_codes
+
+
+def measure(
+    program_class: Type[IntCodeCore],
+    data: List[int],
+    inputs: Sequence[Sequence[int]],
+    repeat: int,
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for run_inputs in inputs:
+            run_program(data[:], run_inputs, program_class)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def saved_dispatches(data: List[int], inputs: Sequence[Sequence[int]]) -> int:
+    saved = 0
+    for run_inputs in inputs:
+        program = FusedIntCode(data[:])
+        program.inputs.extend(run_inputs)
+        while program.run() != Status.HALTED:
+            pass
+        saved += program.saved_dispatches
+    return saved
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day5", default=os.path.join(HERE, "..", "day5", "input.txt"))
+    parser.add_argument("--loop", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = (
+        ("day5", load(args.day5), [[1], [5]]),
+        ("loop", COUNT_LOOP, [[args.loop]]),
+    )
+    for name, data, inputs in cases:
+        pairs: Counter[Tuple[int, ...]] = Counter()
+        triples: Counter[Tuple[int, ...]] = Counter()
+        instructions = 0
+        for run_inputs in inputs:
+            op_codes = opcode_trace(data, run_inputs)
+            instructions += len(op_codes)
+            pairs.update(zip(op_codes, op_codes[1:]))
+            triples.update(zip(op_codes, op_codes[1:], op_codes[2:]))
+        print(f"{name} pairs:   {pairs.most_common(4)}")
+        print(f"{name} triples: {triples.most_common(4)}")
+
+        answers = {
+            tuple(tuple(run_program(data[:], i, cls)) for i in inputs)
+            for cls in (IntCodeCore, FusedIntCode)
+        }
+        if len(answers) != 1:
+            raise Exception(f"Interpreters disagree on {name}: {answers}")
+        dispatches = instructions - saved_dispatches(data, inputs)
+        print(
+            f"{name} dispatches: {instructions} -> {dispatches} "
+            f"({1 - dispatches / instructions:.0%} fewer)"
+        )
+        for program_class in (IntCodeCore, FusedIntCode):
+            elapsed = measure(program_class, data, inputs, args.repeat)
+            print(
+                f"{name} {program_class.__name__:>12}: "
+                f"{instructions / elapsed / 1_000_000:5.2f} M instructions/s"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,101 @@
+"""Memory per VM and throughput of the list and compact memory backends.
+
+    python bench/memory.py [--day5 day5/input.txt] [--day7 day7/input.txt]
+
+Memory is measured with tracemalloc as the bytes still allocated after
+parsing the input file into a VM ("cold", nothing shared) and after starting
+one more VM from an already parsed program ("warm", the list backend shares
+the parsed int objects). day5 runs the diagnostic with inputs 1 and 5, day7
+runs every ordering of the amplifier chain.
+"""
+import argparse
+import itertools
+import os
+import time
+import tracemalloc
+from typing import Callable
+from typing import List
+from typing import Type
+
+from adapters import HERE
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCodeMemory import CompactIntCode
+from IntCodeProfile import enable_profiling
+from IntCodeProfile import Profile
+
+
+def allocated(fn: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def count_instructions(
+    fn: Callable[[List[int], Type[IntCodeCore]], int], data: List[int]
+) -> int:
+    profile = Profile()
+
+    class Counted(IntCodeCore):
+        def __init__(self, data: List[int]) -> None:
+            super().__init__(data)
+            enable_profiling(self, profile)
+
+    fn(data, Counted)
+    return profile.instructions
+
+
+def day5(data: List[int], program_class: Type[IntCodeCore]) -> int:
+    return sum(run_program(data[:], [i], program_class)[-1] for i in (1, 5))
+
+
+def day7(data: List[int], program_class: Type[IntCodeCore]) -> int:
+    best = 0
+    for ordering in itertools.permutations(range(5)):
+        signal = 0
+        for phase in ordering:
+            signal = run_program(data[:], [phase, signal], program_class)[-1]
+        best = max(best, signal)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day5", default=os.path.join(HERE, "..", "day5", "input.txt"))
+    parser.add_argument("--day7", default=os.path.join(HERE, "..", "day7", "input.txt"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    backends = (("list", IntCodeCore), ("compact", CompactIntCode))
+    for name, path, fn in (("day5", args.day5, day5), ("day7", args.day7, day7)):
+        with open(path) as f:
+            text = f.read()
+        data = [int(x) for x in text.split(",")]
+        answers = {fn(data, program_class) for _, program_class in backends}
+        if len(answers) != 1:
+            raise Exception(f"Backends disagree on {name}: {answers}")
+        instructions = count_instructions(fn, data)
+
+        for backend, program_class in backends:
+            cold = allocated(lambda: program_class([int(x) for x in text.split(",")]))
+            warm = allocated(lambda: program_class(data[:]))
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fn(data, program_class)
+                best = min(best, time.perf_counter() - start)
+            print(
+                f"{name} {backend:>7}: {cold:7} B cold, {warm:7} B warm, "
+                f"{instructions / best / 1_000_000:5.2f} M instructions/s"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
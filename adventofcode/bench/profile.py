@@ -0,0 +1,59 @@
+"""Profile one IntCode program run and export the results.
+
+    python bench/profile.py day5/input.txt --inputs 5 \
+        [--json profile.json] [--collapsed profile.folded]
+
+The collapsed stack file can be fed straight to flamegraph.pl or speedscope.
+"""
+import argparse
+from typing import List
+
+from adapters import load
+from IntCode import IntCodeCore
+from IntCode import NoInputException
+from IntCode import Status
+from IntCodeProfile import enable_profiling
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("program")
+    parser.add_argument("--inputs", type=int, nargs="*", default=[])
+    parser.add_argument("--json")
+    parser.add_argument("--collapsed")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    data = load(args.program)
+    program = IntCodeCore(data[:])
+    profile = enable_profiling(program)
+    program.inputs.extend(args.inputs)
+    outputs: List[int] = []
+    while True:
+        status = program.run()
+        if status == Status.OUTPUT:
+            assert program.output is not None
+            outputs.append(program.output)
+        elif status == Status.NEEDS_INPUT:
+            raise NoInputException()
+        else:
+            break
+
+    print(f"outputs: {outputs}")
+    print(f"{profile.instructions} instructions in {profile.executing_ns} ns")
+    for name, count in sorted(profile.opcodes().items(), key=lambda x: -x[1]):
+        print(f"{name:>12}: {count}")
+    print("hottest addresses:")
+    hottest = sorted(profile.address_counts.items(), key=lambda x: -x[1])
+    for address, count in hottest[: args.top]:
+        print(f"{address:>12}: {count}")
+
+    if args.json:
+        profile.write_json(args.json)
+    if args.collapsed:
+        profile.write_collapsed(args.collapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,50 @@
+"""Throughput of a traced IntCode run relative to an untraced one.
+
+    python bench/trace.py [--loop 200000] [--interval 100000]
+
+Runs a three instruction summing loop --loop times, writing the trace to a
+temporary file.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from IntCode import IntCodeCore
+from IntCodeTrace import enable_tracing
+from IntCodeTrace import SUM_LOOP
+
+
+def run(loop: int, trace_path: str, interval: int) -> float:
+    program = IntCodeCore(SUM_LOOP[:])
+    program.inputs.append(loop)
+    start = time.perf_counter()
+    if trace_path:
+        with enable_tracing(program, trace_path, interval):
+            program.run()
+    else:
+        program.run()
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loop", type=int, default=200_000)
+    parser.add_argument("--interval", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        trace_path = os.path.join(directory, "trace.bin")
+        plain = min(run(args.loop, "", 0) for _ in range(args.repeat))
+        traced = min(
+            run(args.loop, trace_path, args.interval) for _ in range(args.repeat)
+        )
+        size = os.path.getsize(trace_path)
+    print(f"  plain: {plain * 1000:8.1f} ms")
+    print(f" traced: {traced * 1000:8.1f} ms ({traced / plain:.2f}x, {size} B log)")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
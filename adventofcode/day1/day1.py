@@ -1,3 +1,6 @@
+import functools
+from typing import Callable
+from typing import Iterable
 from typing import List
 
 import pytest
@@ -31,7 +34,30 @@ def test_2(input: str, expected: int) -> None:
     assert Day1().compute_2([input]) == expected
 
 
+def sum_fuel_requirements(lines: Iterable[str], fn: Callable[[int], int]) -> int:
+    """Sum `fn` of each mass, one line at a time."""
+    return sum(fn(int(line)) for line in lines if line.strip())
+
+
+def test_streaming() -> None:
+    lines = iter(["12", "1969", "", "100756"])
+    assert sum_fuel_requirements(lines, calc_fuel_requirement) == 2 + 654 + 33583
+
+
 class Day1(AOCProblem):
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_streaming_1(
+            "streaming",
+            functools.partial(sum_fuel_requirements, fn=calc_fuel_requirement),
+        )
+        self.add_streaming_2(
+            "streaming",
+            functools.partial(
+                sum_fuel_requirements, fn=calc_fuel_requirement_repeatedly
+            ),
+        )
+
     def compute_1(self, input_lines: List[str]) -> int:
         masses = [int(line) for line in input_lines]
         fuel_requirements = [calc_fuel_requirement(mass) for mass in masses]
@@ -1,42 +1,112 @@
-import asyncio
+import functools
 from typing import List
 
 from AOCProblem import AOCProblem
-from IntCode import IntCode
+from IntCode import copy_factory
+from IntCode import IntCodeCore
+from IntCodeBatch import IntCodeBatch
+from IntCodeSearch import CellEquals
+from IntCodeSearch import search_inputs
+from IntCodeSymbolic import solve_for_goal
+from ProgramCache import parse_program
+from ProgramImage import ImageIntCode
+from ProgramImage import ProgramImage
 
 Program = List[int]
 
+GOAL_RESULT = 19690720
 
-def set_inputs(program: IntCode, input1: int, input2: int) -> None:
-    program.data[1] = input1
-    program.data[2] = input2
+
+def set_inputs(program: IntCodeCore, input1: int, input2: int) -> None:
+    program.write(1, input1)
+    program.write(2, input2)
 
 
 class Day1(AOCProblem):
+    cache_program = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_alternate_2("parallel search", compute_2_parallel)
+        self.add_alternate_2("symbolic", compute_2_symbolic)
+        self.add_alternate_2("batch", compute_2_batch)
+        self.add_alternate_2("shared image", compute_2_shared_image)
+
     def compute_1(self, input_lines: List[str]) -> int:
-        data = [int(x) for x in input_lines[0].split(",")]
-        program = IntCode(data)
+        data = parse_program(input_lines[0])
+        program = IntCodeCore(data)
         set_inputs(program, 12, 2)
-        asyncio.run(program.execute())
+        program.run()
         return program.data[0]
 
     def compute_2(self, input_lines: List[str]) -> int:
-        data = [int(x) for x in input_lines[0].split(",")]
+        data = parse_program(input_lines[0])
         # Loop through all possible inputs until we find one that matches
         # expected output
 
-        GOAL_RESULT = 19690720
-
+        # A single VM is reset between attempts; restore() only undoes the
+        # cells the previous attempt wrote to
+        program = IntCodeCore(data)
         for input1 in range(100):
             for input2 in range(100):
-                data_copy = data[:]
-                program = IntCode(data_copy)
+                program.restore()
                 set_inputs(program, input1, input2)
-                asyncio.run(program.execute())
+                program.run()
                 if program.data[0] == GOAL_RESULT:
                     return input1 * 100 + input2
         return 0
 
 
+def compute_2_parallel(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    cells = [(1, range(100)), (2, range(100))]
+    match = search_inputs(copy_factory(data), cells, CellEquals(0, GOAL_RESULT))
+    if match is None:
+        return 0
+    input1, input2 = match
+    return input1 * 100 + input2
+
+
+def compute_2_symbolic(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    cells = [(1, range(100)), (2, range(100))]
+    match = solve_for_goal(data, cells, 0, GOAL_RESULT)
+    if match is None:
+        return 0
+    input1, input2 = match
+    return input1 * 100 + input2
+
+
+def compute_2_shared_image(input_lines: List[str]) -> int:
+    cells = [(1, range(100)), (2, range(100))]
+    # Workers attach to the parsed program in shared memory and each VM only
+    # copies in the cells it touches
+    with ProgramImage.parse(input_lines[0]).share() as image:
+        match = search_inputs(
+            functools.partial(ImageIntCode, image), cells, CellEquals(0, GOAL_RESULT)
+        )
+    if match is None:
+        return 0
+    input1, input2 = match
+    return input1 * 100 + input2
+
+
+def compute_2_batch(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    # One lane per noun/verb pair, all running the same program in lockstep.
+    # Unlike the loop in compute_2 it can't stop at the first match, so it
+    # always runs all 10000 pairs; on this input that makes it no faster
+    # than the loop (it's ahead on day7, where every permutation is needed)
+    pairs = [(input1, input2) for input1 in range(100) for input2 in range(100)]
+    batch = IntCodeBatch(data, len(pairs))
+    batch.write(1, [input1 for input1, _ in pairs])
+    batch.write(2, [input2 for _, input2 in pairs])
+    batch.run()
+    for (input1, input2), result in zip(pairs, batch.read(0)):
+        if result == GOAL_RESULT:
+            return input1 * 100 + input2
+    return 0
+
+
 if __name__ == "__main__":
     exit(Day1().main())
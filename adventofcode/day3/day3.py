@@ -83,6 +83,10 @@ def compute_generic(input_lines: List[str], scoring_fn: ScoringFunction,) -> int
 
 
 class Day3(AOCProblem):
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_alternate_1("vectorized", compute_1_vectorized)
+
     def compute_1(self, input_lines: List[str]) -> int:
         return compute_generic(input_lines, score_manhattan)
 
@@ -215,6 +219,4 @@ def compute_1_vectorized(input_lines: List[str]) -> int:
 
 
 if __name__ == "__main__":
-    day3 = Day3()
-    day3.add_alternate_1("vectorized", compute_1_vectorized)
-    exit(day3.main())
+    exit(Day3().main())
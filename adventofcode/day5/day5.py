@@ -1,9 +1,27 @@
 import asyncio
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Type
 
 import pytest
 from AOCProblem import AOCProblem
 from IntCode import IntCode
+from IntCode import IntCodeCore
+from IntCode import NoInputException
+from IntCode import run_program
+from IntCode import Status
+from IntCodeCompiler import CompiledIntCode
+from IntCodeFusion import FusedIntCode
+from ProgramCache import parse_program
+from VMFarm import VMFarm
+
+
+@pytest.fixture(scope="module")
+def farm() -> Iterator[VMFarm]:
+    # One process pool for all the cases below
+    with VMFarm() as farm:
+        yield farm
 
 
 @pytest.mark.parametrize(
@@ -184,9 +202,15 @@ from IntCode import IntCode
         ),
     ),
 )
-def test_with_input_output(data: List[int], input: int, expected_output: int) -> None:
-    all_output = asyncio.run(get_all_outputs_from_input(data, input))
+def test_with_input_output(
+    data: List[int], input: int, expected_output: int, farm: VMFarm
+) -> None:
+    all_output = asyncio.run(get_all_outputs_from_input(data[:], input))
     assert all_output == [expected_output]
+    assert run_program(data[:], [input]) == [expected_output]
+    assert run_program(data[:], [input], CompiledIntCode) == [expected_output]
+    assert run_program(data[:], [input], FusedIntCode) == [expected_output]
+    assert solve_on_farm(data, input, farm) == expected_output
 
 
 async def get_all_outputs_from_input(data: List[int], input: int) -> List[int]:
@@ -202,22 +226,81 @@ async def get_all_outputs_from_input(data: List[int], input: int) -> List[int]:
     return values
 
 
-def solve_with_input_output(data: List[int], input: int) -> int:
-    all_output = asyncio.run(get_all_outputs_from_input(data, input))
+def solve_with_input_output(
+    data: List[int], input: int, program_class: Type[IntCodeCore] = IntCodeCore
+) -> int:
+    all_output = run_program(data, [input], program_class)
+    return check_diagnostics(all_output)
+
+
+def check_diagnostics(all_output: List[int]) -> int:
     if any(x for x in all_output[:-1] if x != 0):
         raise Exception("Function not working correctly")
     return all_output[-1]
 
 
+def solve_on_farm(data: List[int], input: int, farm: Optional[VMFarm] = None) -> int:
+    """Run on `farm`, or on a farm of its own that is closed afterwards."""
+    if farm is None:
+        with VMFarm() as farm:
+            return solve_on_farm(data, input, farm)
+    (result,) = farm.run_all([(data, [input])])
+    if result.status != Status.HALTED:
+        raise NoInputException()
+    return check_diagnostics(result.outputs)
+
+
 class Day5(AOCProblem):
+    cache_program = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_alternate_1("compiled", compute_1_compiled)
+        self.add_alternate_2("compiled", compute_2_compiled)
+        self.add_alternate_1("fused", compute_1_fused)
+        self.add_alternate_2("fused", compute_2_fused)
+        # Each part is a single job, so these mostly time starting the pool
+        self.add_alternate_1("farm + startup", compute_1_farm)
+        self.add_alternate_2("farm + startup", compute_2_farm)
+
     def compute_1(self, input_lines: List[str]) -> int:
-        data = [int(x) for x in input_lines[0].split(",")]
+        data = parse_program(input_lines[0])
         return solve_with_input_output(data, 1)
 
     def compute_2(self, input_lines: List[str]) -> int:
-        data = [int(x) for x in input_lines[0].split(",")]
+        data = parse_program(input_lines[0])
         return solve_with_input_output(data, 5)
 
 
+def compute_1_compiled(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_with_input_output(data, 1, CompiledIntCode)
+
+
+def compute_2_compiled(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_with_input_output(data, 5, CompiledIntCode)
+
+
+def compute_1_fused(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_with_input_output(data, 1, FusedIntCode)
+
+
+def compute_2_fused(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_with_input_output(data, 5, FusedIntCode)
+
+
+def compute_1_farm(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_on_farm(data, 1)
+
+
+def compute_2_farm(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_on_farm(data, 5)
+
+
 if __name__ == "__main__":
     exit(Day5().main())
@@ -107,6 +107,11 @@ def find_closest_neighbor(input_lines: List[str]) -> int:
 
 
 class Day6(AOCProblem):
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_alternate_1("sum_of_paths", sum_of_paths)
+        self.add_alternate_2("find_closest_neighbor", find_closest_neighbor)
+
     def compute_1(self, input_lines: List[str]) -> int:
         tree = parse_tree(input_lines)
         num_orbits = dfs_count_orbits("COM", tree, 0)
@@ -178,7 +183,4 @@ def test_2(input_lines: List[str], expected: int) -> None:
 
 
 if __name__ == "__main__":
-    day6 = Day6()
-    day6.add_alternate_1("sum_of_paths", sum_of_paths)
-    day6.add_alternate_2("find_closest_neighbor", find_closest_neighbor)
-    exit(day6.main())
+    exit(Day6().main())
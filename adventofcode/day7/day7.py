@@ -1,6 +1,8 @@
 import asyncio
 import copy
+import functools
 import itertools
+import os
 from typing import Any
 from typing import Coroutine
 from typing import Generator
@@ -10,8 +12,28 @@ from typing import Optional
 
 import pytest
 from AOCProblem import AOCProblem
+from IntCode import copy_factory
 from IntCode import IntCode
+from IntCode import IntCodeCore
+from IntCodeBatch import run_amplifiers_batch
+from IntCodeCompiler import CompiledIntCode
 from IntCodeGen import IntCodeGen
+from IntCodeScheduler import Scheduler
+from PermutationSearch import PermutationSearch
+from Pipeline import Pipeline
+from ProgramCache import parse_program
+from ProgramImage import ImageIntCode
+from ProgramImage import ProgramImage
+from RunCache import program_hash
+from RunCache import RunCache
+from VMFarm import VMFarm
+
+
+# (hits, misses) of solve_1_memoized's cache for each example of part 1, by
+# answer. Stage runs are shared by orderings with a common prefix, so there
+# are at most 5 + 20 + 60 + 120 + 120 = 325 misses out of 600 runs, fewer
+# when different prefixes lead to the same (phase, input signal).
+MEMOIZED_RUNS = {43210: (339, 261), 54321: (275, 325), 65210: (339, 261)}
 
 
 @pytest.mark.parametrize(
@@ -108,6 +130,18 @@ def test_1(data: List[int], expected: int) -> None:
     )
     assert result == expected
 
+    assert solve_1_batch([",".join(str(x) for x in data)]) == expected
+    assert solve_1_pipeline([",".join(str(x) for x in data)]) == expected
+    assert solve_1_compiled([",".join(str(x) for x in data)]) == expected
+    assert solve_1_image([",".join(str(x) for x in data)]) == expected
+    assert solve_1_scheduled([",".join(str(x) for x in data)]) == expected
+    assert solve_1_farm([",".join(str(x) for x in data)]) == expected
+    assert PermutationSearch(data, range(5)).search() == expected
+
+    cache = RunCache()
+    assert solve_1_memoized(data, cache) == expected
+    assert (cache.hits, cache.misses) == MEMOIZED_RUNS[expected]
+
 
 @pytest.mark.parametrize(
     ("data", "expected"),
@@ -163,6 +197,13 @@ def test_2(data: List[int], expected: int) -> None:
     )
     assert result == expected
 
+    assert solve_2_batch([",".join(str(x) for x in data)]) == expected
+    assert solve_2_pipeline([",".join(str(x) for x in data)]) == expected
+    assert solve_2_compiled([",".join(str(x) for x in data)]) == expected
+    assert solve_2_image([",".join(str(x) for x in data)]) == expected
+    assert solve_2_scheduled([",".join(str(x) for x in data)]) == expected
+    assert PermutationSearch(data, range(5, 10), True).search() == expected
+
 
 async def run_program_repeatedly(
     data: List[int], ordering: List[int], should_amplify: bool
@@ -220,9 +261,9 @@ def run_program_repeatedly_gen(
     ]
 
     # send the phase inputs
-    for gen in gens:
+    for gen, phase in zip(gens, ordering):
         next(gen)
-        gen.send(ordering.pop(0))
+        gen.send(phase)
 
     next_input = 0
     gens = itertools.cycle(gens) if should_amplify else gens
@@ -240,7 +281,7 @@ def run_program_repeatedly_gen(
 
 
 def solve_1_gen(input_lines: List[str]) -> int:
-    data = [int(x) for x in input_lines[0].split(",")]
+    data = parse_program(input_lines[0])
     return max(
         run_program_repeatedly_gen(data, list(ordering), False)
         for ordering in itertools.permutations(range(5))
@@ -248,25 +289,172 @@ def solve_1_gen(input_lines: List[str]) -> int:
 
 
 def solve_2_gen(input_lines: List[str]) -> int:
-    data = [int(x) for x in input_lines[0].split(",")]
+    data = parse_program(input_lines[0])
     return max(
         run_program_repeatedly_gen(data, list(ordering), True)
         for ordering in itertools.permutations(range(5, 10))
     )
 
 
+def solve_1_batch(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    orderings = list(itertools.permutations(range(5)))
+    return max(run_amplifiers_batch(data, orderings, False))
+
+
+def solve_2_batch(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    orderings = list(itertools.permutations(range(5, 10)))
+    return max(run_amplifiers_batch(data, orderings, True))
+
+
+def solve_1_pipeline(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    pipeline = Pipeline(copy_factory(data), 5)
+    return max(pipeline.run(ordering) for ordering in itertools.permutations(range(5)))
+
+
+def solve_1_memoized(data: List[int], cache: RunCache) -> int:
+    key = program_hash(data)
+    best = 0
+    for ordering in itertools.permutations(range(5)):
+        signal = 0
+        for phase in ordering:
+            signal = cache.run(data, (phase, signal), key)[-1]
+        best = max(best, signal)
+    return best
+
+
+def solve_1_cached(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return solve_1_memoized(data, RunCache())
+
+
+def solve_2_pipeline(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    pipeline = Pipeline(copy_factory(data), 5, ring=True)
+    return max(
+        pipeline.run(ordering) for ordering in itertools.permutations(range(5, 10))
+    )
+
+
+def solve_1_compiled(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    pipeline = Pipeline(copy_factory(data, CompiledIntCode), 5)
+    return max(pipeline.run(ordering) for ordering in itertools.permutations(range(5)))
+
+
+def solve_2_compiled(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    pipeline = Pipeline(copy_factory(data, CompiledIntCode), 5, ring=True)
+    return max(
+        pipeline.run(ordering) for ordering in itertools.permutations(range(5, 10))
+    )
+
+
+def solve_1_image(input_lines: List[str]) -> int:
+    # Every stage overlays its writes on one parsed image instead of a copy
+    image = ProgramImage.parse(input_lines[0])
+    pipeline = Pipeline(functools.partial(ImageIntCode, image), 5)
+    return max(pipeline.run(ordering) for ordering in itertools.permutations(range(5)))
+
+
+def solve_2_image(input_lines: List[str]) -> int:
+    image = ProgramImage.parse(input_lines[0])
+    pipeline = Pipeline(functools.partial(ImageIntCode, image), 5, ring=True)
+    return max(
+        pipeline.run(ordering) for ordering in itertools.permutations(range(5, 10))
+    )
+
+
+async def run_orderings_scheduled(
+    data: List[int], phases: Iterable[int], should_amplify: bool
+) -> int:
+    # Every ordering's amplifiers at once: 600 VMs taking turns in one loop
+    scheduler = Scheduler(queue_size=2)
+    last_stages = []
+    for ordering in itertools.permutations(phases):
+        queues = [scheduler.queue() for _ in ordering]
+        for queue, phase in zip(queues, ordering):
+            queue.put_nowait(phase)
+        queues[0].put_nowait(0)
+        if should_amplify:
+            queues.append(queues[0])
+        else:
+            queues.append(scheduler.queue())
+        for i in range(len(ordering)):
+            session = scheduler.spawn(IntCodeCore(data[:]), queues[i], queues[i + 1])
+        last_stages.append(session.program)
+    await scheduler.run()
+    return max(program.output for program in last_stages if program.output is not None)
+
+
+def solve_1_scheduled(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return asyncio.run(run_orderings_scheduled(data, range(5), False))
+
+
+def solve_2_scheduled(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return asyncio.run(run_orderings_scheduled(data, range(5, 10), True))
+
+
+def solve_1_farm(input_lines: List[str]) -> int:
+    # One batch of jobs per stage of the chain, across every ordering
+    data = parse_program(input_lines[0])
+    orderings = list(itertools.permutations(range(5)))
+    signals = [0] * len(orderings)
+    with VMFarm() as farm:
+        for stage in range(5):
+            phases = [ordering[stage] for ordering in orderings]
+            # Orderings with the same prefix ask for the same run
+            jobs = sorted(set(zip(phases, signals)))
+            results = farm.run_all((data, job) for job in jobs)
+            outputs = {job: result.outputs[-1] for job, result in zip(jobs, results)}
+            signals = [outputs[job] for job in zip(phases, signals)]
+    return max(signals)
+
+
+def solve_1_search(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return PermutationSearch(data, range(5)).search(os.cpu_count() or 1)
+
+
+def solve_2_search(input_lines: List[str]) -> int:
+    data = parse_program(input_lines[0])
+    return PermutationSearch(data, range(5, 10), True).search(os.cpu_count() or 1)
+
+
 class Day7(AOCProblem):
+    cache_program = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_alternate_1("generator", solve_1_gen)
+        self.add_alternate_2("generator", solve_2_gen)
+        self.add_alternate_1("batch", solve_1_batch)
+        self.add_alternate_2("batch", solve_2_batch)
+        self.add_alternate_1("pipeline", solve_1_pipeline)
+        self.add_alternate_2("pipeline", solve_2_pipeline)
+        self.add_alternate_1("memoized", solve_1_cached)
+        self.add_alternate_1("compiled", solve_1_compiled)
+        self.add_alternate_2("compiled", solve_2_compiled)
+        self.add_alternate_1("image", solve_1_image)
+        self.add_alternate_2("image", solve_2_image)
+        self.add_alternate_1("scheduler", solve_1_scheduled)
+        self.add_alternate_2("scheduler", solve_2_scheduled)
+        self.add_alternate_1("farm", solve_1_farm)
+        self.add_alternate_1("prefix search", solve_1_search)
+        self.add_alternate_2("prefix search", solve_2_search)
+
     def compute_1(self, input_lines: List[str]) -> int:
-        data = [int(x) for x in input_lines[0].split(",")]
+        data = parse_program(input_lines[0])
         return asyncio.run(solve_1(data))
 
     def compute_2(self, input_lines: List[str]) -> int:
-        data = [int(x) for x in input_lines[0].split(",")]
+        data = parse_program(input_lines[0])
         return asyncio.run(solve_2(data))
 
 
 if __name__ == "__main__":
-    day7 = Day7()
-    day7.add_alternate_1("generator", solve_1_gen)
-    day7.add_alternate_2("generator", solve_2_gen)
-    exit(day7.main())
+    exit(Day7().main())
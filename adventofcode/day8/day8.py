@@ -1,12 +1,23 @@
 import textwrap
 from collections import Counter
+from typing import Iterable
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 import pytest
 from AOCProblem import AOCProblem
 
 
 class Day8(AOCProblem):
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_streaming_1(
+            "streaming",
+            lambda chunks: solve_part_1_streaming(chunks, 25, 6),
+            chunked=True,
+        )
+
     def compute_1(self, input_lines: List[str]) -> int:
         return solve_part_1(input_lines[0], 25, 6)
 
@@ -29,6 +40,33 @@ def solve_part_1(image: str, width: int, height: int) -> int:
     return c["1"] * c["2"]
 
 
+def solve_part_1_streaming(chunks: Iterable[bytes], width: int, height: int) -> int:
+    """solve_part_1 on an image read in chunks of any size, one layer at a
+    time, without holding more than one chunk."""
+    layer_length = width * height
+    if layer_length <= 0:
+        raise ValueError("Invalid width and height")
+    fewest_zeros: Optional[Tuple[int, int]] = None
+    zeros = ones = twos = filled = 0
+    for chunk in chunks:
+        chunk = chunk.translate(None, b" \t\r\n")
+        position = 0
+        while position < len(chunk):
+            end = min(len(chunk), position + layer_length - filled)
+            zeros += chunk.count(b"0", position, end)
+            ones += chunk.count(b"1", position, end)
+            twos += chunk.count(b"2", position, end)
+            filled += end - position
+            position = end
+            if filled == layer_length:
+                if fewest_zeros is None or zeros < fewest_zeros[0]:
+                    fewest_zeros = (zeros, ones * twos)
+                zeros = ones = twos = filled = 0
+    if filled or fewest_zeros is None:
+        raise ValueError("Image is wrong size")
+    return fewest_zeros[1]
+
+
 @pytest.mark.parametrize(
     ("input_s", "width", "height", "expected"),
     (
@@ -40,6 +78,10 @@ def solve_part_1(image: str, width: int, height: int) -> int:
 )
 def test_1(input_s: str, width: int, height: int, expected: int) -> None:
     assert solve_part_1(input_s, width, height) == expected
+    # Chunks that split layers, and a trailing newline
+    data = (input_s + "\n").encode()
+    chunks = [data[i : i + 5] for i in range(0, len(data), 5)]
+    assert solve_part_1_streaming(chunks, width, height) == expected
 
 
 @pytest.mark.parametrize(
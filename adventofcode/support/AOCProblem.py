@@ -1,8 +1,23 @@
 import argparse
+import functools
+from typing import Any
 from typing import Callable
+from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
 
+import pytest
+from utils import format_bytes
+from utils import format_ns
+from utils import measure
+from utils import measure_memory
+from utils import MemoryStats
+from utils import Stats
+from utils import summarize
 from utils import timing
 
 
@@ -11,10 +26,49 @@ class AlternateSolution(NamedTuple):
     fn: Callable[[List[str]], int]
 
 
+class StreamingSolution(NamedTuple):
+    name: str
+    fn: Callable[[Iterator[Any]], int]
+    # Whether `fn` reads chunks of bytes rather than lines
+    chunked: bool
+
+
+# Bytes per chunk for streaming solutions that read chunks
+CHUNK_SIZE = 1 << 16
+
+
+def stream_lines(data_file: str) -> Iterator[str]:
+    """The lines of `data_file` without line endings, read as they're used."""
+    with open(data_file) as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def stream_chunks(data_file: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(data_file, "rb") as f:
+        yield from iter(lambda: f.read(chunk_size), b"")
+
+
+class SolutionTiming(NamedTuple):
+    part: int
+    name: str
+    answer: Any
+    # Nanoseconds per timed run
+    samples: List[int]
+    stats: Stats
+    # Answers that differ from the original solution's
+    wrong: List[str]
+
+
 class AOCProblem:
+    # IntCode days load their input through the on-disk program cache
+    cache_program = False
+
     def __init__(self) -> None:
         self._alternate_solutions_1: List[AlternateSolution] = []
         self._alternate_solutions_2: List[AlternateSolution] = []
+        self._streaming_solutions_1: List[StreamingSolution] = []
+        self._streaming_solutions_2: List[StreamingSolution] = []
 
     def compute_1(self, input_lines: List[str]) -> int:
         raise NotImplementedError("Part 1 not implemented!")
@@ -22,12 +76,43 @@ class AOCProblem:
     def compute_2(self, input_lines: List[str]) -> int:
         raise NotImplementedError("Part 2 not implemented!")
 
-    def parse_input(self) -> List[str]:
+    def parse_args(self, argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         parser = argparse.ArgumentParser()
         parser.add_argument("data_file")
-        args = parser.parse_args()
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="time every solution repeatedly and rank them",
+        )
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="also trace each solution's peak memory and allocation sites",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="only run the streaming solutions, reading the file as they go",
+        )
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--warmup", type=int, default=1)
+        args = parser.parse_args(argv)
+        if args.repeat < 1:
+            parser.error("--repeat must be at least 1")
+        if args.memory and args.benchmark:
+            parser.error("--memory can't be combined with --benchmark")
+        if args.stream and args.benchmark:
+            # --benchmark already times the streaming solutions on the lines
+            parser.error("--stream can't be combined with --benchmark")
+        return args
+
+    def parse_input(self, data_file: str) -> List[str]:
+        if self.cache_program:
+            # Imported here so that days without IntCode don't load the VM
+            from ProgramCache import load_lines
 
-        with open(args.data_file) as f:
+            return load_lines(data_file)
+        with open(data_file) as f:
             input_s = f.read()
         return input_s.splitlines()
 
@@ -37,20 +122,199 @@ class AOCProblem:
     def add_alternate_2(self, name: str, fn: Callable[[List[str]], int]) -> None:
         self._alternate_solutions_2.append(AlternateSolution(name, fn))
 
-    def main(self) -> int:
-        input_lines = self.parse_input()
-        with timing():
-            print(f"Part 1 (original): {self.compute_1(input_lines)}")
+    def add_streaming_1(
+        self, name: str, fn: Callable[[Iterator[Any]], int], chunked: bool = False
+    ) -> None:
+        """Add a part 1 solution that reads the input as it goes, from an
+        iterator of lines or, if `chunked`, of chunks of bytes."""
+        self._streaming_solutions_1.append(StreamingSolution(name, fn, chunked))
+
+    def add_streaming_2(
+        self, name: str, fn: Callable[[Iterator[Any]], int], chunked: bool = False
+    ) -> None:
+        self._streaming_solutions_2.append(StreamingSolution(name, fn, chunked))
 
-        for name, fn in self._alternate_solutions_1:
-            with timing():
-                print(f"Part 1 ({name}): {fn(input_lines)}")
+    def streaming_solutions(self, part: int) -> List[StreamingSolution]:
+        if part == 1:
+            return self._streaming_solutions_1
+        return self._streaming_solutions_2
 
-        with timing():
-            print(f"Part 2 (original): {self.compute_2(input_lines)}")
+    def stream_input(self, data_file: str, chunked: bool) -> Iterator[Any]:
+        if chunked:
+            return stream_chunks(data_file)
+        return stream_lines(data_file)
 
-        for name, fn in self._alternate_solutions_2:
-            with timing():
-                print(f"Part 2 ({name}): {fn(input_lines)}")
+    def run_streaming(self, solution: StreamingSolution, data_file: str) -> int:
+        return solution.fn(self.stream_input(data_file, solution.chunked))
+
+    def solutions(self, part: int) -> List[AlternateSolution]:
+        """The original solution to `part`, then its alternates, then its
+        streaming solutions reading from the lines already in memory."""
+        if part == 1:
+            original = AlternateSolution("original", self.compute_1)
+            alternates = self._alternate_solutions_1
+        else:
+            original = AlternateSolution("original", self.compute_2)
+            alternates = self._alternate_solutions_2
+        streaming = [
+            AlternateSolution(solution.name, functools.partial(_from_lines, solution))
+            for solution in self.streaming_solutions(part)
+        ]
+        return [original] + alternates + streaming
+
+    def main(self) -> int:
+        args = self.parse_args()
+        runs: Dict[int, List[Tuple[str, Callable[[], int]]]] = {}
+        if args.stream:
+            for part in (1, 2):
+                runs[part] = [
+                    (
+                        solution.name,
+                        functools.partial(self.run_streaming, solution, args.data_file),
+                    )
+                    for solution in self.streaming_solutions(part)
+                ]
+        else:
+            input_lines = self.parse_input(args.data_file)
+            if args.benchmark:
+                return self.benchmark(input_lines, args.repeat, args.warmup)
+            for part in (1, 2):
+                runs[part] = [
+                    (name, functools.partial(fn, input_lines))
+                    for name, fn in self.solutions(part)
+                ]
+
+        for part in (1, 2):
+            for name, run in runs[part]:
+                with timing():
+                    print(f"Part {part} ({name}): {run()}")
+                if args.memory:
+                    _, memory = measure_memory(run)
+                    print_memory(memory)
 
         return 0
+
+    def time_solutions(
+        self, input_lines: List[str], repeat: int, warmup: int
+    ) -> List[SolutionTiming]:
+        """Time every solution of both parts, checking their answers against
+        the original solution's first answer."""
+        timings = []
+        for part in (1, 2):
+            expected = None
+            for name, fn in self.solutions(part):
+                results, samples = measure(lambda: fn(input_lines), repeat, warmup)
+                if expected is None:
+                    expected = results[0]
+                wrong = sorted({str(x) for x in results if x != expected})
+                timings.append(
+                    SolutionTiming(
+                        part, name, results[0], samples, summarize(samples), wrong
+                    )
+                )
+        return timings
+
+    def benchmark(self, input_lines: List[str], repeat: int, warmup: int) -> int:
+        """Time every solution and print them ranked by median time.
+
+        Returns 1 if any solution gave a different answer from the original,
+        or different answers between runs.
+        """
+        timings = self.time_solutions(input_lines, repeat, warmup)
+        for part in (1, 2):
+            rows = [timing for timing in timings if timing.part == part]
+            print(f"Part {part}: {rows[0].answer}")
+            print_ranking(rows)
+        return 1 if any(timing.wrong for timing in timings) else 0
+
+
+def _from_lines(solution: StreamingSolution, input_lines: List[str]) -> int:
+    if solution.chunked:
+        text = "".join(line + "\n" for line in input_lines)
+        return solution.fn(iter([text.encode()]))
+    return solution.fn(iter(input_lines))
+
+
+def print_memory(memory: MemoryStats) -> None:
+    print(f"> peak {format_bytes(memory.peak)}, {memory.blocks:,} blocks")
+    for site in memory.top:
+        print(
+            f"    {format_bytes(site.size):>9}  {site.blocks:>9,} blocks  {site.site}"
+        )
+
+
+def print_ranking(rows: Sequence[SolutionTiming]) -> None:
+    ranked = sorted(rows, key=lambda row: row.stats.median)
+    best = ranked[0].stats.median
+    width = max(len(row.name) for row in ranked)
+    print(
+        f"  #  {'solution':<{width}}  {'min':>9}  {'median':>9}  {'p95':>9}"
+        f"  {'stddev':>9}  {'vs best':>7}"
+    )
+    for rank, row in enumerate(ranked, 1):
+        stats = row.stats
+        line = (
+            f"{rank:>3}  {row.name:<{width}}  {format_ns(stats.min):>9}"
+            f"  {format_ns(stats.median):>9}  {format_ns(stats.p95):>9}"
+            f"  {format_ns(stats.stddev):>9}  {stats.median / best:>6.2f}x"
+        )
+        if row.wrong:
+            line += f"  WRONG: {', '.join(row.wrong)}"
+        print(line)
+
+
+class _Example(AOCProblem):
+    def compute_1(self, input_lines: List[str]) -> int:
+        return len(input_lines)
+
+    def compute_2(self, input_lines: List[str]) -> int:
+        return sum(int(line) for line in input_lines)
+
+
+def test_benchmark(capsys: Any) -> None:
+    problem = _Example()
+    problem.add_alternate_1("also length", lambda lines: len(lines))
+    assert problem.benchmark(["1", "2"], repeat=3, warmup=1) == 0
+    out = capsys.readouterr().out
+    assert "Part 1: 2" in out and "Part 2: 3" in out
+    assert "also length" in out and "WRONG" not in out
+
+    problem.add_alternate_2("off by one", lambda lines: 4)
+    assert problem.benchmark(["1", "2"], repeat=2, warmup=0) == 1
+    assert "off by one" in capsys.readouterr().out.split("WRONG: 4")[0]
+
+
+def test_parse_args() -> None:
+    problem = _Example()
+    args = problem.parse_args(["input.txt", "--benchmark", "--repeat", "3"])
+    assert args.benchmark and args.repeat == 3
+    with pytest.raises(SystemExit):
+        problem.parse_args(["input.txt", "--benchmark", "--repeat", "0"])
+    with pytest.raises(SystemExit):
+        problem.parse_args(["input.txt", "--benchmark", "--memory"])
+    with pytest.raises(SystemExit):
+        problem.parse_args(["input.txt", "--benchmark", "--stream"])
+
+
+def test_streaming(tmp_path: Any) -> None:
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"1\r\n2\n3\n")
+    assert list(stream_lines(str(path))) == ["1", "2", "3"]
+    assert list(stream_chunks(str(path), 4)) == [b"1\r\n2", b"\n3\n"]
+
+    problem = _Example()
+    problem.add_streaming_2("summing", lambda lines: sum(int(line) for line in lines))
+    problem.add_streaming_2(
+        "lines", lambda chunks: sum(c.count(b"\n") for c in chunks), True
+    )
+    # Streaming solutions run on the loaded lines too, and are checked: the
+    # line count is wrong
+    assert [name for name, _ in problem.solutions(2)] == [
+        "original",
+        "summing",
+        "lines",
+    ]
+    assert problem.benchmark(["1", "2", "3"], repeat=1, warmup=0) == 1
+    summing, lines = problem.streaming_solutions(2)
+    assert problem.run_streaming(summing, str(path)) == 6
+    assert problem.run_streaming(lines, str(path)) == 3
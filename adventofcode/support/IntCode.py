@@ -1,10 +1,24 @@
 import asyncio
-import copy
+import functools
+import time
+from collections import deque
 from enum import Enum
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Type
+from typing import TYPE_CHECKING
 
 import pytest
 
+if TYPE_CHECKING:
+    from IntCodeProfile import Profile
+
 # from typing import Callable
 
 
@@ -29,30 +43,339 @@ class ParameterMode(Enum):
     IMMEDIATE = 1
 
 
-class IntCode:
+class Status(Enum):
+    """Why `IntCodeCore.run` handed control back to its caller."""
+
+    HALTED = 0
+    NEEDS_INPUT = 1
+    OUTPUT = 2
+    # Only returned by `run_for`
+    PAUSED = 3
+
+
+INSTRUCTION_SIZES = {
+    OpCode.ADD: 4,
+    OpCode.MULTIPLY: 4,
+    OpCode.SAVE: 2,
+    OpCode.OUTPUT: 2,
+    OpCode.JUMP_IF: 3,
+    OpCode.JUMP_IF_NOT: 3,
+    OpCode.LESS_THAN: 4,
+    OpCode.EQUALS: 4,
+    OpCode.TERM: 1,
+}
+
+
+class Instruction(NamedTuple):
+    """A decoded instruction.
+
+    `op_code` is the raw opcode value (so the run loop can compare plain ints),
+    `immediate1`/`immediate2` are the parameter mode flags of the first two
+    parameters (the third parameter is always a write address) and `size` is
+    the offset of the next instruction.
+    """
+
+    op_code: int
+    immediate1: bool
+    immediate2: bool
+    size: int
+
+
+@functools.lru_cache(maxsize=None)
+def decode(value: int) -> Instruction:
+    op_code = OpCode(value % 100)
+    modes = [ParameterMode(value // 10 ** (1 + index) % 10) for index in (1, 2)]
+    return Instruction(
+        op_code.value,
+        modes[0] == ParameterMode.IMMEDIATE,
+        modes[1] == ParameterMode.IMMEDIATE,
+        INSTRUCTION_SIZES[op_code],
+    )
+
+
+class DecodedProgram:
+    """Cache of decoded instructions, indexed by address.
+
+    Instructions are decoded the first time they are executed. Only the opcode
+    cell determines an entry (parameters are always read from memory), so an
+    entry only needs to be dropped when a write lands on that cell.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.table: List[Optional[Instruction]] = [None] * size
+
+    def fetch(self, data: List[int], position: int) -> Instruction:
+        instruction = self.table[position]
+        if instruction is None:
+            instruction = self.table[position] = decode(data[position])
+        return instruction
+
+    def invalidate(self, address: int) -> None:
+        if self.table[address] is not None:
+            self.table[address] = None
+
+
+def write_journaled(
+    data: List[int],
+    journal: Dict[int, int],
+    table: List[Optional[Instruction]],
+    address: int,
+    value: int,
+) -> None:
+    """Write `value` to `address`, recording the old value in `journal` and
+    dropping any decoded instruction there.
+
+    Shared by every interpreter loop, which pass in their VM's parts so as
+    not to look them up on each write.
+    """
+    if address not in journal:
+        journal[address] = data[address]
+    data[address] = value
+    if table[address] is not None:
+        table[address] = None
+
+
+def execute_arithmetic(
+    data: List[int],
+    journal: Dict[int, int],
+    table: List[Optional[Instruction]],
+    position: int,
+    op_code: int,
+    immediate1: bool,
+    immediate2: bool,
+) -> int:
+    """Execute the ADD, MULTIPLY, LESS_THAN or EQUALS at `position`, writing
+    as `write_journaled` does. Returns the address written."""
+    value1 = data[position + 1]
+    if not immediate1:
+        value1 = data[value1]
+    value2 = data[position + 2]
+    if not immediate2:
+        value2 = data[value2]
+    if op_code == 1:
+        result = value1 + value2
+    elif op_code == 2:
+        result = value1 * value2
+    elif op_code == 7:
+        result = 1 if value1 < value2 else 0
+    else:
+        result = 1 if value1 == value2 else 0
+    write_position = data[position + 3]
+    if write_position not in journal:
+        journal[write_position] = data[write_position]
+    data[write_position] = result
+    if table[write_position] is not None:
+        table[write_position] = None
+    return write_position
+
+
+class IntCodeCore:
+    """Synchronous IntCode VM.
+
+    `run` executes until the program halts, produces an output (available in
+    `output`) or needs an input while `inputs` is empty. The asyncio, generator
+    and list front ends are thin adapters around this loop.
+
+    Memory is journaled: the first write to a cell after `snapshot` records
+    its previous value, so `restore` only undoes the cells that were touched.
+    A snapshot of the initial state is taken on construction. Writes from
+    outside the VM must go through `write` to be undone by `restore`.
+    """
+
+    def __init__(self, data: List[int]) -> None:
+        self.data = data
+        self.position = 0
+        self.finished = False
+        self.inputs: Deque[int] = deque()
+        self.output: Optional[int] = None
+        self.decoded = DecodedProgram(len(self.data))
+        self.journal: Dict[int, int] = {}
+        # Instructions executed by `run_for`; `run` doesn't count
+        self.steps = 0
+        # Set by IntCodeProfile.enable_profiling
+        self.profile: Optional["Profile"] = None
+        self.snapshot()
+
+    def snapshot(self) -> None:
+        self.journal.clear()
+        self._saved_state = (self.position, self.finished, tuple(self.inputs))
+
+    def restore(self) -> None:
+        data = self.data
+        invalidate = self.decoded.invalidate
+        for address, value in self.journal.items():
+            data[address] = value
+            invalidate(address)
+        self.journal.clear()
+        self.position, self.finished, inputs = self._saved_state
+        self.inputs.clear()
+        self.inputs.extend(inputs)
+        self.output = None
+
+    def write(self, address: int, value: int) -> None:
+        write_journaled(self.data, self.journal, self.decoded.table, address, value)
+
+    def clone(self) -> "IntCodeCore":
+        """An independent IntCodeCore in the same state, snapshotted there."""
+        program = IntCodeCore(self.data[:])
+        program.position = self.position
+        program.finished = self.finished
+        program.inputs.extend(self.inputs)
+        program.output = self.output
+        program.decoded.table[:] = self.decoded.table
+        program.snapshot()
+        return program
+
+    def current_operation(self) -> OpCode:
+        return OpCode(self.decoded.fetch(self.data, self.position).op_code)
+
+    def get_parameter(self, index: int) -> int:
+        instruction = self.decoded.fetch(self.data, self.position)
+        immediate = instruction.immediate1 if index == 1 else instruction.immediate2
+        if immediate:
+            return self.data[self.position + index]
+        return self.data[self.data[self.position + index]]
+
+    def run(self) -> Status:
+        data = self.data
+        inputs = self.inputs
+        journal = self.journal
+        table = self.decoded.table
+        fetch = self.decoded.fetch
+        arithmetic = execute_arithmetic
+        write = write_journaled
+        position = self.position
+        while True:
+            op_code, immediate1, immediate2, size = table[position] or fetch(
+                data, position
+            )
+            if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+                arithmetic(
+                    data, journal, table, position, op_code, immediate1, immediate2
+                )
+                position += 4
+            elif op_code == 5 or op_code == 6:
+                value = data[position + 1]
+                if not immediate1:
+                    value = data[value]
+                if (op_code == 5) == (value != 0):
+                    position = data[position + 2]
+                    if not immediate2:
+                        position = data[position]
+                else:
+                    position += 3
+            elif op_code == 3:
+                if not inputs:
+                    self.position = position
+                    return Status.NEEDS_INPUT
+                write(data, journal, table, data[position + 1], inputs.popleft())
+                position += 2
+            elif op_code == 4:
+                value = data[position + 1]
+                if not immediate1:
+                    value = data[value]
+                self.output = value
+                self.position = position + 2
+                return Status.OUTPUT
+            else:
+                # TERM is the only opcode left; decode() rejects anything else
+                self.position = position
+                self.finished = True
+                return Status.HALTED
+
+    def _write_watch(self) -> Tuple[Optional[bytearray], Callable[[int], None]]:
+        """Cells whose writes `run_for` reports, and the callback it reports
+        them to. Subclasses that cache anything derived from code watch it
+        here, so that they can share the budgeted loop."""
+        return None, _ignore_write
+
+    def run_for(self, max_steps: int) -> Status:
+        """`run`, but pause with PAUSED after `max_steps` instructions.
+
+        A separate loop, so that `run` doesn't pay for counting. Executed
+        instructions are added to `steps`; a SAVE that blocks isn't one.
+        """
+        data = self.data
+        inputs = self.inputs
+        journal = self.journal
+        table = self.decoded.table
+        fetch = self.decoded.fetch
+        arithmetic = execute_arithmetic
+        write = write_journaled
+        watched, on_watched_write = self._write_watch()
+        position = self.position
+        remaining = max_steps
+        try:
+            while True:
+                if remaining <= 0:
+                    self.position = position
+                    return Status.PAUSED
+                remaining -= 1
+                op_code, immediate1, immediate2, size = table[position] or fetch(
+                    data, position
+                )
+                if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+                    write_position = arithmetic(
+                        data, journal, table, position, op_code, immediate1, immediate2
+                    )
+                    if watched is not None and watched[write_position]:
+                        on_watched_write(write_position)
+                    position += 4
+                elif op_code == 5 or op_code == 6:
+                    value = data[position + 1]
+                    if not immediate1:
+                        value = data[value]
+                    if (op_code == 5) == (value != 0):
+                        position = data[position + 2]
+                        if not immediate2:
+                            position = data[position]
+                    else:
+                        position += 3
+                elif op_code == 3:
+                    if not inputs:
+                        remaining += 1
+                        self.position = position
+                        return Status.NEEDS_INPUT
+                    write_position = data[position + 1]
+                    write(data, journal, table, write_position, inputs.popleft())
+                    if watched is not None and watched[write_position]:
+                        on_watched_write(write_position)
+                    position += 2
+                elif op_code == 4:
+                    value = data[position + 1]
+                    if not immediate1:
+                        value = data[value]
+                    self.output = value
+                    self.position = position + 2
+                    return Status.OUTPUT
+                else:
+                    self.position = position
+                    self.finished = True
+                    return Status.HALTED
+        finally:
+            self.steps += max_steps - remaining
+
+
+def _ignore_write(address: int) -> None:
+    pass
+
+
+class IntCode(IntCodeCore):
+    """IntCode with asyncio queues for input and output"""
+
     def __init__(
         self,
         data: List[int],
         input_queue: "asyncio.Queue[int]" = None,
         output_queue: "asyncio.Queue[int]" = None,
     ) -> None:
-        self.data = data
-        self.original_data = copy.copy(self.data)
-        self.position = 0
-        self.finished = False
+        super().__init__(data)
         self.input_queue = input_queue
         self.output_queue = output_queue
 
-    def restore(self) -> None:
-        self.data = copy.copy(self.original_data)
-        self.position = 0
-        self.finished = False
-
     async def read_input(self) -> int:
         if not self.input_queue:
             raise NotImplementedError("No input queue")
-        result = await self.input_queue.get()
-        return result
         return await self.input_queue.get()
 
     async def write_output(self, value: int) -> None:
@@ -60,76 +383,64 @@ class IntCode:
             raise NotImplementedError("No output queue")
         await self.output_queue.put(value)
 
-    def current_operation(self) -> OpCode:
-        return OpCode(self.data[self.position] % 100)
-
-    def get_parameter(self, index: int) -> int:
-        param_mode = ParameterMode(self.data[self.position] // 10 ** (1 + index) % 10)
-        if param_mode == ParameterMode.POSITION:
-            return self.data[self.data[self.position + index]]
-        elif param_mode == ParameterMode.IMMEDIATE:
-            return self.data[self.position + index]
-        else:
-            raise NotImplementedError(param_mode)
-
     async def execute(self) -> int:
         while True:
-            op_code = self.current_operation()
-            if op_code == OpCode.ADD:
-                input1 = self.get_parameter(1)
-                input2 = self.get_parameter(2)
-                self.data[self.data[self.position + 3]] = input1 + input2
-                self.position += 4
-            elif op_code == OpCode.MULTIPLY:
-                input1 = self.get_parameter(1)
-                input2 = self.get_parameter(2)
-                self.data[self.data[self.position + 3]] = input1 * input2
-                self.position += 4
-            elif op_code == OpCode.SAVE:
+            status = self.run()
+            if status == Status.NEEDS_INPUT:
+                profile = self.profile
+                start = time.perf_counter_ns() if profile is not None else 0
                 try:
-                    user_input = await self.read_input()
+                    self.inputs.append(await self.read_input())
                 except NoInputException:
                     return -1
-
-                write_position = self.data[self.position + 1]
-                self.data[write_position] = user_input
-                self.position += 2
-            elif op_code == OpCode.OUTPUT:
-                value = self.get_parameter(1)
-                await self.write_output(value)
-                self.position += 2
-            elif op_code == OpCode.JUMP_IF:
-                value = self.get_parameter(1)
-                if value:
-                    new_position = self.get_parameter(2)
-                    self.position = new_position
-                else:
-                    self.position += 3
-            elif op_code == OpCode.JUMP_IF_NOT:
-                value = self.get_parameter(1)
-                if not value:
-                    new_position = self.get_parameter(2)
-                    self.position = new_position
-                else:
-                    self.position += 3
-            elif op_code == OpCode.LESS_THAN:
-                value1 = self.get_parameter(1)
-                value2 = self.get_parameter(2)
-                write_position = self.data[self.position + 3]
-                self.data[write_position] = 1 if value1 < value2 else 0
-                self.position += 4
-            elif op_code == OpCode.EQUALS:
-                value1 = self.get_parameter(1)
-                value2 = self.get_parameter(2)
-                write_position = self.data[self.position + 3]
-                self.data[write_position] = 1 if value1 == value2 else 0
-                self.position += 4
-            elif op_code == OpCode.TERM:
-                self.finished = True
-                break
+                if profile is not None:
+                    profile.blocked_ns += time.perf_counter_ns() - start
+            elif status == Status.OUTPUT:
+                assert self.output is not None
+                await self.write_output(self.output)
             else:
-                raise NotImplementedError(op_code)
-        return self.data[0]
+                return self.data[0]
+
+
+# Makes a new VM, ready to run from the start, every time it is called
+ProgramFactory = Callable[[], IntCodeCore]
+
+
+def _on_copy(program_class: Type[IntCodeCore], data: List[int]) -> IntCodeCore:
+    return program_class(data[:])
+
+
+def copy_factory(
+    data: List[int], program_class: Type[IntCodeCore] = IntCodeCore
+) -> ProgramFactory:
+    """Factory of `program_class` VMs, each on its own copy of `data`.
+
+    A partial rather than a closure, so that it pickles for process pools.
+    """
+    return functools.partial(_on_copy, program_class, data)
+
+
+def run_program(
+    data: List[int],
+    inputs: Iterable[int] = (),
+    program_class: Type[IntCodeCore] = IntCodeCore,
+) -> List[int]:
+    """Run `data` to completion on a fixed list of inputs and return all outputs.
+
+    Raises NoInputException if the program asks for more inputs than given.
+    """
+    program = program_class(data)
+    program.inputs.extend(inputs)
+    outputs = []
+    while True:
+        status = program.run()
+        if status == Status.OUTPUT:
+            assert program.output is not None
+            outputs.append(program.output)
+        elif status == Status.NEEDS_INPUT:
+            raise NoInputException()
+        else:
+            return outputs
 
 
 @pytest.mark.parametrize(
@@ -161,3 +472,56 @@ def test_full(input_s: str, expected: List[int]) -> None:
     program = IntCode(data)
     asyncio.run(program.execute())
     assert program.data == expected
+
+
+def test_self_modifying_write_invalidates_decoded_instruction() -> None:
+    # Loops over the ADD at 0 twice, then overwrites it with TERM and jumps back
+    data = [1001, 30, 1, 30, 1008, 30, 2, 31, 1005, 31, 14, 1105, 1, 0]
+    data += [1101, 99, 0, 0, 1105, 1, 0] + [0] * 11
+    program = IntCode(data)
+    assert asyncio.run(program.execute()) == 99
+    assert program.data[30] == 2
+    assert program.finished
+
+
+def test_restore_undoes_only_journaled_cells() -> None:
+    data = [1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50]
+    program = IntCodeCore(data)
+    program.run()
+    assert program.data[0] == 3500
+    assert sorted(program.journal) == [0, 3]
+    program.restore()
+    assert program.data == [1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50]
+    assert program.position == 0 and not program.finished
+
+    program.write(9, 0)
+    program.snapshot()
+    program.run()
+    program.restore()
+    assert program.data[9] == 0 and program.data[0] == 1
+    program.run()
+    assert program.data[0] == (0 + 40) * 50
+
+
+def test_run_program() -> None:
+    # outputs 1 if the input equals 8, else 0
+    data = [3, 9, 8, 9, 10, 9, 4, 9, 99, -1, 8]
+    assert run_program(data[:], [8]) == [1]
+    assert run_program(data[:], [7]) == [0]
+    with pytest.raises(NoInputException):
+        run_program(data[:])
+
+
+def test_run_for() -> None:
+    # Counts down from its input, then outputs 7
+    data = [3, 12, 1001, 12, -1, 12, 1005, 12, 2, 104, 7, 99, 0]
+    program = IntCodeCore(data)
+    assert program.run_for(10) == Status.NEEDS_INPUT
+    assert program.steps == 0
+    program.inputs.append(3)
+    assert program.run_for(4) == Status.PAUSED
+    assert program.steps == 4 and program.position == 6
+    assert program.run_for(100) == Status.OUTPUT
+    assert program.steps == 1 + 3 * 2 + 1
+    assert program.run_for(100) == Status.HALTED
+    assert program.steps == 9
@@ -0,0 +1,283 @@
+"""Static analysis of IntCode programs: what is code, and does it change?
+
+`analyze(data)` follows control flow from address 0 and builds the control
+flow graph of the instructions it can reach. A conditional jump with an
+immediate condition only gets the edge it always takes; any other gets both.
+A jump target read from a cell (position mode) is taken to be the value the
+cell has now.
+
+Every write target is known statically (there is no relative mode), so the
+analysis can tell:
+
+    code_writes      instructions that write to a cell of a reachable
+                     instruction (or to a reachable cell that isn't a valid
+                     instruction yet), i.e. self-modifying code
+    indirect_writes  instructions whose target operand is itself written,
+                     so where they write is only known at run time
+    indirect_jumps   jumps whose operands, or the cell they read their
+                     target from, are written, and jumps to a negative
+                     address: control can reach code the graph misses
+
+`Analysis.fast_path` names the backend to use: compiled blocks without the
+write watch (AnalyzedIntCode) when the program loops and provably never
+writes to its own code, watched compiled blocks when that can't be proved,
+and the interpreter for straight-line or self-modifying programs, which
+don't stay in compiled code long enough to pay for compiling it.
+
+The pass is a single walk over the reachable instructions, so it is cheap
+enough to run every time a program is loaded.
+"""
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Type
+
+from IntCode import decode
+from IntCode import IntCodeCore
+from IntCode import Status
+from IntCodeCompiler import CompiledIntCode
+
+
+class Analysis:
+    def __init__(self, size: int) -> None:
+        # 1 for each cell (opcode or operand) of a reachable instruction
+        self.code = bytearray(size)
+        self.instructions: List[int] = []
+        # Successors of each reachable instruction
+        self.edges: Dict[int, List[int]] = {}
+        # The cell each writing instruction writes to
+        self.writes: Dict[int, int] = {}
+        self.code_writes: List[int] = []
+        self.indirect_writes: List[int] = []
+        self.indirect_jumps: List[int] = []
+        # The cells each jump's choice of successors depends on
+        self.jump_cells: Dict[int, List[int]] = {}
+        # Reachable addresses that don't hold a whole valid instruction
+        self.invalid: List[int] = []
+
+    @property
+    def self_modifying(self) -> bool:
+        return bool(self.code_writes)
+
+    @property
+    def write_safe(self) -> bool:
+        """Whether the program provably never writes to its own code."""
+        return not self.code_writes and not self.indirect_jumps
+
+    def covers(self, address: int) -> bool:
+        """Whether the analysis still holds after a write to `address`.
+
+        Writes to code, to a cell a jump depends on (which can lead to code
+        the analysis never reached) or to an invalid instruction void it.
+        """
+        return not (
+            self.code[address]
+            or address in self.invalid
+            or any(address in cells for cells in self.jump_cells.values())
+        )
+
+    @property
+    def has_loops(self) -> bool:
+        return any(
+            target <= source
+            for source, targets in self.edges.items()
+            for target in targets
+        )
+
+    @property
+    def fast_path(self) -> str:
+        if not self.has_loops or self.self_modifying:
+            return "interpreted"
+        if not self.write_safe:
+            return "compiled"
+        return "unwatched"
+
+    def program_class(self) -> Type[IntCodeCore]:
+        return {
+            "interpreted": IntCodeCore,
+            "compiled": CompiledIntCode,
+            "unwatched": AnalyzedIntCode,
+        }[self.fast_path]
+
+
+def analyze(data: Sequence[int]) -> Analysis:
+    size = len(data)
+    analysis = Analysis(size)
+    code = analysis.code
+    edges = analysis.edges
+    writes = analysis.writes
+    jump_cells = analysis.jump_cells
+    # Where each writing instruction keeps its target
+    target_cells: Dict[int, int] = {}
+    invalid = set()
+    work = [0]
+    while work:
+        position = work.pop()
+        if position in edges or position in invalid:
+            continue
+        try:
+            op_code, immediate1, immediate2, length = decode(data[position])
+        except ValueError:
+            invalid.add(position)
+            continue
+        if position + length > size:
+            invalid.add(position)
+            continue
+        code[position : position + length] = b"\x01" * length
+        if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+            target_cells[position] = position + 3
+            successors = [position + 4]
+        elif op_code == 3:
+            target_cells[position] = position + 1
+            successors = [position + 2]
+        elif op_code == 4:
+            successors = [position + 2]
+        elif op_code == 5 or op_code == 6:
+            successors = [position + 3]
+            cells = jump_cells[position] = [position + 2]
+            if immediate1:
+                cells.append(position + 1)
+            target = data[position + 2]
+            if not immediate2:
+                cells.append(target)
+                target = data[target] if 0 <= target < size else -1
+            if target < 0:
+                analysis.indirect_jumps.append(position)
+            elif not immediate1:
+                successors.append(target)
+            elif (op_code == 5) == (data[position + 1] != 0):
+                successors = [target]
+        else:
+            successors = []
+        edges[position] = successors
+        work.extend(address for address in successors if 0 <= address < size)
+
+    for position, cell in target_cells.items():
+        target = data[cell]
+        # Negative addresses wrap around, as they do when the VM runs
+        writes[position] = target + size if -size <= target < 0 else target
+    written = set(writes.values())
+    analysis.instructions = sorted(edges)
+    analysis.invalid = sorted(invalid)
+    analysis.code_writes = [
+        position
+        for position, target in sorted(writes.items())
+        if 0 <= target < size and (code[target] or target in invalid)
+    ]
+    analysis.indirect_writes = [
+        position for position, cell in sorted(target_cells.items()) if cell in written
+    ]
+    analysis.indirect_jumps += [
+        position
+        for position, cells in jump_cells.items()
+        if any(cell in written for cell in cells)
+    ]
+    analysis.indirect_jumps.sort()
+    return analysis
+
+
+class AnalyzedIntCode(CompiledIntCode):
+    """CompiledIntCode that leaves the write watch out of its blocks when
+    `analyze` shows the program never writes to its own code.
+
+    Writing from outside (`write`) to a cell the analysis doesn't cover
+    voids it, and the VM goes back to watching its writes.
+    """
+
+    def __init__(self, data: List[int]) -> None:
+        super().__init__(data)
+        self.analysis = analyze(data)
+        self.watch_writes = not self.analysis.write_safe
+
+    def write(self, address: int, value: int) -> None:
+        if not self.watch_writes and not self.analysis.covers(address):
+            self.watch_writes = True
+            self.discard_blocks()
+        super().write(address, value)
+
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+
+def test_loop() -> None:
+    analysis = analyze(SUM_LOOP)
+    assert analysis.instructions == [0, 2, 6, 10, 13, 15]
+    assert analysis.edges[10] == [13, 2]
+    assert analysis.writes == {0: 20, 2: 21, 6: 20}
+    assert list(analysis.code) == [1] * 16 + [0] * 6
+    assert analysis.write_safe and analysis.has_loops
+    assert analysis.fast_path == "unwatched"
+    assert analysis.program_class() is AnalyzedIntCode
+
+    program = AnalyzedIntCode(SUM_LOOP[:])
+    assert not program.watch_writes
+    program.inputs.append(100)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 5050
+
+
+def test_constant_condition() -> None:
+    # Always jumps over the garbage at 3
+    analysis = analyze([1105, 1, 4, 12345, 99])
+    assert analysis.instructions == [0, 4]
+    assert analysis.invalid == []
+    assert analysis.fast_path == "interpreted"
+
+
+def test_self_modifying() -> None:
+    # The input becomes the target of the ADD
+    data = [3, 5, 1101, 1, 2, 7, 99, 0]
+    analysis = analyze(data)
+    assert analysis.code_writes == [0]
+    assert analysis.indirect_writes == [2]
+    assert not analysis.write_safe
+    assert analysis.fast_path == "interpreted"
+
+    # Code built at run time: the ADD writes the instruction at 4
+    analysis = analyze([1101, 1, 98, 4, 0])
+    assert analysis.invalid == [4]
+    assert analysis.code_writes == [0]
+
+
+def test_indirect_jump() -> None:
+    # The input is stored where the JUMP_IF_NOT reads its target from
+    data = [3, 8, 6, 9, 8, 99, 0, 0, 0, 5]
+    analysis = analyze(data)
+    assert analysis.indirect_jumps == [2]
+    assert analysis.code_writes == []
+    assert analysis.fast_path == "compiled"
+
+
+def test_outside_write_to_code_restores_the_watch() -> None:
+    program = AnalyzedIntCode(SUM_LOOP[:])
+    program.inputs.append(3)
+    assert program.run() == Status.OUTPUT
+    assert program.blocks
+    # Subtract 0 instead of 1 and only loop while the counter is 0
+    program.restore()
+    program.write(8, 0)
+    assert program.watch_writes and not program.blocks
+    program.write(10, 1006)
+    program.inputs.append(3)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 3
+
+
+def test_outside_write_to_a_jump_cell_restores_the_watch() -> None:
+    # The JUMP_IF at 0 reads its target from 60, which sends it to the TERM
+    # at 4. Retargeted to 10, it reaches a loop the analysis never saw that
+    # outputs cell 30, 31, ... by incrementing the ADD's operand at 11.
+    data = [105, 1, 60, 0, 99] + [0] * 5
+    data += [1001, 30, 0, 40, 1001, 11, 1, 11, 4, 40, 1105, 1, 10] + [0] * 7
+    data += [100, 200, 300, 400, 500] + [0] * 25 + [4]
+    assert analyze(data).write_safe
+    for program_class in (IntCodeCore, AnalyzedIntCode):
+        program = program_class(data[:])
+        program.write(60, 10)
+        outputs = []
+        for _ in range(4):
+            assert program.run() == Status.OUTPUT
+            outputs.append(program.output)
+        assert outputs == [100, 200, 300, 400]
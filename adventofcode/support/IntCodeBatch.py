@@ -0,0 +1,272 @@
+"""Run many copies of one IntCode program in lockstep.
+
+Memory is held as one row per address with a column per copy ("lane"), so
+`memory[address][lane]` is the cell of one copy. Lanes are grouped by program
+counter; each step decodes the instruction once for the whole group and
+applies it to every lane in the group with list comprehensions. Lanes whose
+jumps disagree are split into separate groups and merged back as soon as
+their program counters agree again.
+"""
+from collections import deque
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import pytest
+from IntCode import decode
+from IntCode import NoInputException
+from IntCode import Instruction
+from IntCode import run_program
+
+
+def merge_groups(groups: Dict[int, List[int]], new: Dict[int, List[int]]) -> None:
+    """Add `new` lanes to `groups`, keeping every group's lanes in order.
+
+    A group holding every lane in order lets a step use whole rows as is.
+    """
+    for position, lanes in new.items():
+        existing = groups.get(position)
+        if existing is None:
+            groups[position] = lanes
+        else:
+            existing.extend(lanes)
+            existing.sort()
+
+
+class IntCodeBatch:
+    def __init__(self, data: List[int], count: int) -> None:
+        self.count = count
+        self.memory: List[List[int]] = [[value] * count for value in data]
+        self.positions = [0] * count
+        self.finished = [False] * count
+        self.inputs: List[Deque[int]] = [deque() for _ in range(count)]
+        self.outputs: List[Deque[int]] = [deque() for _ in range(count)]
+        # Instructions are keyed by the opcode value, which fully determines
+        # them, so self-modifying writes never invalidate an entry
+        self._decoded: Dict[int, Instruction] = {}
+        # Group steps and lane steps taken; their ratio is the average
+        # number of lanes that advanced together
+        self.steps = 0
+        self.lane_steps = 0
+
+    def write(self, address: int, values: Sequence[int]) -> None:
+        """Set `address` in every lane, one value per lane."""
+        self.memory[address] = list(values)
+
+    def read(self, address: int) -> List[int]:
+        return list(self.memory[address])
+
+    def lane(self, lane: int) -> List[int]:
+        return [row[lane] for row in self.memory]
+
+    def run(self) -> None:
+        """Run every lane until it halts or needs an input it doesn't have."""
+        groups: Dict[int, List[int]] = {}
+        for lane in range(self.count):
+            if not self.finished[lane]:
+                groups.setdefault(self.positions[lane], []).append(lane)
+        while groups:
+            next_groups: Dict[int, List[int]] = {}
+            for position, lanes in groups.items():
+                merge_groups(next_groups, self._step(position, lanes))
+            groups = next_groups
+
+    def _step(self, position: int, lanes: List[int]) -> Dict[int, List[int]]:
+        """Execute the instruction at `position` for `lanes`.
+
+        Returns the lanes that can keep running, grouped by new position.
+        """
+        memory = self.memory
+        op_row = memory[position]
+        op_value = op_row[lanes[0]]
+        if any(op_row[lane] != op_value for lane in lanes):
+            # The code was modified differently per lane: step each variant
+            variants: Dict[int, List[int]] = {}
+            for lane in lanes:
+                variants.setdefault(op_row[lane], []).append(lane)
+            result: Dict[int, List[int]] = {}
+            for variant in variants.values():
+                merge_groups(result, self._step(position, variant))
+            return result
+
+        instruction = self._decoded.get(op_value)
+        if instruction is None:
+            instruction = self._decoded[op_value] = decode(op_value)
+        op_code, immediate1, immediate2, size = instruction
+        self.steps += 1
+        self.lane_steps += len(lanes)
+
+        if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+            values1 = self._operand(lanes, position + 1, immediate1)
+            values2 = self._operand(lanes, position + 2, immediate2)
+            if op_code == 1:
+                results = [a + b for a, b in zip(values1, values2)]
+            elif op_code == 2:
+                results = [a * b for a, b in zip(values1, values2)]
+            elif op_code == 7:
+                results = [int(a < b) for a, b in zip(values1, values2)]
+            else:
+                results = [int(a == b) for a, b in zip(values1, values2)]
+            self._store(lanes, position + 3, results)
+            return {position + 4: lanes}
+        elif op_code == 5 or op_code == 6:
+            values = self._operand(lanes, position + 1, immediate1)
+            targets = self._operand(lanes, position + 2, immediate2)
+            jump_if = op_code == 5
+            result = {}
+            for lane, value, target in zip(lanes, values, targets):
+                new_position = target if jump_if == (value != 0) else position + 3
+                result.setdefault(new_position, []).append(lane)
+            return result
+        elif op_code == 3:
+            ready = [lane for lane in lanes if self.inputs[lane]]
+            for lane in lanes:
+                if not self.inputs[lane]:
+                    # Blocked: parked until more input arrives and run() is
+                    # called again
+                    self.positions[lane] = position
+            if not ready:
+                return {}
+            self._store(
+                ready, position + 1, [self.inputs[lane].popleft() for lane in ready]
+            )
+            return {position + 2: ready}
+        elif op_code == 4:
+            values = self._operand(lanes, position + 1, immediate1)
+            for lane, value in zip(lanes, values):
+                self.outputs[lane].append(value)
+            return {position + 2: lanes}
+        else:
+            for lane in lanes:
+                self.positions[lane] = position
+                self.finished[lane] = True
+            return {}
+
+    def _operand(self, lanes: List[int], position: int, immediate: bool) -> List[int]:
+        memory = self.memory
+        row = memory[position]
+        if len(lanes) == self.count:
+            params = row
+        else:
+            params = [row[lane] for lane in lanes]
+        if immediate:
+            return params
+        first = params[0]
+        if all(param == first for param in params):
+            source = memory[first]
+            if params is row:
+                return list(source)
+            return [source[lane] for lane in lanes]
+        return [memory[param][lane] for param, lane in zip(params, lanes)]
+
+    def _store(self, lanes: List[int], position: int, values: List[int]) -> None:
+        memory = self.memory
+        row = memory[position]
+        targets = [row[lane] for lane in lanes]
+        first = targets[0]
+        if all(target == first for target in targets):
+            if len(lanes) == self.count:
+                memory[first] = values
+            else:
+                target_row = memory[first]
+                for lane, value in zip(lanes, values):
+                    target_row[lane] = value
+        else:
+            for target, lane, value in zip(targets, lanes, values):
+                memory[target][lane] = value
+
+
+def run_batch(data: List[int], inputs: Sequence[Sequence[int]]) -> List[List[int]]:
+    """Outputs of running `data` once per input list."""
+    batch = IntCodeBatch(data, len(inputs))
+    for lane, lane_inputs in enumerate(inputs):
+        batch.inputs[lane].extend(lane_inputs)
+    batch.run()
+    return [list(outputs) for outputs in batch.outputs]
+
+
+def run_amplifiers_batch(
+    data: List[int], orderings: List[Tuple[int, ...]], should_amplify: bool
+) -> List[int]:
+    """Final signal of a chain of amplifiers for every phase ordering.
+
+    Each amplifier runs as one batch; lane i of every batch belongs to
+    orderings[i]. With `should_amplify` the last amplifier feeds the first.
+    """
+    count = len(orderings)
+    amplifiers = [IntCodeBatch(data, count) for _ in orderings[0]]
+    for lane, ordering in enumerate(orderings):
+        for amplifier, phase in zip(amplifiers, ordering):
+            amplifier.inputs[lane].append(phase)
+        amplifiers[0].inputs[lane].append(0)
+
+    last_outputs = [0] * count
+    while not all(amplifiers[-1].finished):
+        steps = sum(amplifier.steps for amplifier in amplifiers)
+        for index, amplifier in enumerate(amplifiers):
+            amplifier.run()
+            if index + 1 < len(amplifiers):
+                next_amplifier: Optional[IntCodeBatch] = amplifiers[index + 1]
+            else:
+                next_amplifier = amplifiers[0] if should_amplify else None
+            for lane, outputs in enumerate(amplifier.outputs):
+                if outputs and index + 1 == len(amplifiers):
+                    last_outputs[lane] = outputs[-1]
+                if next_amplifier is not None:
+                    next_amplifier.inputs[lane].extend(outputs)
+                outputs.clear()
+        if steps == sum(amplifier.steps for amplifier in amplifiers):
+            # Every lane is blocked on an input that will never come
+            raise NoInputException()
+    return last_outputs
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        # outputs 1 if the input equals 8, else 0
+        [3, 9, 8, 9, 10, 9, 4, 9, 99, -1, 8],
+        # 999 below 8, 1000 at 8, 1001 above: lanes branch apart
+        [3, 21, 1008, 21, 8, 20, 1005, 20, 22, 107, 8, 21, 20, 1006, 20, 31]
+        + [1106, 0, 36, 98, 0, 0, 1002, 21, 125, 20, 4, 20, 1105, 1, 46, 104]
+        + [999, 1105, 1, 46, 1101, 1000, 1, 20, 4, 20, 1105, 1, 46, 98, 99],
+        # Lanes split on input < 3, take separate jumps to 15 and merge there
+        [3, 30, 1007, 30, 3, 31, 1005, 31, 12, 1105, 1, 15, 1105, 1, 15]
+        + [1002, 30, 2, 32, 4, 32, 99]
+        + [0] * 11,
+    ),
+)
+def test_run_batch_matches_run_program(data: List[int]) -> None:
+    inputs = [[value] for value in (5, 0, 4, 1, 3, 2, 8, 9, 7, 6, 11, 10)]
+    expected = [run_program(data[:], lane_inputs) for lane_inputs in inputs]
+    assert run_batch(data, inputs) == expected
+
+
+def test_lanes_diverge_and_block() -> None:
+    # Reads twice, outputs the sum
+    data = [3, 11, 3, 12, 1, 11, 12, 13, 4, 13, 99, 0, 0, 0]
+    batch = IntCodeBatch(data, 3)
+    for lane in range(3):
+        batch.inputs[lane].append(lane)
+    batch.run()
+    assert not any(batch.finished)
+    assert batch.positions == [2, 2, 2]
+    batch.inputs[1].append(10)
+    batch.run()
+    assert batch.finished == [False, True, False]
+    assert [list(outputs) for outputs in batch.outputs] == [[], [11], []]
+    assert batch.lane(1)[13] == 11
+
+
+def test_self_modifying_lanes() -> None:
+    # Lane input is written over the opcode at 6: 99 halts, 104 outputs 7
+    data = [3, 6, 1105, 1, 6, 0, 99, 7, 99]
+    batch = IntCodeBatch(data, 2)
+    batch.inputs[0].append(99)
+    batch.inputs[1].append(104)
+    batch.run()
+    assert [list(outputs) for outputs in batch.outputs] == [[], [7]]
+    assert all(batch.finished)
@@ -0,0 +1,338 @@
+"""IntCode backend that compiles basic blocks to Python functions.
+
+A block starts wherever execution enters it and runs up to and including the
+next jump, stopping short of any input, output or halt instruction (those are
+left to the interpreter loop, which has to hand control back to the caller
+anyway). Each block becomes one Python function with its operand addresses
+and immediates baked in as constants, built with `compile()` and cached by
+source text (in a bounded LRU cache) so identical blocks are compiled once.
+
+Every cell of a compiled block is watched. A write that lands on a watched
+cell makes the block return right after the write; the blocks covering that
+cell are dropped and their start addresses are interpreted from then on.
+Blocks also clear the decoded instruction at each cell they write, as the
+interpreter does, so interpreted runs never execute a stale decode.
+
+`run_for` keeps the blocks but interprets, since its budget counts single
+instructions; its writes are checked against the watched cells like any
+other.
+"""
+import functools
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pytest
+from IntCode import decode
+from IntCode import execute_arithmetic
+from IntCode import Instruction
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from IntCode import write_journaled
+
+Block = Callable[
+    [List[int], Dict[int, int], bytearray, List[int], List[Optional[Instruction]]],
+    int,
+]
+
+_MISSING = object()
+# Compiled blocks kept for reuse, by source text, across every VM in the
+# process; the least recently used are dropped beyond this
+BLOCK_CACHE_SIZE = 4096
+
+
+def _operand(data: List[int], position: int, immediate: bool) -> str:
+    return str(data[position]) if immediate else f"data[{data[position]}]"
+
+
+def block_source(
+    data: List[int], start: int, watch: bool = True
+) -> Tuple[Optional[str], int]:
+    """Python source for the block at `start` and the end of its cells.
+
+    The source is None when the block would be empty. Without `watch` the
+    block doesn't check its writes against watched cells, which is only
+    safe if the program never writes to its own code.
+    """
+    lines = ["def block(data, journal, watched, dirty, table):"]
+    position = start
+    while True:
+        try:
+            op_code, immediate1, immediate2, size = decode(data[position])
+        except (IndexError, ValueError):
+            break
+        if op_code in (3, 4, 99) or position + size > len(data):
+            break
+        value1 = _operand(data, position + 1, immediate1)
+        value2 = _operand(data, position + 2, immediate2)
+        if op_code == 5 or op_code == 6:
+            condition = value1 if op_code == 5 else f"not {value1}"
+            lines += [
+                f"    if {condition}:",
+                f"        return {value2}",
+                f"    return {position + 3}",
+            ]
+            return "\n".join(lines), position + 3
+        if op_code == 1:
+            expression = f"{value1} + {value2}"
+        elif op_code == 2:
+            expression = f"{value1} * {value2}"
+        elif op_code == 7:
+            expression = f"1 if {value1} < {value2} else 0"
+        else:
+            expression = f"1 if {value1} == {value2} else 0"
+        target = data[position + 3]
+        position += 4
+        lines += [
+            f"    value = {expression}",
+            f"    if {target} not in journal:",
+            f"        journal[{target}] = data[{target}]",
+            f"    data[{target}] = value",
+            f"    table[{target}] = None",
+        ]
+        if watch:
+            lines += [
+                f"    if watched[{target}]:",
+                f"        dirty.append({target})",
+                f"        return {position}",
+            ]
+    if position == start:
+        return None, start
+    lines.append(f"    return {position}")
+    return "\n".join(lines), position
+
+
+@functools.lru_cache(maxsize=BLOCK_CACHE_SIZE)
+def compile_block(source: str) -> Block:
+    namespace: Dict[str, Block] = {}
+    exec(compile(source, "<intcode block>", "exec"), namespace)
+    return namespace["block"]
+
+
+class CompiledIntCode(IntCodeCore):
+    # Whether compiled blocks check their writes against watched cells
+    watch_writes = True
+    # mypy skips the IntCodeCore import, so it needs the type spelled out
+    position: int
+
+    def __init__(self, data: List[int]) -> None:
+        super().__init__(data)
+        # None marks a start address that is interpreted
+        self.blocks: Dict[int, Optional[Block]] = {}
+        self.watched = bytearray(len(data))
+        self._block_cells: Dict[int, range] = {}
+        self._cell_blocks: Dict[int, List[int]] = {}
+        self._dirty: List[int] = []
+
+    def restore(self) -> None:
+        self._invalidate([address for address in self.journal if self.watched[address]])
+        super().restore()
+
+    def write(self, address: int, value: int) -> None:
+        super().write(address, value)
+        if self.watched[address]:
+            self._invalidate([address])
+
+    def discard_blocks(self) -> None:
+        """Forget every compiled block, e.g. before running another loop."""
+        self.blocks.clear()
+        self.watched[:] = bytes(len(self.watched))
+        self._block_cells.clear()
+        self._cell_blocks.clear()
+
+    def _write_watch(self) -> Tuple[Optional[bytearray], Callable[[int], None]]:
+        # IntCodeCore.run_for, invalidating blocks its writes land on
+        return self.watched, self._invalidate_cell
+
+    def _invalidate_cell(self, address: int) -> None:
+        self._invalidate([address])
+
+    def _compile(self, start: int) -> Optional[Block]:
+        source, end = block_source(self.data, start, self.watch_writes)
+        if source is None:
+            self.blocks[start] = None
+            return None
+        block = self.blocks[start] = compile_block(source)
+        cells = self._block_cells[start] = range(start, end)
+        for cell in cells:
+            self._cell_blocks.setdefault(cell, []).append(start)
+            self.watched[cell] = 1
+        return block
+
+    def _invalidate(self, addresses: Iterable[int]) -> None:
+        for address in addresses:
+            for start in self._cell_blocks.pop(address, ()):
+                self.blocks[start] = None
+                for cell in self._block_cells.pop(start):
+                    starts = self._cell_blocks.get(cell)
+                    if starts is not None:
+                        starts.remove(start)
+                        if not starts:
+                            del self._cell_blocks[cell]
+                    if cell not in self._cell_blocks:
+                        self.watched[cell] = 0
+
+    def run(self) -> Status:
+        data = self.data
+        inputs = self.inputs
+        journal = self.journal
+        watched = self.watched
+        blocks = self.blocks
+        dirty = self._dirty
+        table = self.decoded.table
+        position = self.position
+        while True:
+            block = blocks.get(position, _MISSING)
+            if block is _MISSING:
+                block = self._compile(position)
+            if block is not None:
+                position = block(data, journal, watched, dirty, table)  # type: ignore
+                if dirty:
+                    self._invalidate(dirty)
+                    dirty.clear()
+                continue
+
+            op_code, immediate1, immediate2, size = decode(data[position])
+            if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+                write_position = execute_arithmetic(
+                    data, journal, table, position, op_code, immediate1, immediate2
+                )
+                if watched[write_position]:
+                    self._invalidate([write_position])
+                position += 4
+            elif op_code == 5 or op_code == 6:
+                value = data[position + 1]
+                if not immediate1:
+                    value = data[value]
+                if (op_code == 5) == (value != 0):
+                    position = data[position + 2]
+                    if not immediate2:
+                        position = data[position]
+                else:
+                    position += 3
+            elif op_code == 3:
+                if not inputs:
+                    self.position = position
+                    return Status.NEEDS_INPUT
+                write_position = data[position + 1]
+                write_journaled(data, journal, table, write_position, inputs.popleft())
+                if watched[write_position]:
+                    self._invalidate([write_position])
+                position += 2
+            elif op_code == 4:
+                value = data[position + 1]
+                if not immediate1:
+                    value = data[value]
+                self.output = value
+                self.position = position + 2
+                return Status.OUTPUT
+            else:
+                self.position = position
+                self.finished = True
+                return Status.HALTED
+
+
+@pytest.mark.parametrize(
+    ("input_s", "expected"),
+    (
+        ("1,9,10,3,2,3,11,0,99,30,40,50", 3500),
+        ("1,0,0,0,99", 2),
+        ("2,3,0,3,99", 2),
+        ("2,4,4,5,99,0", 2),
+        ("1,1,1,4,99,5,6,0,99", 30),
+    ),
+)
+def test_pos_0(input_s: str, expected: int) -> None:
+    data = [int(x) for x in input_s.split(",")]
+    program = CompiledIntCode(data)
+    program.run()
+    assert program.data[0] == expected
+
+
+def test_block_source() -> None:
+    source, end = block_source([1101, 1, 2, 5, 1006, 5, 0, 99], 0)
+    assert end == 7
+    assert source == "\n".join(
+        [
+            "def block(data, journal, watched, dirty, table):",
+            "    value = 1 + 2",
+            "    if 5 not in journal:",
+            "        journal[5] = data[5]",
+            "    data[5] = value",
+            "    table[5] = None",
+            "    if watched[5]:",
+            "        dirty.append(5)",
+            "        return 4",
+            "    if not data[5]:",
+            "        return 0",
+            "    return 7",
+        ]
+    )
+    assert block_source([3, 0, 99], 0) == (None, 0)
+    source, _ = block_source([1101, 1, 2, 5, 1006, 5, 0, 99], 0, watch=False)
+    assert source is not None and "watched[" not in source
+
+
+def test_self_modifying_write_invalidates_block() -> None:
+    # Loops over the ADD at 0 twice, then overwrites it with TERM and jumps back
+    data = [1001, 30, 1, 30, 1008, 30, 2, 31, 1005, 31, 14, 1105, 1, 0]
+    data += [1101, 99, 0, 0, 1105, 1, 0] + [0] * 11
+    program = CompiledIntCode(data)
+    assert program.run() == Status.HALTED
+    assert program.data[0] == 99
+    assert program.data[30] == 2
+    assert program.blocks[0] is None
+
+
+def test_write_ahead_in_same_block() -> None:
+    # The first ADD turns the second instruction into a MULTIPLY of 6 * 7
+    data = [1101, 0, 1102, 4, 1101, 6, 7, 13, 4, 13, 99, 0, 0, 0]
+    assert run_program(data[:], [], CompiledIntCode) == run_program(data[:]) == [42]
+
+
+def test_restore_drops_blocks_over_restored_cells() -> None:
+    # Outputs its input plus the constant at 4
+    data = [3, 3, 1101, 0, 0, 12, 4, 12, 99] + [0] * 4
+    program = CompiledIntCode(data)
+    program.write(4, 5)
+    program.inputs.append(1)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 6
+    # The block at 2 was compiled with 5 baked in
+    program.restore()
+    program.inputs.append(1)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 1
+
+
+def test_interpreted_runs_see_block_writes() -> None:
+    # The ADD at 6 overwrites the ADD at 0 with TERM, then jumps back to it
+    data = [1101, 0, 0, 20, 104, 1, 1101, 99, 0, 0, 104, 2, 1105, 1, 0]
+    data += [0] * 10
+    for program_class in (IntCodeCore, CompiledIntCode):
+        program = program_class(data[:])
+        program.run_for(1)
+        assert program.run() == Status.OUTPUT and program.output == 1
+        assert program.run() == Status.OUTPUT and program.output == 2
+        assert program.data[0] == 99
+        assert program.run_for(100) == Status.HALTED
+
+
+def test_run_for_keeps_blocks() -> None:
+    # Reads n, then outputs n + (n - 1) + ... + 1
+    data = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+    data += [0] * 6
+    program = CompiledIntCode(data)
+    program.inputs.append(10)
+    assert program.run() == Status.OUTPUT
+    blocks = dict(program.blocks)
+    assert any(blocks.values())
+    program.restore()
+    program.inputs.append(10)
+    while program.run_for(5) == Status.PAUSED:
+        assert program.blocks == blocks
+    assert program.output == 55
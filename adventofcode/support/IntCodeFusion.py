@@ -0,0 +1,433 @@
+"""IntCode VM that runs common instruction sequences as superinstructions.
+
+Programs like day5's diagnostic repeat a few short patterns. Profiling the
+day5 runs, the most frequent pairs are two arithmetic instructions in a row
+and a compare followed by a conditional jump on its result, and the most
+frequent triple is compare, arithmetic, jump on the compare's result. The
+FusedIntCode recognises these three patterns where execution first reaches
+them and from then on runs each as one handler: one dispatch instead of two
+or three, and the jump takes its condition from the compare's write without
+decoding its own operand.
+
+The intermediate writes are still made: memory is what the solutions read
+their answers from, and the journal has to see every write for `restore`.
+
+A pattern is only fused if none of its own writes land inside it. A write
+anywhere else that lands on a fused pattern (from the program, `write` or
+`restore`) unfuses it; it is matched again when execution next gets there.
+"""
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from IntCode import decode
+from IntCode import execute_arithmetic
+from IntCode import Instruction
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from IntCode import write_journaled
+
+# Two arithmetic or compare instructions
+ARITHMETIC_PAIR = 0
+# A compare, then a jump on its result
+COMPARE_JUMP = 1
+# A compare, an arithmetic instruction, then a jump on the compare's result
+COMPARE_ARITHMETIC_JUMP = 2
+
+# The longest pattern: 4 + 4 + 3 cells
+MAX_SIZE = 11
+
+# kind, size, the first two instructions' opcodes and modes (zeros for a
+# COMPARE_JUMP), then whether the jump is taken on a true condition and
+# whether its target is immediate (False for an ARITHMETIC_PAIR)
+Fused = Tuple[int, int, int, bool, bool, int, bool, bool, bool, bool]
+
+# Where no pattern starts: falsy, unlike a Fused, and unlike None not
+# matched again
+_NOT_FUSED = ()
+
+
+def _decode_at(data: List[int], position: int) -> Optional[Instruction]:
+    if not 0 <= position < len(data):
+        return None
+    try:
+        instruction = decode(data[position])
+    except ValueError:
+        return None
+    return instruction if position + instruction.size <= len(data) else None
+
+
+def _is_arithmetic(instruction: Optional[Instruction]) -> bool:
+    return instruction is not None and instruction.op_code in (1, 2, 7, 8)
+
+
+def _is_compare(instruction: Optional[Instruction]) -> bool:
+    return instruction is not None and instruction.op_code in (7, 8)
+
+
+def _is_jump_on(
+    data: List[int], position: int, instruction: Optional[Instruction], cell: int
+) -> bool:
+    return (
+        instruction is not None
+        and instruction.op_code in (5, 6)
+        and not instruction.immediate1
+        and data[position + 1] == cell
+    )
+
+
+def match(data: List[int], position: int) -> Optional[Fused]:
+    """The pattern starting at `position`, if there is one to fuse."""
+    first = _decode_at(data, position)
+    if not _is_arithmetic(first):
+        return None
+    assert first is not None
+    compared = data[position + 3]
+    second = _decode_at(data, position + 4)
+    third = _decode_at(data, position + 8)
+    if _is_compare(first) and _is_jump_on(data, position + 4, second, compared):
+        assert second is not None
+        kind, size, jump, second = COMPARE_JUMP, 7, second, None
+    elif _is_arithmetic(second):
+        assert second is not None
+        if (
+            _is_compare(first)
+            and _is_jump_on(data, position + 8, third, compared)
+            and data[position + 7] != compared
+        ):
+            kind, size, jump = COMPARE_ARITHMETIC_JUMP, 11, third
+        else:
+            kind, size, jump = ARITHMETIC_PAIR, 8, None
+    else:
+        return None
+    # Writes into the pattern itself would change it halfway through
+    targets = [data[position + 3]]
+    if second is not None:
+        targets.append(data[position + 7])
+    for target in targets:
+        # Negative addresses wrap around, as they do when the VM runs
+        if target < 0:
+            target += len(data)
+        if position <= target < position + size:
+            return None
+    return (
+        kind,
+        size,
+        first.op_code,
+        first.immediate1,
+        first.immediate2,
+        0 if second is None else second.op_code,
+        second is not None and second.immediate1,
+        second is not None and second.immediate2,
+        jump is not None and jump.op_code == 5,
+        jump is not None and jump.immediate2,
+    )
+
+
+class FusedIntCode(IntCodeCore):
+    # Declared for mypy, which doesn't follow the IntCodeCore import and
+    # can't infer the attribute from the run loops' own assignments
+    position: int
+
+    def __init__(self, data: List[int]) -> None:
+        super().__init__(data)
+        # Per address: None (not matched yet), _NOT_FUSED or a Fused
+        self.fused: List[Union[None, Tuple[()], Fused]] = [None] * len(data)
+        # How many fused patterns cover each cell
+        self.covered = bytearray(len(data))
+        # Dispatches saved by running patterns as one instruction
+        self.saved_dispatches = 0
+
+    def restore(self) -> None:
+        covered = self.covered
+        for address in self.journal:
+            if covered[address]:
+                self._unfuse(address)
+        super().restore()
+
+    def write(self, address: int, value: int) -> None:
+        super().write(address, value)
+        if self.covered[address]:
+            self._unfuse(address)
+
+    def discard_fusions(self) -> None:
+        self.fused[:] = [None] * len(self.fused)
+        self.covered[:] = bytes(len(self.covered))
+
+    def _write_watch(self) -> Tuple[Optional[bytearray], Callable[[int], None]]:
+        # IntCodeCore.run_for, unfusing patterns its writes land on. Budgets
+        # count instructions, so it runs patterns one instruction at a time,
+        # but they stay fused for the next `run`.
+        return self.covered, self._unfuse
+
+    def _fuse(self, position: int) -> Union[Tuple[()], Fused]:
+        fused = match(self.data, position)
+        if fused is None:
+            return _NOT_FUSED
+        covered = self.covered
+        for cell in range(position, position + fused[1]):
+            covered[cell] += 1
+        return fused
+
+    def _unfuse(self, address: int) -> None:
+        fused = self.fused
+        covered = self.covered
+        if address < 0:
+            address += len(fused)
+        for start in range(max(0, address - MAX_SIZE + 1), address + 1):
+            pattern = fused[start]
+            if pattern and start + pattern[1] > address:
+                fused[start] = None
+                for cell in range(start, start + pattern[1]):
+                    covered[cell] -= 1
+
+    def run(self) -> Status:
+        data = self.data
+        inputs = self.inputs
+        journal = self.journal
+        table = self.decoded.table
+        fetch = self.decoded.fetch
+        fused = self.fused
+        covered = self.covered
+        position = self.position
+        saved = 0
+        try:
+            while True:
+                pattern = fused[position]
+                if pattern is None:
+                    pattern = fused[position] = self._fuse(position)
+                if pattern:
+                    (
+                        kind,
+                        size,
+                        op_code,
+                        immediate1,
+                        immediate2,
+                        op_code2,
+                        immediate3,
+                        immediate4,
+                        jump_if,
+                        jump_immediate,
+                    ) = pattern  # type: ignore
+                    write_position = execute_arithmetic(
+                        data, journal, table, position, op_code, immediate1, immediate2
+                    )
+                    condition = data[write_position]
+                    if covered[write_position]:
+                        self._unfuse(write_position)
+
+                    if kind != COMPARE_JUMP:
+                        write_position = execute_arithmetic(
+                            data,
+                            journal,
+                            table,
+                            position + 4,
+                            op_code2,
+                            immediate3,
+                            immediate4,
+                        )
+                        if covered[write_position]:
+                            self._unfuse(write_position)
+                        if kind == ARITHMETIC_PAIR:
+                            position += 8
+                            saved += 1
+                            continue
+                        saved += 2
+                    else:
+                        saved += 1
+
+                    # The jump's condition is the compare's result
+                    if jump_if == (condition != 0):
+                        position = data[position + size - 1]
+                        if not jump_immediate:
+                            position = data[position]
+                    else:
+                        position += size
+                    continue
+
+                op_code, immediate1, immediate2, size = table[position] or fetch(
+                    data, position
+                )
+                if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+                    write_position = execute_arithmetic(
+                        data, journal, table, position, op_code, immediate1, immediate2
+                    )
+                    if covered[write_position]:
+                        self._unfuse(write_position)
+                    position += 4
+                elif op_code == 5 or op_code == 6:
+                    value = data[position + 1]
+                    if not immediate1:
+                        value = data[value]
+                    if (op_code == 5) == (value != 0):
+                        position = data[position + 2]
+                        if not immediate2:
+                            position = data[position]
+                    else:
+                        position += 3
+                elif op_code == 3:
+                    if not inputs:
+                        self.position = position
+                        return Status.NEEDS_INPUT
+                    write_position = data[position + 1]
+                    write_journaled(
+                        data, journal, table, write_position, inputs.popleft()
+                    )
+                    if covered[write_position]:
+                        self._unfuse(write_position)
+                    position += 2
+                elif op_code == 4:
+                    value = data[position + 1]
+                    if not immediate1:
+                        value = data[value]
+                    self.output = value
+                    self.position = position + 2
+                    return Status.OUTPUT
+                else:
+                    self.position = position
+                    self.finished = True
+                    return Status.HALTED
+        finally:
+            self.saved_dispatches += saved
+
+
+# Reads n, then outputs n + (n - 1) + ... + 1, with the loop test done by a
+# compare and jump
+COUNT_LOOP = [3, 30, 1, 31, 30, 31, 1001, 30, -1, 30, 1007, 30, 1, 32, 1006, 32, 2]
+COUNT_LOOP += [4, 31, 99] + [0] * 13
+
+
+def test_compare_jump() -> None:
+    program = FusedIntCode(COUNT_LOOP[:])
+    program.inputs.append(10)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 55 == run_program(COUNT_LOOP[:], [10])[0]
+    # Each pass runs the add and decrement, then the compare and jump
+    assert program.fused[2] == (
+        ARITHMETIC_PAIR,
+        8,
+        1,
+        False,
+        False,
+        1,
+        False,
+        True,
+        False,
+        False,
+    )
+    assert program.fused[10] == (
+        COMPARE_JUMP,
+        7,
+        7,
+        False,
+        True,
+        0,
+        False,
+        False,
+        False,
+        True,
+    )
+    assert program.saved_dispatches == 20
+    # Written by the compare, so still in memory
+    assert program.data[32] == 1
+
+
+def test_compare_arithmetic_jump() -> None:
+    # day5's pattern: compare, double a value, jump on the compare
+    data = [1107, 1, 2, 20, 1002, 21, 2, 21, 1005, 20, 13, 4, 21, 4, 21, 99]
+    data += [0] * 5 + [21]
+    assert match(data, 0) == (
+        COMPARE_ARITHMETIC_JUMP,
+        11,
+        7,
+        True,
+        True,
+        2,
+        False,
+        True,
+        True,
+        True,
+    )
+    assert run_program(data[:], [], FusedIntCode) == run_program(data[:]) == [42]
+
+
+def test_writes_into_a_pattern() -> None:
+    # Never fused: the first ADD writes the second
+    data = [1101, 0, 1102, 4, 1101, 6, 7, 13, 4, 13, 99, 0, 0, 0]
+    assert match(data, 0) is None
+    assert run_program(data[:], [], FusedIntCode) == run_program(data[:]) == [42]
+
+    # Stop when the counter gets to 2 instead of 1
+    program = FusedIntCode(COUNT_LOOP[:])
+    program.inputs.append(3)
+    program.run()
+    program.restore()
+    assert program.fused[10]
+    program.write(12, 2)
+    assert program.fused[10] is None
+    assert program.covered[12] == 0
+    program.inputs.append(3)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 5
+
+
+def test_restore_unfuses() -> None:
+    program = FusedIntCode(COUNT_LOOP[:])
+    program.write(10, 1008)
+    program.inputs.append(3)
+    program.run()
+    assert program.fused[10] == (
+        COMPARE_JUMP,
+        7,
+        8,
+        False,
+        True,
+        0,
+        False,
+        False,
+        False,
+        True,
+    )
+    program.restore()
+    assert program.fused[10] is None
+    program.inputs.append(3)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 6
+
+
+def test_run_for_keeps_fusions() -> None:
+    program = FusedIntCode(COUNT_LOOP[:])
+    program.inputs.append(10)
+    assert program.run() == Status.OUTPUT
+    fused = program.fused[:]
+    program.restore()
+    program.inputs.append(10)
+    status = Status.PAUSED
+    while status == Status.PAUSED:
+        status = program.run_for(7)
+    assert status == Status.OUTPUT and program.output == 55
+    assert program.fused == fused
+
+
+def test_run_for_unfuses() -> None:
+    # Outputs 1 + 1 + 20 + 3, forever. Given a non-zero input, the ADD at 9
+    # first turns the second ADD of the pair at 13 into a MULTIPLY.
+    data = [3, 40, 1005, 40, 9, 1105, 1, 13, 0, 1101, 0, 1102, 17]
+    data += [1101, 1, 1, 41, 1101, 20, 3, 42, 4, 42, 1101, 0, 0, 40, 1105, 1, 2]
+    data += [0] * 13
+    program = FusedIntCode(data)
+    program.inputs.append(0)
+    assert program.run() == Status.OUTPUT and program.output == 23
+    assert program.fused[13]
+    program.restore()
+    program.inputs.append(1)
+    status = Status.PAUSED
+    while status == Status.PAUSED:
+        status = program.run_for(3)
+    assert status == Status.OUTPUT and program.output == 60
+    # The next pass runs the pair fused again, as ADD then MULTIPLY
+    assert program.run() == Status.OUTPUT and program.output == 60
+    assert program.fused[13]
@@ -0,0 +1,82 @@
+import time
+from collections import deque
+from typing import Deque
+from typing import Generator
+from typing import List
+from typing import Optional
+
+import pytest
+from IntCode import IntCodeCore
+from IntCode import Status
+
+
+class IntCodeGen(IntCodeCore):
+    """IntCode as a generator"""
+
+    def __init__(self, data: List[int],) -> None:
+        super().__init__(data)
+        self.outputs: Deque[int] = deque()
+
+    def restore(self) -> None:
+        super().restore()
+        self.outputs.clear()
+
+    def read_input(self) -> Generator[Optional[int], int, int]:
+        if self.inputs:
+            result = self.inputs.popleft()
+        else:
+            output_value = self.outputs.popleft() if self.outputs else None
+            result = yield output_value
+        return result
+
+    def write_output(self, value: int) -> None:
+        self.outputs.append(value)
+
+    def execute(self) -> Generator[Optional[int], int, None]:
+        while True:
+            status = self.run()
+            if status == Status.NEEDS_INPUT:
+                profile = self.profile
+                start = time.perf_counter_ns() if profile is not None else 0
+                input_value = yield from self.read_input()
+                self.inputs.append(input_value)
+                if profile is not None:
+                    profile.blocked_ns += time.perf_counter_ns() - start
+            elif status == Status.OUTPUT:
+                assert self.output is not None
+                self.write_output(self.output)
+            else:
+                output_value = self.outputs[0] if self.outputs else -1
+                yield output_value
+                return
+
+
+@pytest.mark.parametrize(
+    ("input_s", "expected"),
+    (
+        ("1,9,10,3,2,3,11,0,99,30,40,50", 3500),
+        ("1,0,0,0,99", 2),
+        ("2,3,0,3,99", 2),
+        ("2,4,4,5,99,0", 2),
+        ("1,1,1,4,99,5,6,0,99", 30),
+    ),
+)
+def test_pos_0(input_s: str, expected: int) -> None:
+    data = [int(x) for x in input_s.split(",")]
+    program = IntCodeGen(data)
+    list(program.execute())
+    assert program.data[0] == expected
+
+
+@pytest.mark.parametrize(
+    ("input_s", "expected"),
+    (
+        ("1002,4,3,4,33", [1002, 4, 3, 4, 99]),
+        ("1101,100,-1,4,0", [1101, 100, -1, 4, 99]),
+    ),
+)
+def test_full(input_s: str, expected: List[int]) -> None:
+    data = [int(x) for x in input_s.split(",")]
+    program = IntCodeGen(data)
+    list(program.execute())
+    assert program.data == expected
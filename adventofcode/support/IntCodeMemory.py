@@ -0,0 +1,184 @@
+"""Compact IntCode memory: 64-bit cells with a sparse area past the program.
+
+A list of ints stores a pointer per cell plus a boxed int per distinct large
+value. CompactMemory keeps the program in an `array('q')` (8 bytes a cell,
+no boxing) and only switches that to a list of arbitrary precision ints the
+first time a value doesn't fit in 64 bits. Addresses past the end of the
+program live in a dict and read as 0 until written, so a program can use a
+large address space without preallocating it.
+
+Cell access goes through Python methods, so a CompactIntCode runs slower
+than the list backed VM; see bench/memory.py for the numbers.
+"""
+import copy
+from array import array
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import MutableSequence
+from typing import Optional
+from typing import Union
+
+import pytest
+from IntCode import Instruction
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+
+INT64_MAX = 2 ** 63 - 1
+
+
+class CompactMemory:
+    def __init__(self, values: Iterable[int]) -> None:
+        values = list(values)
+        self.cells: MutableSequence[int]
+        try:
+            self.cells = array("q", values)
+        except OverflowError:
+            self.cells = values
+        self.sparse: Dict[int, int] = {}
+
+    @property
+    def promoted(self) -> bool:
+        """Whether cells moved to arbitrary precision storage."""
+        return not isinstance(self.cells, array)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __getitem__(self, address: int) -> int:
+        try:
+            return self.cells[address]
+        except IndexError:
+            if address < 0:
+                raise
+            return self.sparse.get(address, 0)
+
+    def __setitem__(self, address: int, value: int) -> None:
+        try:
+            self.cells[address] = value
+        except IndexError:
+            if address < 0:
+                raise
+            if value:
+                self.sparse[address] = value
+            else:
+                self.sparse.pop(address, None)
+        except OverflowError:
+            self.cells = list(self.cells)
+            self.cells[address] = value
+
+    def __copy__(self) -> "CompactMemory":
+        memory = CompactMemory(())
+        memory.cells = self.cells[:]
+        memory.sparse = dict(self.sparse)
+        return memory
+
+    def tolist(self) -> List[int]:
+        """The program cells followed by the sparse area up to its last cell."""
+        values = list(self.cells)
+        if self.sparse:
+            values.extend([0] * (max(self.sparse) + 1 - len(values)))
+            for address, value in self.sparse.items():
+                values[address] = value
+        return values
+
+
+class _DecodedTable(List[Optional[Instruction]]):
+    """Decoded instruction table that reads None past the program's end.
+
+    Instructions in the sparse area are decoded again on every execution.
+    """
+
+    def __getitem__(self, index):  # type: ignore
+        try:
+            return super().__getitem__(index)
+        except IndexError:
+            return None
+
+    def __setitem__(self, index, value):  # type: ignore
+        try:
+            super().__setitem__(index, value)
+        except IndexError:
+            pass
+
+
+class CompactIntCode(IntCodeCore):
+    def __init__(self, data: Union[Iterable[int], CompactMemory]) -> None:
+        if not isinstance(data, CompactMemory):
+            data = CompactMemory(data)
+        super().__init__(data)  # type: ignore
+        self.decoded.table = _DecodedTable(self.decoded.table)
+
+    def clone(self) -> "CompactIntCode":
+        """An independent CompactIntCode in the same state, snapshotted there."""
+        program = CompactIntCode(copy.copy(self.data))  # type: ignore
+        program.position = self.position
+        program.finished = self.finished
+        program.inputs.extend(self.inputs)
+        program.output = self.output
+        program.decoded.table[:] = self.decoded.table
+        program.snapshot()
+        return program
+
+
+def test_cells_are_64_bit_until_overflow() -> None:
+    memory = CompactMemory([1, 2, INT64_MAX])
+    assert not memory.promoted
+    memory[0] = -INT64_MAX - 1
+    assert not memory.promoted
+    memory[1] = INT64_MAX + 1
+    assert memory.promoted
+    assert memory.tolist() == [-INT64_MAX - 1, INT64_MAX + 1, INT64_MAX]
+
+    assert CompactMemory([2 ** 64]).promoted
+
+
+def test_sparse_area() -> None:
+    memory = CompactMemory([1, 2])
+    assert memory[1_000_000] == 0
+    memory[1_000_000] = 5
+    memory[4] = 3
+    assert memory[1_000_000] == 5
+    assert len(memory) == 2
+    assert memory.sparse == {1_000_000: 5, 4: 3}
+    # Writing 0 back frees the cell
+    memory[1_000_000] = 0
+    assert memory.tolist() == [1, 2, 0, 0, 3]
+    with pytest.raises(IndexError):
+        memory[-3]
+
+
+@pytest.mark.parametrize(
+    ("input_s", "expected"),
+    (
+        ("1,9,10,3,2,3,11,0,99,30,40,50", 3500),
+        ("1,0,0,0,99", 2),
+        ("2,3,0,3,99", 2),
+        ("2,4,4,5,99,0", 2),
+        ("1,1,1,4,99,5,6,0,99", 30),
+    ),
+)
+def test_pos_0(input_s: str, expected: int) -> None:
+    program = CompactIntCode(int(x) for x in input_s.split(","))
+    program.run()
+    assert program.data[0] == expected
+
+
+def test_large_values_and_addresses() -> None:
+    # Squares its input twice into a cell far past the program, then outputs it
+    data = [3, 100, 2, 100, 100, 100, 2, 100, 100, 10_000, 4, 10_000, 99]
+    assert run_program(data[:], [2 ** 20], CompactIntCode) == [2 ** 80]
+    with pytest.raises(IndexError):
+        run_program(data[:], [2 ** 20])
+
+    program = CompactIntCode(data)
+    program.inputs.append(3)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 81
+    assert program.data.sparse == {100: 9, 10_000: 81}  # type: ignore
+    clone = program.clone()
+    program.restore()
+    assert program.data.sparse == {}  # type: ignore
+    assert clone.data.sparse == {100: 9, 10_000: 81}  # type: ignore
+    assert clone.run() == Status.HALTED
@@ -0,0 +1,297 @@
+"""Opt-in instruction level profiling for IntCode VMs.
+
+`enable_profiling(program)` swaps the VM's `run` for a copy of the run loop
+that counts every instruction, so VMs that are not profiled keep the plain
+loop and pay nothing. One Profile can be shared by several VMs (e.g. all the
+amplifiers of a pipeline) to get combined counts.
+
+A Profile records executions per opcode and per address, jump edges (both
+the taken and the fall-through side of every conditional jump) and the time
+spent inside `run` versus blocked waiting for input in the asyncio and
+generator adapters. It exports to JSON and to the collapsed stack format read
+by flamegraph.pl and speedscope, with one frame per basic block and one per
+instruction.
+"""
+import asyncio
+import functools
+import json
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pytest
+from IntCode import execute_arithmetic
+from IntCode import IntCode
+from IntCode import IntCodeCore
+from IntCode import OpCode
+from IntCode import run_program
+from IntCode import Status
+from IntCode import write_journaled
+from IntCodeCompiler import CompiledIntCode
+
+Edge = Tuple[int, int]
+
+
+class Profile:
+    def __init__(self) -> None:
+        self.opcode_counts = [0] * 100
+        self.address_counts: Dict[int, int] = {}
+        # Last opcode executed at each address; code can modify itself
+        self.address_opcodes: Dict[int, int] = {}
+        self.edges: Dict[Edge, int] = {}
+        self.executing_ns = 0
+        self.blocked_ns = 0
+
+    @property
+    def instructions(self) -> int:
+        return sum(self.opcode_counts)
+
+    def opcodes(self) -> Dict[str, int]:
+        return {
+            OpCode(op_code).name: count
+            for op_code, count in enumerate(self.opcode_counts)
+            if count
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "instructions": self.instructions,
+            "executing_ns": self.executing_ns,
+            "blocked_ns": self.blocked_ns,
+            "opcodes": self.opcodes(),
+            "addresses": {
+                str(address): count
+                for address, count in sorted(self.address_counts.items())
+            },
+            "edges": [
+                {"from": source, "to": target, "count": count}
+                for (source, target), count in sorted(self.edges.items())
+            ],
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def collapsed_stacks(self) -> List[str]:
+        """One `block@<leader>;<OPCODE>@<address> <count>` line per address.
+
+        Blocks start at address 0 and at the target of every jump edge seen,
+        including the fall-through side.
+        """
+        leaders = sorted({0, *(target for _, target in self.edges)})
+        lines = []
+        leader_index = 0
+        for address, count in sorted(self.address_counts.items()):
+            while (
+                leader_index + 1 < len(leaders) and leaders[leader_index + 1] <= address
+            ):
+                leader_index += 1
+            name = OpCode(self.address_opcodes[address]).name
+            lines.append(f"block@{leaders[leader_index]};{name}@{address} {count}")
+        return lines
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w") as f:
+            for line in self.collapsed_stacks():
+                f.write(f"{line}\n")
+
+
+def enable_profiling(
+    program: IntCodeCore, profile: Optional[Profile] = None
+) -> Profile:
+    """Profile every instruction `program` runs from now on.
+
+    Compiled VMs fall back to the interpreter while profiled and recompile
+    their blocks afterwards, since the profiled loop doesn't watch them.
+    """
+    if isinstance(program, CompiledIntCode):
+        program.discard_blocks()
+    if profile is None:
+        profile = Profile()
+    program.profile = profile
+    program.run = functools.partial(run_profiled, program, profile)  # type: ignore
+    return profile
+
+
+def disable_profiling(program: IntCodeCore) -> None:
+    program.profile = None
+    program.__dict__.pop("run", None)
+    if isinstance(program, CompiledIntCode):
+        program.discard_blocks()
+
+
+def run_profiled(program: IntCodeCore, profile: Profile) -> Status:
+    """IntCodeCore.run, counting every instruction into `profile`."""
+    start = time.perf_counter_ns()
+    data = program.data
+    inputs = program.inputs
+    journal = program.journal
+    table = program.decoded.table
+    fetch = program.decoded.fetch
+    opcode_counts = profile.opcode_counts
+    address_counts = profile.address_counts
+    address_opcodes = profile.address_opcodes
+    edges = profile.edges
+    position = program.position
+    try:
+        while True:
+            op_code, immediate1, immediate2, size = table[position] or fetch(
+                data, position
+            )
+            if op_code == 3 and not inputs:
+                program.position = position
+                return Status.NEEDS_INPUT
+            opcode_counts[op_code] += 1
+            address_counts[position] = address_counts.get(position, 0) + 1
+            address_opcodes[position] = op_code
+            if op_code == 1 or op_code == 2 or op_code == 7 or op_code == 8:
+                execute_arithmetic(
+                    data, journal, table, position, op_code, immediate1, immediate2
+                )
+                position += 4
+            elif op_code == 5 or op_code == 6:
+                value = data[position + 1]
+                if not immediate1:
+                    value = data[value]
+                if (op_code == 5) == (value != 0):
+                    target = data[position + 2]
+                    if not immediate2:
+                        target = data[target]
+                else:
+                    target = position + 3
+                edge = (position, target)
+                edges[edge] = edges.get(edge, 0) + 1
+                position = target
+            elif op_code == 3:
+                write_journaled(
+                    data, journal, table, data[position + 1], inputs.popleft()
+                )
+                position += 2
+            elif op_code == 4:
+                value = data[position + 1]
+                if not immediate1:
+                    value = data[value]
+                program.output = value
+                program.position = position + 2
+                return Status.OUTPUT
+            else:
+                program.position = position
+                program.finished = True
+                return Status.HALTED
+    finally:
+        profile.executing_ns += time.perf_counter_ns() - start
+
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+
+def test_counts() -> None:
+    program = IntCodeCore(SUM_LOOP[:])
+    profile = enable_profiling(program)
+    program.inputs.append(3)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 6
+    assert program.run() == Status.HALTED
+    assert profile.opcodes() == {
+        "ADD": 6,
+        "SAVE": 1,
+        "OUTPUT": 1,
+        "JUMP_IF": 3,
+        "TERM": 1,
+    }
+    assert profile.address_counts == {0: 1, 2: 3, 6: 3, 10: 3, 13: 1, 15: 1}
+    assert profile.edges == {(10, 2): 2, (10, 13): 1}
+    assert profile.collapsed_stacks() == [
+        "block@0;SAVE@0 1",
+        "block@2;ADD@2 3",
+        "block@2;ADD@6 3",
+        "block@2;JUMP_IF@10 3",
+        "block@13;OUTPUT@13 1",
+        "block@13;TERM@15 1",
+    ]
+
+    disable_profiling(program)
+    program.restore()
+    program.inputs.append(3)
+    program.run()
+    assert profile.instructions == 12
+
+
+def test_blocked_input_is_not_counted() -> None:
+    program = IntCodeCore(SUM_LOOP[:])
+    profile = enable_profiling(program)
+    assert program.run() == Status.NEEDS_INPUT
+    assert profile.instructions == 0
+    program.inputs.append(1)
+    assert program.run() == Status.OUTPUT
+    assert profile.opcodes()["SAVE"] == 1
+
+
+def test_blocked_time_in_adapter() -> None:
+    async def run() -> int:
+        input_queue: asyncio.Queue[int] = asyncio.Queue()
+        output_queue: asyncio.Queue[int] = asyncio.Queue()
+        program = IntCode(SUM_LOOP[:], input_queue, output_queue)
+        profile = enable_profiling(program)
+
+        async def feed() -> None:
+            await asyncio.sleep(0.01)
+            await input_queue.put(4)
+
+        await asyncio.gather(program.execute(), feed())
+        assert profile.blocked_ns >= 10_000_000
+        assert profile.executing_ns > 0
+        return await output_queue.get()
+
+    assert asyncio.run(run()) == 10
+
+
+@pytest.mark.parametrize("n", (1, 10))
+def test_same_results_as_plain_loop(n: int, tmp_path: Any) -> None:
+    program = IntCodeCore(SUM_LOOP[:])
+    profile = enable_profiling(program)
+    program.inputs.append(n)
+    assert program.run() == Status.OUTPUT
+    assert [program.output] == run_program(SUM_LOOP[:], [n])
+
+    path = tmp_path / "profile.json"
+    profile.write_json(str(path))
+    with open(path) as f:
+        assert json.load(f)["opcodes"]["JUMP_IF"] == n
+
+
+def test_profiling_compiled_program() -> None:
+    program = CompiledIntCode(SUM_LOOP[:])
+    program.inputs.append(2)
+    assert program.run() == Status.OUTPUT
+    assert program.blocks
+    program.restore()
+    profile = enable_profiling(program)
+    program.inputs.append(2)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 3
+    assert profile.opcodes()["JUMP_IF"] == 2
+    disable_profiling(program)
+    program.restore()
+    program.inputs.append(4)
+    assert program.run() == Status.OUTPUT
+    assert program.output == 10
+
+
+def test_toggling_profiling_on_compiled_program() -> None:
+    # The ADD at 6 overwrites the ADD at 0 with TERM, then jumps back to it
+    data = [1101, 0, 0, 20, 104, 1, 1101, 99, 0, 0, 104, 2, 1105, 1, 0]
+    program = CompiledIntCode(data + [0] * 10)
+    enable_profiling(program)
+    assert program.run() == Status.OUTPUT and program.output == 1
+    disable_profiling(program)
+    assert program.run() == Status.OUTPUT and program.output == 2
+    # The profiled loop must not run the ADD it decoded at 0 before
+    enable_profiling(program)
+    assert program.run() == Status.HALTED
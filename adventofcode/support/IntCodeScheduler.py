@@ -0,0 +1,258 @@
+"""Run many IntCode VMs in one asyncio event loop, taking turns fairly.
+
+The async `IntCode` only yields to the event loop when it waits on a queue,
+so a VM with a long stretch of computation starves every other coroutine in
+the loop. A Scheduler session instead gives its VM turns of `slice_steps`
+instructions, run with `run_for` and counted across any outputs and inputs
+that don't block, and yields after each one, so every runnable VM gets a
+turn within one round of the loop no matter what the others do.
+
+Sessions talk through asyncio queues. Queues from `Scheduler.queue()` are
+bounded by `queue_size`; a VM whose output queue is full waits for the
+reader to catch up instead of buffering without limit.
+
+Each session records how many slices and instructions it ran, how long it
+spent running, how long it waited for its next turn (and the longest such
+wait) and how long it was blocked on input and on a full output queue.
+`Scheduler.stats()` sums these up, with Jain's fairness index of the share
+of time each session got to run while it was runnable (1.0 is perfectly
+fair, 1/n is one session getting everything).
+"""
+import asyncio
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import pytest
+from IntCode import IntCodeCore
+from IntCode import NoInputException
+from IntCode import run_program
+from IntCode import Status
+from Pipeline import ADD_INPUTS
+
+
+class Session:
+    def __init__(
+        self,
+        program: IntCodeCore,
+        input_queue: "Optional[asyncio.Queue[int]]" = None,
+        output_queue: "Optional[asyncio.Queue[int]]" = None,
+        name: str = "",
+    ) -> None:
+        self.program = program
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.name = name
+        self.slices = 0
+        self.steps = 0
+        self.outputs = 0
+        self.running_ns = 0
+        self.waiting_ns = 0
+        self.max_wait_ns = 0
+        self.input_ns = 0
+        self.output_ns = 0
+
+    async def run(self, slice_steps: int) -> None:
+        program = self.program
+        perf_counter_ns = time.perf_counter_ns
+        # Steps left in this turn. Outputs and inputs don't end a turn unless
+        # they block: putting to a queue with room or getting from one with
+        # values in it doesn't yield to the event loop.
+        budget = slice_steps
+        while True:
+            start = perf_counter_ns()
+            steps = program.steps
+            status = program.run_for(budget)
+            end = perf_counter_ns()
+            self.slices += 1
+            self.steps += program.steps - steps
+            self.running_ns += end - start
+            budget -= program.steps - steps
+            if status == Status.NEEDS_INPUT:
+                if self.input_queue is None:
+                    raise NoInputException()
+                if self.input_queue.empty():
+                    budget = slice_steps
+                program.inputs.append(await self.input_queue.get())
+                self.input_ns += perf_counter_ns() - end
+            elif status == Status.OUTPUT:
+                self.outputs += 1
+                if self.output_queue is not None:
+                    assert program.output is not None
+                    if self.output_queue.full():
+                        budget = slice_steps
+                    await self.output_queue.put(program.output)
+                    self.output_ns += perf_counter_ns() - end
+            elif status == Status.HALTED:
+                return
+            if budget <= 0:
+                yielded = perf_counter_ns()
+                await asyncio.sleep(0)
+                wait = perf_counter_ns() - yielded
+                self.waiting_ns += wait
+                if wait > self.max_wait_ns:
+                    self.max_wait_ns = wait
+                budget = slice_steps
+
+    def share(self) -> float:
+        """The fraction of its runnable time this session spent running."""
+        runnable = self.running_ns + self.waiting_ns
+        return self.running_ns / runnable if runnable else 1.0
+
+
+def jain_index(values: Sequence[float]) -> float:
+    """(sum x)^2 / (n * sum x^2): 1.0 when all values are equal."""
+    squares = sum(value * value for value in values)
+    if not squares:
+        return 1.0
+    return sum(values) ** 2 / (len(values) * squares)
+
+
+class Scheduler:
+    def __init__(self, slice_steps: int = 1000, queue_size: int = 0) -> None:
+        """`queue_size` bounds the queues from `queue()`; 0 is unbounded."""
+        self.slice_steps = slice_steps
+        self.queue_size = queue_size
+        self.sessions: List[Session] = []
+        self._tasks: "List[asyncio.Task[None]]" = []
+
+    def queue(self) -> "asyncio.Queue[int]":
+        return asyncio.Queue(self.queue_size)
+
+    def spawn(
+        self,
+        program: IntCodeCore,
+        input_queue: "Optional[asyncio.Queue[int]]" = None,
+        output_queue: "Optional[asyncio.Queue[int]]" = None,
+        name: str = "",
+    ) -> Session:
+        """Start running `program` in the current event loop.
+
+        Inputs are read from `input_queue` once the program's own `inputs`
+        run out; outputs go to `output_queue`, or are only kept as the
+        program's last `output` if there is none.
+        """
+        session = Session(program, input_queue, output_queue, name)
+        self.sessions.append(session)
+        self._tasks.append(asyncio.create_task(session.run(self.slice_steps)))
+        return session
+
+    async def run(self) -> None:
+        """Wait for every session spawned so far to halt."""
+        await asyncio.gather(*self._tasks)
+
+    def stats(self) -> Dict[str, float]:
+        sessions = self.sessions
+        waits = [session.waiting_ns for session in sessions]
+        slices = sum(session.slices for session in sessions)
+        return {
+            "sessions": len(sessions),
+            "slices": slices,
+            "steps": sum(session.steps for session in sessions),
+            "running_s": sum(session.running_ns for session in sessions) / 1e9,
+            "mean_wait_us": sum(waits) / max(slices, 1) / 1e3,
+            "max_wait_us": max((session.max_wait_ns for session in sessions), default=0)
+            / 1e3,
+            "input_s": sum(session.input_ns for session in sessions) / 1e9,
+            "output_s": sum(session.output_ns for session in sessions) / 1e9,
+            "fairness": jain_index([session.share() for session in sessions]),
+        }
+
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+# Reads n, then outputs n, n - 1, ..., 1
+COUNT_DOWN = [3, 12, 4, 12, 1001, 12, -1, 12, 1005, 12, 2, 99, 0]
+
+
+def test_thousands_of_sessions() -> None:
+    async def run() -> Scheduler:
+        scheduler = Scheduler(slice_steps=50)
+        outputs = scheduler.queue()
+        for n in range(2000):
+            program = IntCodeCore(SUM_LOOP[:])
+            program.inputs.append(n % 40 + 1)
+            scheduler.spawn(program, output_queue=outputs)
+        await scheduler.run()
+        assert sorted(outputs.get_nowait() for _ in range(2000)) == sorted(
+            run_program(SUM_LOOP[:], [n % 40 + 1])[0] for n in range(2000)
+        )
+        return scheduler
+
+    stats = asyncio.run(run()).stats()
+    assert stats["sessions"] == 2000
+    assert stats["steps"] == sum(3 * (n % 40 + 1) + 3 for n in range(2000))
+
+
+@pytest.mark.parametrize(
+    ("busy_program", "busy_input", "outputs"),
+    [
+        (SUM_LOOP, 100_000, False),
+        # Outputs every 3 instructions to a queue that never fills up
+        (COUNT_DOWN, 200_000, True),
+    ],
+)
+def test_busy_vm_does_not_starve_others(
+    busy_program: List[int], busy_input: int, outputs: bool
+) -> None:
+    async def run() -> None:
+        scheduler = Scheduler(slice_steps=100)
+        busy = IntCodeCore(busy_program[:])
+        busy.inputs.append(busy_input)
+        scheduler.spawn(busy, output_queue=scheduler.queue() if outputs else None)
+
+        # A chain of amplifiers, as in day 7, next to the busy VM
+        queues = [scheduler.queue() for _ in range(4)]
+        for i, phase in enumerate((1, 2, 3)):
+            queues[i].put_nowait(phase)
+            scheduler.spawn(IntCodeCore(ADD_INPUTS[:]), queues[i], queues[i + 1])
+        queues[0].put_nowait(10)
+        # And a VM that needs about 3000 instructions
+        summed = scheduler.queue()
+        neighbour = IntCodeCore(SUM_LOOP[:])
+        neighbour.inputs.append(1000)
+        scheduler.spawn(neighbour, output_queue=summed)
+
+        async def reader() -> None:
+            assert await queues[3].get() == 16
+            assert await summed.get() == 500500
+            # Both got their slices while the busy VM was still running
+            assert not busy.finished
+
+        chain = asyncio.create_task(reader())
+        await scheduler.run()
+        await chain
+        assert busy.finished
+
+    asyncio.run(run())
+
+
+def test_back_pressure() -> None:
+    async def run() -> Session:
+        scheduler = Scheduler(slice_steps=10, queue_size=2)
+        output_queue = scheduler.queue()
+        program = IntCodeCore(COUNT_DOWN[:])
+        program.inputs.append(20)
+        session = scheduler.spawn(program, output_queue=output_queue)
+        values = []
+        for _ in range(20):
+            await asyncio.sleep(0)
+            assert output_queue.qsize() <= 2
+            values.append(await output_queue.get())
+        await scheduler.run()
+        assert values == list(range(20, 0, -1))
+        return session
+
+    session = asyncio.run(run())
+    assert session.outputs == 20
+    assert session.output_ns > 0
+
+
+def test_jain_index() -> None:
+    assert jain_index([1, 1, 1, 1]) == 1.0
+    assert jain_index([1, 0, 0, 0]) == 0.25
+    assert jain_index([]) == 1.0
@@ -0,0 +1,183 @@
+"""Search the input space of an IntCode program for inputs reaching a goal.
+
+The cells to vary are written into the program before each run (day2's
+noun/verb style), the VM is run to completion and `goal` decides whether the
+final state is a match. The space is split into chunks of consecutive
+candidates and spread over a process pool; the first match found stops every
+worker.
+"""
+import itertools
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from typing import Any
+from typing import NamedTuple
+from typing import Optional
+from typing import Protocol
+from typing import Sequence
+from typing import Tuple
+
+import pytest
+from IntCode import copy_factory
+from IntCode import IntCodeCore
+from IntCode import NoInputException
+from IntCode import ProgramFactory
+from IntCode import Status
+
+Cells = Sequence[Tuple[int, range]]
+Candidate = Tuple[int, ...]
+
+
+class Goal(Protocol):
+    """Decides whether a halted program's final state is a match."""
+
+    def __call__(self, program: IntCodeCore) -> bool:
+        ...
+
+
+# How many candidates a worker tries between checks of the stop flag
+CHECK_INTERVAL = 256
+
+
+class CellEquals(NamedTuple):
+    """Goal predicate: `address` holds `value` once the program halts.
+
+    A NamedTuple rather than a closure so that it can be sent to workers.
+    """
+
+    address: int
+    value: int
+
+    def __call__(self, program: IntCodeCore) -> bool:
+        return program.data[self.address] == self.value
+
+
+def candidate_at(cells: Cells, index: int) -> Candidate:
+    """The `index`th candidate of the product of the cell ranges."""
+    values = []
+    for _, values_range in reversed(cells):
+        index, offset = divmod(index, len(values_range))
+        values.append(values_range[offset])
+    return tuple(reversed(values))
+
+
+def space_size(cells: Cells) -> int:
+    size = 1
+    for _, values_range in cells:
+        size *= len(values_range)
+    return size
+
+
+def try_candidate(program: IntCodeCore, cells: Cells, candidate: Candidate) -> None:
+    program.restore()
+    for (address, _), value in zip(cells, candidate):
+        program.write(address, value)
+    while True:
+        status = program.run()
+        if status == Status.HALTED:
+            return
+        if status == Status.NEEDS_INPUT:
+            raise NoInputException()
+
+
+def search_range(
+    factory: ProgramFactory,
+    cells: Cells,
+    goal: Goal,
+    start: int,
+    stop: int,
+    stop_flag: Any,
+) -> Optional[Candidate]:
+    program = factory()
+    for index in range(start, stop):
+        if stop_flag is not None and index % CHECK_INTERVAL == 0 and stop_flag.is_set():
+            return None
+        candidate = candidate_at(cells, index)
+        try_candidate(program, cells, candidate)
+        if goal(program):
+            return candidate
+    return None
+
+
+# State shared with every worker process, set once by the pool initializer
+_worker_state: Tuple[Any, ...] = ()
+
+
+def _init_worker(
+    factory: ProgramFactory, cells: Cells, goal: Goal, stop_flag: Any
+) -> None:
+    global _worker_state
+    _worker_state = (factory, cells, goal, stop_flag)
+
+
+def _search_chunk(start: int, stop: int) -> Optional[Candidate]:
+    factory, cells, goal, stop_flag = _worker_state
+    return search_range(factory, cells, goal, start, stop, stop_flag)
+
+
+def search_inputs(
+    factory: ProgramFactory,
+    cells: Cells,
+    goal: Goal,
+    processes: Optional[int] = None,
+    chunks_per_process: int = 4,
+) -> Optional[Candidate]:
+    """Find values for `cells` (address, range of values) satisfying `goal`.
+
+    `factory` makes the VMs to try candidates on, e.g. `copy_factory(data)`;
+    it is sent to the workers, so it has to pickle. Returns one matching
+    tuple of values, in the order of `cells`, or None. Any match may be
+    returned when several exist. With `processes=1` the search runs in this
+    process.
+    """
+    size = space_size(cells)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or size <= CHECK_INTERVAL:
+        return search_range(factory, cells, goal, 0, size, None)
+
+    chunk_size = max(CHECK_INTERVAL, -(-size // (processes * chunks_per_process)))
+    bounds = [
+        (start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)
+    ]
+
+    stop_flag = multiprocessing.Event()
+    with ProcessPoolExecutor(
+        processes,
+        initializer=_init_worker,
+        initargs=(factory, cells, goal, stop_flag),
+    ) as executor:
+        pending = {
+            executor.submit(_search_chunk, start, stop) for start, stop in bounds
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    # Running chunks see the flag at their next check
+                    stop_flag.set()
+                    for other in pending:
+                        other.cancel()
+                    return result
+    return None
+
+
+def test_candidate_at() -> None:
+    cells = [(1, range(3)), (2, range(10, 14))]
+    expected = list(itertools.product(range(3), range(10, 14)))
+    assert [candidate_at(cells, i) for i in range(space_size(cells))] == expected
+
+
+@pytest.mark.parametrize("processes", (1, 2))
+def test_search_inputs(processes: int) -> None:
+    # data[0] = data[noun] * data[verb]. Cell 4 holds the only 99 and every
+    # other cell less than 40, so only noun = verb = 4 makes 99 * 99
+    data = [2, 0, 0, 0, 99] + list(range(5, 40))
+    cells = [(1, range(40)), (2, range(40))]
+    goal = CellEquals(0, 99 * 99)
+    factory = copy_factory(data)
+    assert search_inputs(factory, cells, goal, processes=processes) == (4, 4)
+    no_match = CellEquals(0, -1)
+    assert search_inputs(factory, cells, no_match, processes=processes) is None
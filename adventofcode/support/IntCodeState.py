@@ -0,0 +1,441 @@
+"""Save and restore the full state of an IntCode VM.
+
+`dumps(program)` packs everything needed to carry on where the VM stopped:
+memory, position, step count, the last output, the restore journal and
+snapshot, pending inputs, plus `outputs` for IntCodeGen and the contents of
+the input and output queues for the asyncio IntCode. `loads` builds a VM of
+the same class from it.
+
+The format is a short header followed by lists of integers, each stored as
+packed int64 or, if a value doesn't fit, as comma separated text. The body
+can be zlib compressed.
+
+`enable_checkpoints(program, path, ...)` makes a VM save itself to `path`
+every N instructions and/or every T seconds while it runs, so a killed job
+can `load(path)` and resume instead of starting over. Files are written to a
+temporary name and renamed into place, so a crash never leaves a torn file.
+
+    python support/IntCodeState.py PROGRAM CHECKPOINT [--input 1 5]
+                                   [--every-steps N] [--every-seconds T]
+                                   [--compress]
+
+runs a program from a file, printing its outputs and checkpointing as it
+goes. Started again after being killed, it resumes from CHECKPOINT (outputs
+since the last checkpoint are printed again); the checkpoint is removed once
+the program halts.
+"""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Type
+
+import pytest
+from IntCode import IntCode
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from IntCodeCompiler import CompiledIntCode
+from IntCodeGen import IntCodeGen
+
+MAGIC = b"ICST"
+VERSION = 1
+HEADER = struct.Struct("<4sBB")
+COMPRESSED = 0x01
+
+_PACKED = 0
+_TEXT = 1
+_COUNT = struct.Struct("<BQ")
+
+# Only VMs whose memory is a plain list can be saved
+_CLASSES: Dict[str, Type[IntCodeCore]] = {
+    cls.__name__: cls for cls in (IntCodeCore, IntCode, IntCodeGen, CompiledIntCode)
+}
+
+
+def _pack_ints(values: Sequence[int]) -> bytes:
+    try:
+        return _COUNT.pack(_PACKED, len(values)) + array("q", values).tobytes()
+    except OverflowError:
+        text = ",".join(str(value) for value in values).encode()
+        return _COUNT.pack(_TEXT, len(text)) + text
+
+
+def _unpack_ints(blob: bytes, offset: int) -> Tuple[List[int], int]:
+    encoding, count = _COUNT.unpack_from(blob, offset)
+    offset += _COUNT.size
+    if encoding == _PACKED:
+        end = offset + count * 8
+        return array("q", blob[offset:end]).tolist(), end
+    end = offset + count
+    text = blob[offset:end].decode()
+    return [int(x) for x in text.split(",")] if text else [], end
+
+
+def _queue_contents(queue: "Optional[asyncio.Queue[int]]") -> List[int]:
+    if queue is None:
+        return []
+    # Drain and refill in order; nothing else runs in between since this
+    # doesn't await. task_done() undoes the count that put_nowait() adds.
+    values = [queue.get_nowait() for _ in range(queue.qsize())]
+    for value in values:
+        queue.put_nowait(value)
+    for _ in values:
+        queue.task_done()
+    return values
+
+
+def dumps(program: IntCodeCore, compress: bool = False) -> bytes:
+    name = type(program).__name__
+    if _CLASSES.get(name) is not type(program):
+        raise TypeError(f"Can't save a {name}")
+    saved_position, saved_finished, saved_inputs = program._saved_state
+    output = [] if program.output is None else [program.output]
+    outputs: Sequence[int] = ()
+    input_queue = output_queue = None
+    if isinstance(program, IntCodeGen):
+        outputs = list(program.outputs)
+    elif isinstance(program, IntCode):
+        input_queue = program.input_queue
+        output_queue = program.output_queue
+    scalars = [
+        program.position,
+        program.finished,
+        program.steps,
+        saved_position,
+        saved_finished,
+        input_queue is not None,
+        output_queue is not None,
+    ]
+    encoded_name = name.encode()
+    body = b"".join(
+        [
+            bytes([len(encoded_name)]),
+            encoded_name,
+            _pack_ints(scalars),
+            _pack_ints(output),
+            _pack_ints(program.data),
+            _pack_ints(list(program.inputs)),
+            _pack_ints(list(program.journal)),
+            _pack_ints(list(program.journal.values())),
+            _pack_ints(saved_inputs),
+            _pack_ints(outputs),
+            _pack_ints(_queue_contents(input_queue)),
+            _pack_ints(_queue_contents(output_queue)),
+        ]
+    )
+    if compress:
+        body = zlib.compress(body, 1)
+    return HEADER.pack(MAGIC, VERSION, COMPRESSED if compress else 0) + body
+
+
+def loads(blob: bytes) -> IntCodeCore:
+    magic, version, flags = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a saved IntCode state")
+    body = blob[HEADER.size :]
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+    name = body[1 : 1 + body[0]].decode()
+    offset = 1 + body[0]
+    lists = []
+    for _ in range(10):
+        values, offset = _unpack_ints(body, offset)
+        lists.append(values)
+    (
+        scalars,
+        output,
+        data,
+        inputs,
+        journal_addresses,
+        journal_values,
+        saved_inputs,
+        outputs,
+        input_queue_contents,
+        output_queue_contents,
+    ) = lists
+    (
+        position,
+        finished,
+        steps,
+        saved_position,
+        saved_finished,
+        has_input_queue,
+        has_output_queue,
+    ) = scalars
+
+    cls = _CLASSES[name]
+    program: IntCodeCore
+    if cls is IntCode:
+        queues = []
+        for present, contents in (
+            (has_input_queue, input_queue_contents),
+            (has_output_queue, output_queue_contents),
+        ):
+            queue: "Optional[asyncio.Queue[int]]" = None
+            if present:
+                queue = asyncio.Queue()
+                for value in contents:
+                    queue.put_nowait(value)
+            queues.append(queue)
+        program = IntCode(data, *queues)
+    else:
+        program = cls(data)
+    if isinstance(program, IntCodeGen):
+        program.outputs.extend(outputs)
+    program.position = position
+    program.finished = bool(finished)
+    program.steps = steps
+    program.output = output[0] if output else None
+    program.inputs.extend(inputs)
+    program.journal.update(zip(journal_addresses, journal_values))
+    program._saved_state = (saved_position, bool(saved_finished), tuple(saved_inputs))
+    return program
+
+
+def save(program: IntCodeCore, path: str, compress: bool = False) -> None:
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(dumps(program, compress))
+    os.replace(temporary_path, path)
+
+
+def load(path: str) -> IntCodeCore:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+class Checkpointer:
+    def __init__(
+        self,
+        program: IntCodeCore,
+        path: str,
+        every_steps: Optional[int] = None,
+        every_seconds: Optional[float] = None,
+        compress: bool = False,
+    ) -> None:
+        if every_steps is None and every_seconds is None:
+            raise ValueError("Need every_steps, every_seconds or both")
+        self.program = program
+        self.path = path
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.compress = compress
+        self.saves = 0
+        # How often to look at the clock when only saving on a timer
+        self.slice = every_steps or 10_000
+        self._last_steps = program.steps
+        self._last_time = time.monotonic()
+
+    def run(self) -> Status:
+        program = self.program
+        while True:
+            budget = self.slice
+            if self.every_steps is not None:
+                # Steps carry over between calls, so a VM that outputs or
+                # waits for input often still saves every `every_steps`
+                budget = max(1, self.every_steps - (program.steps - self._last_steps))
+            status = program.run_for(budget)
+            due = (
+                self.every_steps is not None
+                and program.steps - self._last_steps >= self.every_steps
+            )
+            if self.every_seconds is not None and not due:
+                due = time.monotonic() - self._last_time >= self.every_seconds
+            if due:
+                self.save()
+            if status != Status.PAUSED:
+                return status
+
+    def save(self) -> None:
+        save(self.program, self.path, self.compress)
+        self.saves += 1
+        self._last_steps = self.program.steps
+        self._last_time = time.monotonic()
+
+
+def enable_checkpoints(
+    program: IntCodeCore,
+    path: str,
+    every_steps: Optional[int] = None,
+    every_seconds: Optional[float] = None,
+    compress: bool = False,
+) -> Checkpointer:
+    """Save `program` to `path` periodically while it runs."""
+    checkpointer = Checkpointer(program, path, every_steps, every_seconds, compress)
+    program.run = checkpointer.run  # type: ignore
+    return checkpointer
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("program", help="file holding a comma separated program")
+    parser.add_argument("checkpoint", help="where to save; resumed from if it exists")
+    parser.add_argument(
+        "--input",
+        type=int,
+        nargs="*",
+        default=[],
+        help="inputs for a fresh run; a resumed run has its own",
+    )
+    parser.add_argument("--every-steps", type=int)
+    parser.add_argument("--every-seconds", type=float)
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args(argv)
+    if args.every_steps is None and args.every_seconds is None:
+        parser.error("need --every-steps, --every-seconds or both")
+
+    if os.path.exists(args.checkpoint):
+        program = load(args.checkpoint)
+        print(f"Resuming after {program.steps} steps", file=sys.stderr)
+    else:
+        with open(args.program) as f:
+            program = IntCodeCore([int(x) for x in f.read().split(",")])
+        program.inputs.extend(args.input)
+    enable_checkpoints(
+        program, args.checkpoint, args.every_steps, args.every_seconds, args.compress
+    )
+    while True:
+        status = program.run()
+        if status == Status.OUTPUT:
+            print(program.output, flush=True)
+        elif status == Status.NEEDS_INPUT:
+            print("The program needs more input", file=sys.stderr)
+            return 1
+        else:
+            break
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    return 0
+
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+
+@pytest.mark.parametrize("compress", (False, True))
+def test_round_trip(compress: bool) -> None:
+    program = IntCodeCore(SUM_LOOP[:])
+    program.inputs.extend((3, 2 ** 70))
+    program.snapshot()
+    program.run_for(5)
+    program.write(21, -(2 ** 65))
+    copy = loads(dumps(program, compress))
+    assert type(copy) is IntCodeCore
+    assert copy.data == program.data
+    assert list(copy.inputs) == [2 ** 70]
+    assert (copy.position, copy.finished, copy.steps) == (6, False, 5)
+    assert copy.journal == program.journal
+    copy.restore()
+    program.restore()
+    assert copy.data == program.data == SUM_LOOP
+    assert list(copy.inputs) == list(program.inputs) == [3, 2 ** 70]
+
+
+def test_generator_outputs() -> None:
+    program = IntCodeGen([104, 1, 104, 2, 3, 7, 99, 0])
+    execution = program.execute()
+    assert next(execution) == 1
+    copy = loads(dumps(program))
+    assert isinstance(copy, IntCodeGen)
+    assert list(copy.outputs) == [2]
+    copy.inputs.append(5)
+    assert copy.run() == Status.HALTED
+    assert copy.data[7] == 5
+
+
+def test_async_queues() -> None:
+    async def run() -> None:
+        input_queue: asyncio.Queue[int] = asyncio.Queue()
+        output_queue: asyncio.Queue[int] = asyncio.Queue()
+        input_queue.put_nowait(7)
+        output_queue.put_nowait(3)
+        program = IntCode(SUM_LOOP[:], input_queue, output_queue)
+        copy = loads(dumps(program))
+        assert isinstance(copy, IntCode)
+        assert copy.input_queue is not None and copy.output_queue is not None
+        await copy.execute()
+        assert copy.output_queue.get_nowait() == 3
+        assert copy.output_queue.get_nowait() == 28
+        # The original queues are untouched
+        assert input_queue.qsize() == 1 and output_queue.qsize() == 1
+        assert input_queue.get_nowait() == 7
+        input_queue.task_done()
+        await asyncio.wait_for(input_queue.join(), 1)
+
+    asyncio.run(run())
+
+
+def test_checkpoint_and_resume(tmp_path: Any) -> None:
+    path = str(tmp_path / "state.bin")
+    program = IntCodeCore(SUM_LOOP[:])
+    checkpointer = enable_checkpoints(program, path, every_steps=100, compress=True)
+    program.inputs.append(1000)
+    assert program.run() == Status.OUTPUT
+    assert checkpointer.saves == 30
+
+    # Pick up from the last checkpoint as if the process had been killed
+    resumed = load(path)
+    assert resumed.steps == 3000
+    assert "run" not in resumed.__dict__
+    assert resumed.run() == Status.OUTPUT
+    assert resumed.output == program.output == run_program(SUM_LOOP[:], [1000])[0]
+
+
+def test_timed_checkpoints(tmp_path: Any) -> None:
+    path = str(tmp_path / "state.bin")
+    program = IntCodeCore(SUM_LOOP[:])
+    checkpointer = enable_checkpoints(program, path, every_seconds=0)
+    program.inputs.append(10_000)
+    program.run()
+    # Once per slice, and once more on returning the output
+    assert checkpointer.saves == 30_000 // checkpointer.slice + 1
+    assert os.path.exists(path)
+
+
+def test_checkpoints_between_outputs(tmp_path: Any) -> None:
+    # Reads n, then outputs n, n - 1, ..., 1: an output every 3 instructions
+    path = str(tmp_path / "state.bin")
+    program = IntCodeCore([3, 12, 4, 12, 1001, 12, -1, 12, 1005, 12, 2, 99, 0])
+    checkpointer = enable_checkpoints(program, path, every_steps=100)
+    program.inputs.append(1000)
+    outputs = []
+    while program.run() == Status.OUTPUT:
+        outputs.append(program.output)
+    assert outputs == list(range(1000, 0, -1))
+    assert checkpointer.saves == 30
+    assert load(path).steps == 3000
+
+
+def test_main_resumes(tmp_path: Any, capsys: Any) -> None:
+    program_path = tmp_path / "program.txt"
+    program_path.write_text(",".join(str(x) for x in SUM_LOOP))
+    path = str(tmp_path / "state.bin")
+    arguments = [str(program_path), path, "--every-steps", "100"]
+    assert main([*arguments, "--input", "100"]) == 0
+    assert capsys.readouterr().out == "5050\n"
+    # Checkpoints are removed once the program halts
+    assert not os.path.exists(path)
+
+    # As if killed part way through a run for 1000
+    program = IntCodeCore(SUM_LOOP[:])
+    program.inputs.append(1000)
+    program.run_for(1500)
+    save(program, path)
+    assert main([*arguments, "--input", "1"]) == 0
+    assert capsys.readouterr().out == f"{sum(range(1001))}\n"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
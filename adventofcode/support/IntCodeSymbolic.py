@@ -0,0 +1,277 @@
+"""Symbolic execution of IntCode programs.
+
+The chosen cells are replaced by variables and the program is run once with
+polynomials in place of integers. ADD and MULTIPLY keep the result exact, so a
+day2-style program yields the goal cell as a polynomial of its inputs and the
+goal can be solved for without running the VM once per candidate.
+
+Anything that makes the result depend on the inputs in a way a polynomial
+can't describe (a jump or comparison on a symbolic value, a symbolic address
+or opcode, reading input) raises SymbolicFallback, as does writing output,
+which a single symbolic run has no values for. `solve_for_goal` then
+falls back to the brute force search.
+"""
+import itertools
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import pytest
+from IntCode import copy_factory
+from IntCode import decode
+from IntCodeSearch import Candidate
+from IntCodeSearch import CellEquals
+from IntCodeSearch import Cells
+from IntCodeSearch import search_inputs
+
+Monomial = Tuple[int, ...]
+
+
+class SymbolicFallback(Exception):
+    pass
+
+
+class Polynomial:
+    """Polynomial with integer coefficients over variables x0 .. xn-1.
+
+    Terms map exponent tuples (one exponent per variable) to coefficients.
+    """
+
+    def __init__(self, terms: Dict[Monomial, int]) -> None:
+        self.terms = {monomial: coeff for monomial, coeff in terms.items() if coeff}
+
+    @classmethod
+    def variable(cls, index: int, count: int) -> "Polynomial":
+        return cls({tuple(int(i == index) for i in range(count)): 1})
+
+    def __add__(self, other: "Polynomial") -> "Polynomial":
+        terms = dict(self.terms)
+        for monomial, coeff in other.terms.items():
+            terms[monomial] = terms.get(monomial, 0) + coeff
+        return Polynomial(terms)
+
+    def __mul__(self, other: "Polynomial") -> "Polynomial":
+        terms: Dict[Monomial, int] = {}
+        for (monomial1, coeff1), (monomial2, coeff2) in itertools.product(
+            self.terms.items(), other.terms.items()
+        ):
+            monomial = tuple(a + b for a, b in zip(monomial1, monomial2))
+            terms[monomial] = terms.get(monomial, 0) + coeff1 * coeff2
+        return Polynomial(terms)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Polynomial) and self.terms == other.terms
+
+    def __repr__(self) -> str:
+        return f"Polynomial({self.terms!r})"
+
+    def degree_in(self, index: int) -> int:
+        return max((monomial[index] for monomial in self.terms), default=0)
+
+    def evaluate(self, values: Sequence[int]) -> int:
+        total = 0
+        for monomial, coeff in self.terms.items():
+            for value, exponent in zip(values, monomial):
+                coeff *= value ** exponent
+            total += coeff
+        return total
+
+
+class Unknown:
+    """A value read through a symbolic address.
+
+    Harmless unless it reaches the result, an address or a branch.
+    """
+
+    def __repr__(self) -> str:
+        return "UNKNOWN"
+
+
+UNKNOWN = Unknown()
+
+Value = Union[int, Polynomial, Unknown]
+
+
+def as_polynomial(value: Value, count: int) -> Polynomial:
+    if isinstance(value, Polynomial):
+        return value
+    assert isinstance(value, int)
+    return Polynomial({(0,) * count: value})
+
+
+def concrete(value: Value, reason: str) -> int:
+    if not isinstance(value, int):
+        raise SymbolicFallback(f"{reason} depends on the inputs")
+    return value
+
+
+def arithmetic(op_code: int, value1: Value, value2: Value, count: int) -> Value:
+    if isinstance(value1, Unknown) or isinstance(value2, Unknown):
+        return UNKNOWN
+    if isinstance(value1, int) and isinstance(value2, int):
+        return value1 + value2 if op_code == 1 else value1 * value2
+    poly1, poly2 = as_polynomial(value1, count), as_polynomial(value2, count)
+    result = poly1 + poly2 if op_code == 1 else poly1 * poly2
+    if all(not any(monomial) for monomial in result.terms):
+        # Variables cancelled out
+        return result.terms.get((0,) * count, 0)
+    return result
+
+
+def symbolic_value(data: List[int], cells: Sequence[int], address: int) -> Value:
+    """Run `data` with variable i in `cells[i]` and return the final `address`."""
+    count = len(cells)
+    memory: List[Value] = list(data)
+    for index, cell in enumerate(cells):
+        memory[cell] = Polynomial.variable(index, count)
+
+    def read(position: int, immediate: bool) -> Value:
+        value = memory[position]
+        if immediate:
+            return value
+        if not isinstance(value, int):
+            return UNKNOWN
+        return memory[value]
+
+    position = 0
+    while True:
+        op_code, immediate1, immediate2, size = decode(
+            concrete(memory[position], f"Opcode at {position}")
+        )
+        if op_code in (1, 2):
+            result = arithmetic(
+                op_code,
+                read(position + 1, immediate1),
+                read(position + 2, immediate2),
+                count,
+            )
+            memory[concrete(memory[position + 3], "Write address")] = result
+        elif op_code in (5, 6):
+            value = concrete(read(position + 1, immediate1), "Branch")
+            if (op_code == 5) == (value != 0):
+                position = concrete(read(position + 2, immediate2), "Jump target")
+                continue
+        elif op_code in (7, 8):
+            value1 = concrete(read(position + 1, immediate1), "Comparison")
+            value2 = concrete(read(position + 2, immediate2), "Comparison")
+            result = value1 < value2 if op_code == 7 else value1 == value2
+            memory[concrete(memory[position + 3], "Write address")] = int(result)
+        elif op_code == 3:
+            raise SymbolicFallback("Program reads input")
+        elif op_code == 4:
+            raise SymbolicFallback("Program writes output")
+        elif op_code == 99:
+            final = memory[address]
+            if isinstance(final, Unknown):
+                raise SymbolicFallback("Result depends on unknown memory")
+            return final
+        position += size
+
+
+def solve(expression: Value, ranges: Sequence[range], goal: int) -> Optional[Candidate]:
+    """First candidate (in product order) for which `expression` equals `goal`.
+
+    When the expression is linear in the last variable, that variable is solved
+    for instead of enumerated.
+    """
+    if isinstance(expression, int):
+        if expression != goal or not all(ranges):
+            return None
+        return tuple(values[0] for values in ranges)
+    assert isinstance(expression, Polynomial)
+    last = ranges[-1]
+    linear = expression.degree_in(len(ranges) - 1) <= 1
+    for prefix in itertools.product(*ranges[:-1]):
+        if linear:
+            offset = expression.evaluate(prefix + (0,))
+            slope = expression.evaluate(prefix + (1,)) - offset
+            remainder = goal - offset
+            if slope == 0:
+                if remainder == 0 and last:
+                    return prefix + (last[0],)
+            elif remainder % slope == 0 and remainder // slope in last:
+                return prefix + (remainder // slope,)
+        else:
+            for value in last:
+                if expression.evaluate(prefix + (value,)) == goal:
+                    return prefix + (value,)
+    return None
+
+
+def solve_for_goal(
+    data: List[int],
+    cells: Cells,
+    address: int,
+    goal: int,
+    processes: Optional[int] = None,
+) -> Optional[Candidate]:
+    """Values for `cells` that leave `goal` in `address` once the program halts."""
+    try:
+        expression = symbolic_value(data, [cell for cell, _ in cells], address)
+    except SymbolicFallback:
+        goal_reached = CellEquals(address, goal)
+        return search_inputs(copy_factory(data), cells, goal_reached, processes)
+    return solve(expression, [values for _, values in cells], goal)
+
+
+def test_symbolic_value() -> None:
+    # The first instruction reads through the symbolic cells but its result
+    # is overwritten: data[0] = (noun + verb) * 7
+    data = [1, 0, 0, 3, 1, 1, 2, 3, 1002, 3, 7, 0, 99]
+    x0 = Polynomial.variable(0, 2)
+    x1 = Polynomial.variable(1, 2)
+    seven = Polynomial({(0, 0): 7})
+    assert symbolic_value(data, [1, 2], 0) == (x0 + x1) * seven
+    assert solve_for_goal(data, [(1, range(10)), (2, range(10))], 0, 70) == (1, 9)
+    cells = [(1, range(10)), (2, range(10))]
+    assert search_inputs(copy_factory(data), cells, CellEquals(0, 70), processes=1) == (
+        1,
+        9,
+    )
+
+
+@pytest.mark.parametrize(
+    ("data", "ranges", "goal", "expected"),
+    (
+        # noun * verb
+        ([1102, 0, 0, 0, 99], [range(1, 10), range(1, 10)], 12, (2, 6)),
+        ([1102, 0, 0, 0, 99], [range(1, 10), range(1, 10)], 11, None),
+        # (noun + verb) + 2 * verb
+        ([1101, 0, 0, 0, 1002, 2, 2, 5, 1, 0, 5, 0, 99], [range(5)] * 2, 7, (1, 2)),
+    ),
+)
+def test_solve_for_goal(
+    data: List[int], ranges: List[range], goal: int, expected: Optional[Candidate]
+) -> None:
+    cells = list(zip((1, 2), ranges))
+    assert solve_for_goal(data, cells, 0, goal) == expected
+    assert (
+        search_inputs(copy_factory(data), cells, CellEquals(0, goal), processes=1)
+        == expected
+    )
+
+
+def test_quadratic() -> None:
+    x1 = Polynomial.variable(1, 2)
+    expression = x1 * x1 + Polynomial.variable(0, 2)
+    assert solve(expression, [range(5), range(5)], 10) == (1, 3)
+
+
+def test_falls_back_on_symbolic_branch() -> None:
+    # data[0] = 2 only when the first cell is 0
+    data = [1105, 0, 7, 1101, 1, 1, 0, 99]
+    with pytest.raises(SymbolicFallback):
+        symbolic_value(data, [1], 0)
+    assert solve_for_goal(data, [(1, range(5))], 0, 2, processes=1) == (0,)
+
+
+def test_falls_back_on_output() -> None:
+    # Outputs noun * verb, then also leaves it in data[0]
+    data = [1102, 0, 0, 0, 4, 0, 99]
+    with pytest.raises(SymbolicFallback):
+        symbolic_value(data, [1, 2], 0)
+    cells = [(1, range(1, 10)), (2, range(1, 10))]
+    assert solve_for_goal(data, cells, 0, 12, processes=1) == (2, 6)
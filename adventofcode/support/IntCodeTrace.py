@@ -0,0 +1,359 @@
+"""Record an IntCode run to a binary log and replay it to any instruction.
+
+`enable_tracing(program, path)` swaps the VM's `run` for one that runs in
+`run_for` slices of `interval` instructions and logs:
+
+    b"I" value                           an input handed to the VM
+    b"O" step value                      an output, after `step` instructions
+    b"C" step position finished consumed size cells...
+                                         a memory checkpoint; `consumed`
+                                         inputs had been read by then
+
+All numbers are little-endian int64 (steps and counts unsigned). A record
+holding a value that doesn't fit is written with the lowercase kind instead,
+followed by the byte length (uint64) of its numbers as comma separated
+decimal text. Inputs are logged in the order they were queued, including any
+queued before tracing started, so whoever feeds the VM (the asyncio adapter,
+a Pipeline, ...) needs no changes. A checkpoint is written when tracing
+starts and then every `interval` instructions. Records are packed into a
+buffer that is written out in large chunks.
+
+`Replay(path).state_at(step)` restores the closest checkpoint at or before
+`step`, queues every input read after it and runs forward to `step`.
+"""
+import bisect
+import itertools
+import struct
+from array import array
+from types import TracebackType
+from typing import Any
+from typing import BinaryIO
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+from IntCode import copy_factory
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from Pipeline import ADD_INPUTS
+from Pipeline import Pipeline
+from ProgramImage import ImageIntCode
+from ProgramImage import OverlayMemory
+from ProgramImage import ProgramImage
+
+MAGIC = b"ICTR\x01"
+INPUT = struct.Struct("<cq")
+OUTPUT = struct.Struct("<cQq")
+CHECKPOINT = struct.Struct("<cQQ?QQ")
+TEXT = struct.Struct("<cQ")
+FLUSH_SIZE = 1 << 20
+
+
+def _pack_text(kind: bytes, numbers: List[int]) -> bytes:
+    text = ",".join(map(str, numbers)).encode()
+    return TEXT.pack(kind.lower(), len(text)) + text
+
+
+def _snapshot(program: IntCodeCore) -> List[int]:
+    data = program.data
+    if isinstance(data, OverlayMemory):
+        return data.tolist()
+    return data
+
+
+class Tracer:
+    def __init__(
+        self, program: IntCodeCore, path: str, interval: int = 100_000
+    ) -> None:
+        self.program = program
+        self.interval = interval
+        self.consumed = 0
+        # Inputs already queued are logged by the first `run`
+        self._pending = 0
+        self._buffer = bytearray(MAGIC)
+        self._file: Optional[BinaryIO] = open(path, "wb")
+        self.checkpoint()
+
+    def checkpoint(self) -> None:
+        program = self.program
+        cells = _snapshot(program)
+        try:
+            packed = array("q", cells).tobytes()
+        except OverflowError:
+            self._buffer += _pack_text(
+                b"C",
+                [program.steps, program.position, int(program.finished), self.consumed]
+                + cells,
+            )
+        else:
+            self._buffer += CHECKPOINT.pack(
+                b"C",
+                program.steps,
+                program.position,
+                program.finished,
+                self.consumed,
+                len(cells),
+            )
+            self._buffer += packed
+        if len(self._buffer) >= FLUSH_SIZE:
+            self.flush()
+
+    def run(self) -> Status:
+        program = self.program
+        inputs = program.inputs
+        buffer = self._buffer
+        # Inputs queued since the last call are at the back of the deque
+        for value in itertools.islice(inputs, self._pending, None):
+            try:
+                buffer += INPUT.pack(b"I", value)
+            except struct.error:
+                buffer += _pack_text(b"I", [value])
+        queued = len(inputs)
+        try:
+            while True:
+                budget = self.interval - program.steps % self.interval
+                status = program.run_for(budget)
+                if status != Status.PAUSED:
+                    break
+                self.consumed += queued - len(inputs)
+                queued = len(inputs)
+                self.checkpoint()
+        finally:
+            self.consumed += queued - len(inputs)
+            self._pending = len(inputs)
+        if status == Status.OUTPUT:
+            assert program.output is not None
+            try:
+                buffer += OUTPUT.pack(b"O", program.steps, program.output)
+            except struct.error:
+                buffer += _pack_text(b"O", [program.steps, program.output])
+        if len(buffer) >= FLUSH_SIZE:
+            self.flush()
+        return status
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def close(self) -> None:
+        """Write out the log and stop tracing the program."""
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if self.program.__dict__.get("run") == self.run:
+            del self.program.__dict__["run"]
+
+    def __enter__(self) -> "Tracer":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+def enable_tracing(program: IntCodeCore, path: str, interval: int = 100_000) -> Tracer:
+    """Log everything `program` runs from now on to `path`.
+
+    Close the returned Tracer to finish the log.
+    """
+    tracer = Tracer(program, path, interval)
+    program.run = tracer.run  # type: ignore
+    return tracer
+
+
+class Checkpoint(NamedTuple):
+    step: int
+    position: int
+    finished: bool
+    consumed: int
+    cells: List[int]
+
+
+class Replay:
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            log = f.read()
+        if not log.startswith(MAGIC):
+            raise ValueError(f"{path} is not an IntCode trace")
+        self.inputs: List[int] = []
+        self.outputs: List[Tuple[int, int]] = []
+        self.checkpoints: List[Checkpoint] = []
+        offset = len(MAGIC)
+        while offset < len(log):
+            kind = log[offset : offset + 1]
+            if kind.islower():
+                _, size = TEXT.unpack_from(log, offset)
+                offset += TEXT.size
+                numbers = [int(x) for x in log[offset : offset + size].split(b",")]
+                offset += size
+                self._add(kind.upper(), numbers)
+            elif kind == b"I":
+                self.inputs.append(INPUT.unpack_from(log, offset)[1])
+                offset += INPUT.size
+            elif kind == b"O":
+                _, step, value = OUTPUT.unpack_from(log, offset)
+                self.outputs.append((step, value))
+                offset += OUTPUT.size
+            elif kind == b"C":
+                _, step, position, finished, consumed, count = CHECKPOINT.unpack_from(
+                    log, offset
+                )
+                offset += CHECKPOINT.size
+                size = count * 8
+                cells = array("q", log[offset : offset + size]).tolist()
+                offset += size
+                self.checkpoints.append(
+                    Checkpoint(step, position, finished, consumed, cells)
+                )
+            else:
+                raise ValueError(f"Unknown record {kind!r} at offset {offset}")
+        self._steps = [checkpoint.step for checkpoint in self.checkpoints]
+
+    def _add(self, kind: bytes, numbers: List[int]) -> None:
+        if kind == b"I":
+            self.inputs.append(numbers[0])
+        elif kind == b"O":
+            self.outputs.append((numbers[0], numbers[1]))
+        elif kind == b"C":
+            step, position, finished, consumed, *cells = numbers
+            self.checkpoints.append(
+                Checkpoint(step, position, bool(finished), consumed, cells)
+            )
+        else:
+            raise ValueError(f"Unknown record {kind.lower()!r}")
+
+    def state_at(self, step: int) -> IntCodeCore:
+        """A VM in the state the traced one had after `step` instructions.
+
+        Stops early if the program halted or ran out of logged inputs.
+        """
+        index = bisect.bisect_right(self._steps, step) - 1
+        if index < 0:
+            raise ValueError(f"No checkpoint at or before step {step}")
+        checkpoint = self.checkpoints[index]
+        program = IntCodeCore(checkpoint.cells[:])
+        program.position = checkpoint.position
+        program.finished = checkpoint.finished
+        program.steps = checkpoint.step
+        program.inputs.extend(self.inputs[checkpoint.consumed :])
+        while program.steps < step:
+            status = program.run_for(step - program.steps)
+            if status == Status.HALTED or status == Status.NEEDS_INPUT:
+                break
+        return program
+
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+
+def _run_steps(data: List[int], inputs: List[int], steps: int) -> IntCodeCore:
+    program = IntCodeCore(data[:])
+    program.inputs.extend(inputs)
+    while program.steps < steps:
+        if program.run_for(steps - program.steps) == Status.HALTED:
+            break
+    return program
+
+
+def test_record_and_replay(tmp_path: Any) -> None:
+    path = str(tmp_path / "trace.bin")
+    program = IntCodeCore(SUM_LOOP[:])
+    with enable_tracing(program, path, interval=10) as tracer:
+        assert program.run() == Status.NEEDS_INPUT
+        program.inputs.append(20)
+        assert program.run() == Status.OUTPUT
+        assert program.output == 210
+        assert program.run() == Status.HALTED
+    assert tracer.consumed == 1
+    assert "run" not in program.__dict__
+
+    replay = Replay(path)
+    assert replay.inputs == [20]
+    assert replay.outputs == [(62, 210)]
+    assert [checkpoint.step for checkpoint in replay.checkpoints] == list(
+        range(0, 61, 10)
+    )
+    for step in (0, 1, 9, 10, 11, 35, 62, 63):
+        replayed = replay.state_at(step)
+        expected = _run_steps(SUM_LOOP, [20], step)
+        assert replayed.steps == expected.steps
+        assert replayed.position == expected.position
+        assert replayed.data == expected.data
+
+
+def test_trace_a_pipeline_stage(tmp_path: Any) -> None:
+    path = str(tmp_path / "trace.bin")
+    pipeline = Pipeline(copy_factory(ADD_INPUTS), 3)
+    with enable_tracing(pipeline.programs[1], path, interval=3):
+        assert pipeline.run([1, 2, 3], 10) == 16
+    replay = Replay(path)
+    # Stage 1 got its phase, then stage 0's output
+    assert replay.inputs == [2, 11]
+    assert replay.outputs[-1][1] == 13
+    assert replay.state_at(5).data[13] == 13
+
+
+def test_buffered_writes(tmp_path: Any) -> None:
+    path = str(tmp_path / "trace.bin")
+    program = IntCodeCore(SUM_LOOP[:])
+    tracer = enable_tracing(program, path, interval=1000)
+    program.inputs.append(5)
+    program.run()
+    with open(path, "rb") as f:
+        assert f.read() == b""
+    tracer.close()
+    assert Replay(path).outputs == [(17, 15)]
+    assert run_program(SUM_LOOP[:], [5]) == [15]
+
+
+def test_inputs_queued_before_tracing(tmp_path: Any) -> None:
+    path = str(tmp_path / "trace.bin")
+    program = IntCodeCore(SUM_LOOP[:])
+    program.inputs.append(20)
+    with enable_tracing(program, path, interval=10):
+        assert program.run() == Status.OUTPUT
+    replay = Replay(path)
+    assert replay.inputs == [20]
+    assert replay.checkpoints[0].consumed == 0
+    for step in (0, 35, 62):
+        assert replay.state_at(step).data == _run_steps(SUM_LOOP, [20], step).data
+
+
+def test_values_outside_int64(tmp_path: Any) -> None:
+    path = str(tmp_path / "trace.bin")
+    # Reads x, outputs x + x
+    double = [3, 9, 1, 9, 9, 9, 4, 9, 99, 0]
+    program = IntCodeCore(double[:])
+    with enable_tracing(program, path, interval=1):
+        program.inputs.append(2 ** 70)
+        assert program.run() == Status.OUTPUT
+    replay = Replay(path)
+    assert replay.inputs == [2 ** 70]
+    assert replay.outputs == [(3, 2 ** 71)]
+    assert replay.checkpoints[2].cells[9] == 2 ** 71
+    assert replay.state_at(3).data == _run_steps(double, [2 ** 70], 3).data
+
+
+def test_trace_an_image_program(tmp_path: Any) -> None:
+    path = str(tmp_path / "trace.bin")
+    image = ProgramImage.parse(",".join(map(str, SUM_LOOP[:16])))
+    program = ImageIntCode(image)
+    with enable_tracing(program, path, interval=10):
+        program.inputs.append(3)
+        assert program.run() == Status.OUTPUT
+    replay = Replay(path)
+    assert replay.outputs == [(11, 6)]
+    # Cells 20 and 21 are past the end of the image
+    assert replay.state_at(10).data == _run_steps(SUM_LOOP, [3], 10).data
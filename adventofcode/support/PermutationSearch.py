@@ -0,0 +1,207 @@
+"""Depth-first search over amplifier phase orderings.
+
+Orderings are walked as a tree of prefixes, so a stage is run once per
+distinct prefix instead of once per ordering. For a chain the state carried
+down the tree is the signal after the prefix; for a feedback ring it is also
+the VMs of the prefix, paused after their first output, which are cloned when
+a leaf completes the loop.
+
+An optional bound hook prunes subtrees: `bound(prefix, signal)` must return
+an upper bound on the final signal of every ordering starting with `prefix`.
+Subtrees can be spread over worker processes; each worker prunes against its
+own best result. The search, hook included, is handed to each worker once
+through the pool initializer; where workers are forked that needs no
+pickling, so a lambda bound works, but with the "spawn" or "forkserver"
+start methods the hook has to be picklable (e.g. a module level function).
+"""
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import pytest
+from IntCode import IntCodeCore
+from IntCode import NoInputException
+from IntCode import Status
+from Pipeline import drive
+
+Prefix = Tuple[int, ...]
+Bound = Callable[[Prefix, int], int]
+
+
+class PermutationSearch:
+    def __init__(
+        self,
+        data: List[int],
+        phases: Sequence[int],
+        should_amplify: bool = False,
+        bound: Optional[Bound] = None,
+    ) -> None:
+        self.data = data
+        self.phases = tuple(phases)
+        self.should_amplify = should_amplify
+        self.bound = bound
+        self.stage_runs = 0
+        self.pruned = 0
+        self._program = IntCodeCore(data[:])
+
+    def search(self, processes: int = 1) -> int:
+        """The largest final signal over all orderings of the phases."""
+        if processes <= 1:
+            best = self._search(self._root(), None)
+            assert best is not None
+            return best
+
+        # Enough subtrees that idle workers can pick up more work
+        depth = 1
+        while depth < len(self.phases) and self._count(depth) < processes * 4:
+            depth += 1
+        prefixes = list(itertools.permutations(self.phases, depth))
+        best = None
+        with ProcessPoolExecutor(
+            processes, initializer=_init_worker, initargs=(self,)
+        ) as executor:
+            for result, stage_runs, pruned in executor.map(_search_prefix, prefixes):
+                self.stage_runs += stage_runs
+                self.pruned += pruned
+                if result is not None and (best is None or result > best):
+                    best = result
+        assert best is not None
+        return best
+
+    def _count(self, depth: int) -> int:
+        count = 1
+        for i in range(depth):
+            count *= len(self.phases) - i
+        return count
+
+    def _root(self) -> Tuple[Prefix, List[IntCodeCore], int]:
+        return (), [], 0
+
+    def _extend(
+        self, node: Tuple[Prefix, List[IntCodeCore], int], phase: int
+    ) -> Tuple[Prefix, List[IntCodeCore], int]:
+        prefix, programs, signal = node
+        self.stage_runs += 1
+        if self.should_amplify:
+            # The stage stays alive for the rest of the loop
+            program = IntCodeCore(self.data[:])
+        else:
+            program = self._program
+            program.restore()
+        program.inputs.extend((phase, signal))
+        output = None
+        while True:
+            status = program.run()
+            if status == Status.OUTPUT:
+                output = program.output
+                if self.should_amplify:
+                    break
+            elif status == Status.NEEDS_INPUT:
+                raise NoInputException()
+            else:
+                break
+        if output is None:
+            raise Exception(f"Stage with phase {phase} halted without output")
+        if self.should_amplify:
+            return prefix + (phase,), programs + [program], output
+        return prefix + (phase,), programs, output
+
+    def _search(
+        self, node: Tuple[Prefix, List[IntCodeCore], int], best: Optional[int]
+    ) -> Optional[int]:
+        prefix, programs, signal = node
+        remaining = [phase for phase in self.phases if phase not in prefix]
+        if not remaining:
+            if not self.should_amplify:
+                return signal
+            loop = [program.clone() for program in programs]
+            loop[0].inputs.append(signal)
+            return drive(loop, ring=True, result=signal)
+
+        for phase in remaining:
+            child = self._extend(node, phase)
+            if (
+                self.bound is not None
+                and best is not None
+                and len(remaining) > 1
+                and self.bound(child[0], child[2]) <= best
+            ):
+                self.pruned += 1
+                continue
+            result = self._search(child, best)
+            if result is not None and (best is None or result > best):
+                best = result
+        return best
+
+
+# The search each worker process runs subtrees of, set by the initializer
+_worker_search: Optional[PermutationSearch] = None
+
+
+def _init_worker(search: PermutationSearch) -> None:
+    global _worker_search
+    _worker_search = search
+
+
+def _search_prefix(prefix: Prefix) -> Tuple[Optional[int], int, int]:
+    """Worker: search the subtree below `prefix` with the worker's copy of
+    the search."""
+    search = _worker_search
+    assert search is not None
+    search.stage_runs = search.pruned = 0
+    node = search._root()
+    for phase in prefix:
+        node = search._extend(node, phase)
+    return search._search(node, None), search.stage_runs, search.pruned
+
+
+# Outputs signal * 10 + phase: the best ordering spells the phases in
+# descending order
+DIGITS = [3, 15, 3, 16, 1002, 16, 10, 16, 1, 16, 15, 15, 4, 15, 99, 0, 0]
+
+
+def digits_bound(prefix: Prefix, signal: int) -> int:
+    remaining = sorted(set(range(5)) - set(prefix), reverse=True)
+    for phase in remaining:
+        signal = signal * 10 + phase
+    return signal
+
+
+def test_search_shares_prefixes() -> None:
+    search = PermutationSearch(DIGITS, range(5))
+    assert search.search() == 43210
+    assert search.stage_runs == 5 + 20 + 60 + 120 + 120
+
+
+def test_bound_prunes() -> None:
+    # Trying high phases first finds the best ordering on the first leaf
+    search = PermutationSearch(DIGITS, range(4, -1, -1), bound=digits_bound)
+    assert search.search() == 43210
+    assert search.pruned == 4 + 3 + 2 + 1
+    assert search.stage_runs == 5 + 4 + 3 + 2 + 1
+
+
+@pytest.mark.parametrize("processes", (1, 2))
+def test_feedback_loop(processes: int) -> None:
+    data = [3, 26, 1001, 26, -4, 26, 3, 27, 1002, 27, 2, 27, 1, 27, 26, 27, 4, 27]
+    data += [1001, 28, -1, 28, 1005, 28, 6, 99, 0, 0, 5]
+    search = PermutationSearch(data, range(5, 10), should_amplify=True)
+    assert search.search(processes) == 139629729
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="only forked workers can be handed an unpicklable bound",
+)
+def test_lambda_bound_in_workers() -> None:
+    search = PermutationSearch(
+        DIGITS,
+        range(4, -1, -1),
+        bound=lambda prefix, signal: digits_bound(prefix, signal),
+    )
+    assert search.search(processes=2) == 43210
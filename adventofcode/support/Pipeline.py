@@ -0,0 +1,109 @@
+"""Chains and rings of IntCode VMs running the same program.
+
+Each VM's input deque is the channel from the previous stage, so outputs are
+handed straight to the next stage without queues or an event loop. VMs are
+built once and reset with `restore()` between runs, which only undoes the
+cells the previous run wrote to.
+"""
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import pytest
+from IntCode import copy_factory
+from IntCode import IntCodeCore
+from IntCode import NoInputException
+from IntCode import ProgramFactory
+from IntCode import Status
+
+
+def drive(programs: List[IntCodeCore], ring: bool, result: Optional[int] = None) -> int:
+    """Run connected VMs until the final one halts; return its last output.
+
+    `result` is the last output of the final stage before this call, if any.
+    Stages run on this thread: a stage runs until it blocks on input or halts,
+    then control passes to the stage it has been feeding.
+    """
+    last = len(programs) - 1
+    index = 0
+    stalled = 0
+    while not programs[last].finished:
+        program = programs[index]
+        if index < last:
+            channel = programs[index + 1].inputs
+        elif ring:
+            channel = programs[0].inputs
+        else:
+            channel = None
+        progressed = False
+        was_finished = program.finished
+        while True:
+            status = program.run()
+            if status != Status.OUTPUT:
+                break
+            progressed = True
+            if index == last:
+                result = program.output
+            if channel is not None:
+                assert program.output is not None
+                channel.append(program.output)
+        if progressed or program.finished != was_finished:
+            stalled = 0
+        else:
+            stalled += 1
+        if stalled > last:
+            # A full lap without output: every stage waits on another
+            raise NoInputException()
+        index = 0 if index == last else index + 1
+    if result is None:
+        raise Exception("Final stage halted without output")
+    return result
+
+
+class Pipeline:
+    def __init__(self, factory: ProgramFactory, size: int, ring: bool = False) -> None:
+        """`size` stages, each a VM from `factory` (e.g. `copy_factory(data)`)."""
+        self.programs = [factory() for _ in range(size)]
+        self.ring = ring
+
+    def run(self, phases: Sequence[int], signal: int = 0) -> int:
+        """Feed `phases[i]` to stage i, then `signal` to stage 0.
+
+        Returns the last output of the final stage.
+        """
+        programs = self.programs
+        if len(phases) != len(programs):
+            raise ValueError(f"Expected {len(programs)} phases, got {len(phases)}")
+        for program, phase in zip(programs, phases):
+            program.restore()
+            program.inputs.append(phase)
+        programs[0].inputs.append(signal)
+
+        return drive(programs, self.ring)
+
+
+# Adds its two inputs (phase, signal) together and outputs the sum
+ADD_INPUTS = [3, 11, 3, 12, 1, 11, 12, 13, 4, 13, 99, 0, 0, 0]
+
+
+def test_chain() -> None:
+    pipeline = Pipeline(copy_factory(ADD_INPUTS), 3)
+    assert pipeline.run([1, 2, 3], 10) == 16
+    # VMs are reused between runs
+    assert pipeline.run([0, 0, 0]) == 0
+
+
+def test_ring() -> None:
+    # Reads a phase, then adds it to every signal it receives (5 times)
+    data = [3, 100, 1101, 0, 5, 101, 3, 102, 1, 100, 102, 102, 4, 102]
+    data += [1001, 101, -1, 101, 1005, 101, 6, 99] + [0] * 81
+    pipeline = Pipeline(copy_factory(data), 2, ring=True)
+    assert pipeline.run([1, 2]) == 15
+    assert pipeline.run([2, 2]) == 20
+
+
+def test_stalled_ring() -> None:
+    # Each stage reads three inputs before its first output
+    pipeline = Pipeline(copy_factory([3, 9, 3, 9, 3, 9, 4, 9, 99, 0]), 2, ring=True)
+    with pytest.raises(NoInputException):
+        pipeline.run([1, 2])
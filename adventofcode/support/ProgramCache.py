@@ -0,0 +1,170 @@
+"""Binary cache of parsed IntCode programs, stored next to the input file.
+
+`input.txt` is cached as `input.txt.icache`:
+
+    header   magic, format version, SHA-1 of the input text, cell count
+    cells    one little-endian int64 per cell
+
+The cache is fresh when its hash matches the input text; otherwise it is
+rebuilt (written to a temporary file and renamed into place). Fresh caches
+are mmap'd, so loading a program is a hash of the text plus a copy of the
+cells out of the page cache, with no integer parsing. Instructions are not
+stored: VMs decode them lazily as they execute, which is cheaper than
+building a table for every cell of the program.
+
+`load_lines` is what `AOCProblem.parse_input` uses for IntCode days: it
+returns the input lines and remembers the cached program for the first line,
+so `parse_program(input_lines[0])` in the solutions skips parsing.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+MAGIC = b"ICPC"
+VERSION = 2
+# Padded so the cells that follow are 8 byte aligned
+HEADER = struct.Struct("<4sHH20sQ4x")
+SUFFIX = ".icache"
+
+
+class CachedProgram:
+    def __init__(self, mapped: mmap.mmap, count: int) -> None:
+        self._mmap = mapped
+        start = HEADER.size
+        self.cells = memoryview(mapped)[start : start + count * 8].cast("q")
+
+    def program(self) -> List[int]:
+        """A fresh, writable copy of the program."""
+        return self.cells.tolist()
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha1(text.encode()).digest()
+
+
+def cache_path(input_path: str) -> str:
+    return input_path + SUFFIX
+
+
+def write_cache(path: str, text: str, program: List[int]) -> None:
+    cells = array("q", program)
+    if sys.byteorder != "little":
+        cells.byteswap()
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, content_hash(text), len(program)))
+        f.write(cells.tobytes())
+    os.replace(temporary_path, path)
+
+
+def read_cache(path: str, text: str) -> Optional[CachedProgram]:
+    """The cached program at `path`, or None if missing or stale."""
+    if sys.byteorder != "little":
+        return None
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) >= HEADER.size:
+        magic, version, _, digest, count = HEADER.unpack_from(mapped)
+        if (
+            magic == MAGIC
+            and version == VERSION
+            and digest == content_hash(text)
+            and len(mapped) == HEADER.size + count * 8
+        ):
+            return CachedProgram(mapped, count)
+    mapped.close()
+    return None
+
+
+def load(input_path: str, text: Optional[str] = None) -> Optional[CachedProgram]:
+    """The cached program for `input_path`, building the cache if needed.
+
+    Returns None if the input isn't a program that fits in int64 cells.
+    """
+    if text is None:
+        with open(input_path) as f:
+            text = f.read()
+    path = cache_path(input_path)
+    cached = read_cache(path, text)
+    if cached is None:
+        try:
+            program = [int(x) for x in text.split(",")]
+            write_cache(path, text, program)
+        except (ValueError, OverflowError, OSError):
+            return None
+        cached = read_cache(path, text)
+    return cached
+
+
+# Cached programs by the input line they were loaded from
+_loaded: Dict[str, CachedProgram] = {}
+
+
+def load_lines(input_path: str) -> List[str]:
+    """The lines of `input_path`, with its program cached for parse_program."""
+    with open(input_path) as f:
+        text = f.read()
+    lines = text.splitlines()
+    cached = load(input_path, text)
+    if cached is not None and lines:
+        _loaded.clear()
+        _loaded[lines[0]] = cached
+    return lines
+
+
+def parse_program(line: str) -> List[int]:
+    """The program in a comma separated input line, as a fresh list."""
+    cached = _loaded.get(line)
+    if cached is not None:
+        return cached.program()
+    return [int(x) for x in line.split(",")]
+
+
+def test_round_trip(tmp_path: Any) -> None:
+    input_path = os.path.join(str(tmp_path), "input.txt")
+    text = "1002,4,3,4,33,-7\n"
+    with open(input_path, "w") as f:
+        f.write(text)
+
+    cached = load(input_path)
+    assert cached is not None
+    assert os.path.exists(cache_path(input_path))
+    assert cached.program() == [1002, 4, 3, 4, 33, -7]
+
+    lines = load_lines(input_path)
+    assert lines == ["1002,4,3,4,33,-7"]
+    program = parse_program(lines[0])
+    program[0] = 0
+    assert parse_program(lines[0]) == [1002, 4, 3, 4, 33, -7]
+    assert parse_program("1,0,0,0,99") == [1, 0, 0, 0, 99]
+
+
+def test_stale_cache_is_rebuilt(tmp_path: Any) -> None:
+    input_path = os.path.join(str(tmp_path), "input.txt")
+    with open(input_path, "w") as f:
+        f.write("1,0,0,0,99")
+    load(input_path)
+    with open(input_path, "w") as f:
+        f.write("2,0,0,0,99")
+    assert read_cache(cache_path(input_path), "2,0,0,0,99") is None
+    cached = load(input_path)
+    assert cached is not None and cached.program() == [2, 0, 0, 0, 99]
+
+
+def test_not_a_program(tmp_path: Any) -> None:
+    input_path = os.path.join(str(tmp_path), "input.txt")
+    with open(input_path, "w") as f:
+        f.write("12\n14\n")
+    assert load(input_path) is None
+    assert load_lines(input_path) == ["12", "14"]
+    assert not os.path.exists(cache_path(input_path))
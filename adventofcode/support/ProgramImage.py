@@ -0,0 +1,266 @@
+"""Read-only program images that VMs run on without copying.
+
+A ProgramImage parses a program once into packed int64 cells behind a
+read-only memoryview. The buffer can live in this process, in a
+`multiprocessing.shared_memory` block (`share()`) or in an mmap'd file
+(`save()` / `open()`); images in shared memory or files pickle as a
+reference, so pool workers attach to the same pages instead of receiving a
+copy.
+
+An ImageIntCode runs on an OverlayMemory: a dict of the cells this VM has
+touched, filled from the image the first time each cell is read or written.
+Starting a VM copies nothing, and a VM only ever holds the cells it used.
+`functools.partial(ImageIntCode, image)` is a program factory for Pipeline
+and search_inputs that shares the image between all the VMs it makes.
+"""
+import mmap
+import pickle
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from types import TracebackType
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Type
+from typing import Union
+
+import pytest
+from IntCode import Instruction
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+
+
+class ProgramImage:
+    def __init__(self, cells: memoryview) -> None:
+        self.cells = cells
+        self._shared_memory: Optional[SharedMemory] = None
+        self._owner = False
+        self._mmap: Optional[mmap.mmap] = None
+        self._path: Optional[str] = None
+
+    @classmethod
+    def from_values(cls, values: Iterable[int]) -> "ProgramImage":
+        """Raises OverflowError if a value doesn't fit in 64 bits."""
+        return cls(memoryview(array("q", values).tobytes()).cast("q"))
+
+    @classmethod
+    def parse(cls, text: str) -> "ProgramImage":
+        return cls.from_values(int(x) for x in text.split(","))
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return tuple(self.cells[index])
+        return self.cells[index]
+
+    def __iter__(self) -> Any:
+        return iter(self.cells)
+
+    @property
+    def name(self) -> Optional[str]:
+        """The shared memory block holding this image, if it is in one."""
+        return None if self._shared_memory is None else self._shared_memory.name
+
+    def share(self) -> "ProgramImage":
+        """A copy of this image in shared memory, owned by this process.
+
+        The block is freed when the returned image is closed.
+        """
+        size = self.cells.nbytes
+        shared_memory = SharedMemory(create=True, size=max(size, 1))
+        buffer = shared_memory.buf
+        assert buffer is not None
+        buffer[:size] = self.cells.cast("B")
+        image = ProgramImage(buffer[:size].toreadonly().cast("q"))
+        image._shared_memory = shared_memory
+        image._owner = True
+        return image
+
+    @classmethod
+    def attach(cls, name: str, length: int) -> "ProgramImage":
+        """The image in the shared memory block `name`, made by `share()`."""
+        shared_memory = SharedMemory(name=name)
+        buffer = shared_memory.buf
+        assert buffer is not None
+        view = buffer[: length * 8].toreadonly().cast("q")
+        image = cls(view)
+        image._shared_memory = shared_memory
+        return image
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.cells.cast("B"))
+
+    @classmethod
+    def open(cls, path: str) -> "ProgramImage":
+        """Map the image file at `path` (written by `save()`) read-only."""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        image = cls(memoryview(mapped).cast("q"))
+        image._mmap = mapped
+        image._path = path
+        return image
+
+    def close(self) -> None:
+        self.cells.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            if self._owner:
+                self._shared_memory.unlink()
+            self._shared_memory = None
+
+    def __enter__(self) -> "ProgramImage":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Any, ...]]:
+        if self._shared_memory is not None:
+            return ProgramImage.attach, (self._shared_memory.name, len(self))
+        if self._path is not None:
+            return ProgramImage.open, (self._path,)
+        return ProgramImage.from_values, (self.cells.tolist(),)
+
+
+class OverlayMemory(Dict[int, int]):
+    """A VM's private cells over a shared ProgramImage.
+
+    Cells are copied in from the image the first time they are used; `len`
+    is the length of the program. Cells past the end read as 0 and can be
+    written, like the extended memory of later IntCode days; negative
+    addresses are rejected rather than wrapped around.
+    """
+
+    def __init__(self, image: ProgramImage) -> None:
+        super().__init__()
+        self.image = image
+
+    def __missing__(self, address: int) -> int:
+        if address < 0:
+            raise IndexError(f"Negative address {address}")
+        cells = self.image.cells
+        value = self[address] = cells[address] if address < len(cells) else 0
+        return value
+
+    def __len__(self) -> int:
+        return len(self.image)
+
+    def tolist(self) -> List[int]:
+        """Every cell up to the last one in use, without copying cells in."""
+        cells = self.image.cells.tolist()
+        cells += [0] * (max(self, default=-1) + 1 - len(cells))
+        for address, value in self.items():
+            cells[address] = value
+        return cells
+
+
+class _DecodedTable(Dict[int, Optional[Instruction]]):
+    def __missing__(self, address: int) -> None:
+        # Stored so the next lookup of this address stays in C
+        self[address] = None
+        return None
+
+
+class ImageIntCode(IntCodeCore):
+    def __init__(self, data: Union[ProgramImage, OverlayMemory]) -> None:
+        if isinstance(data, ProgramImage):
+            data = OverlayMemory(data)
+        super().__init__(data)  # type: ignore
+        self.decoded.table = _DecodedTable()  # type: ignore
+
+    def clone(self) -> "ImageIntCode":
+        """An independent ImageIntCode in the same state, snapshotted there."""
+        data = self.data
+        assert isinstance(data, OverlayMemory)
+        memory = OverlayMemory(data.image)
+        memory.update(data)
+        program = ImageIntCode(memory)
+        program.position = self.position
+        program.finished = self.finished
+        program.inputs.extend(self.inputs)
+        program.output = self.output
+        program.decoded.table.update(self.decoded.table)  # type: ignore
+        program.snapshot()
+        return program
+
+
+# Outputs 1 if the input equals 8, else 0
+EQUALS_8 = "3,9,8,9,10,9,4,9,99,-1,8"
+
+
+def test_image_is_read_only() -> None:
+    image = ProgramImage.parse(EQUALS_8)
+    assert len(image) == 11
+    assert image[9] == -1
+    assert image[:3] == (3, 9, 8)
+    with pytest.raises(TypeError):
+        image.cells[0] = 4
+
+
+def test_vms_share_an_image() -> None:
+    image = ProgramImage.parse(EQUALS_8)
+    assert run_program(image, [8], ImageIntCode) == [1]  # type: ignore
+    assert run_program(image, [7], ImageIntCode) == [0]  # type: ignore
+
+    program = ImageIntCode(image)
+    program.inputs.append(8)
+    assert program.run() == Status.OUTPUT
+    # Only the cells the VM touched were copied in
+    assert sorted(program.data) == [0, 1, 2, 3, 4, 5, 6, 7, 9, 10]
+    assert program.data[9] == 1 and image[9] == -1
+    clone = program.clone()
+    program.restore()
+    assert program.data[9] == -1
+    assert clone.data[9] == 1
+    assert clone.run() == Status.HALTED
+
+
+def test_overlay_past_the_end() -> None:
+    memory = OverlayMemory(ProgramImage.parse(EQUALS_8))
+    assert memory[11] == 0
+    memory[12] = 5
+    assert memory[12] == 5
+    assert len(memory) == 11
+    with pytest.raises(IndexError):
+        memory[-1]
+
+    # Writes past the end work through the VM as well
+    program = ImageIntCode(ProgramImage.parse("3,20,4,20,99"))
+    program.inputs.append(7)
+    assert program.run() == Status.OUTPUT and program.output == 7
+
+
+def _first_output(image: ProgramImage, value: int) -> int:
+    return run_program(image, [value], ImageIntCode)[0]  # type: ignore
+
+
+def test_shared_memory_image_pickles_by_name() -> None:
+    with ProgramImage.parse(EQUALS_8).share() as image:
+        assert len(pickle.dumps(image)) < 200
+        with ProcessPoolExecutor(2) as executor:
+            outputs = list(executor.map(_first_output, [image] * 3, [7, 8, 9]))
+        assert outputs == [0, 1, 0]
+
+
+def test_mmap_image(tmp_path: Any) -> None:
+    path = str(tmp_path / "program.bin")
+    ProgramImage.parse(EQUALS_8).save(path)
+    with ProgramImage.open(path) as image:
+        assert pickle.loads(pickle.dumps(image))[:3] == (3, 9, 8)
+        assert _first_output(image, 8) == 1
@@ -0,0 +1,107 @@
+"""Memoized IntCode runs.
+
+A program that reads all its inputs up front and then halts is a pure function
+of (program, inputs), so its outputs can be cached. Entries are keyed by a
+hash of the program and the input tuple and evicted least recently used first.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from IntCode import run_program
+
+Outputs = Tuple[int, ...]
+
+
+def program_hash(data: Sequence[int]) -> str:
+    return hashlib.sha1(",".join(str(x) for x in data).encode()).hexdigest()
+
+
+class RunCache:
+    def __init__(self, maxsize: int = 4096) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, Tuple[int, ...]], Outputs]"
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def run(
+        self, data: List[int], inputs: Sequence[int], key: Optional[str] = None
+    ) -> Outputs:
+        """Outputs of running `data` on `inputs`.
+
+        `key` is `program_hash(data)`; pass it in when running the same
+        program many times to avoid rehashing it on every call.
+        """
+        if key is None:
+            key = program_hash(data)
+        entry_key = (key, tuple(inputs))
+        entries = self._entries
+        outputs = entries.get(entry_key)
+        if outputs is not None:
+            self.hits += 1
+            entries.move_to_end(entry_key)
+            return outputs
+
+        self.misses += 1
+        outputs = tuple(run_program(data[:], inputs))
+        entries[entry_key] = outputs
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return outputs
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+# Adds its two inputs together and outputs the sum
+ADD_INPUTS = [3, 11, 3, 12, 1, 11, 12, 13, 4, 13, 99, 0, 0, 0]
+
+
+def test_hits_and_misses() -> None:
+    cache = RunCache()
+    assert cache.run(ADD_INPUTS, (1, 2)) == (3,)
+    assert cache.run(ADD_INPUTS, (1, 2)) == (3,)
+    assert cache.run(ADD_INPUTS, (2, 1)) == (3,)
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 2,
+        "evictions": 0,
+        "size": 2,
+        "maxsize": 4096,
+    }
+    # Runs never modify the caller's program
+    assert ADD_INPUTS[13] == 0
+
+
+def test_lru_eviction() -> None:
+    cache = RunCache(maxsize=2)
+    key = program_hash(ADD_INPUTS)
+    cache.run(ADD_INPUTS, (0, 1), key)
+    cache.run(ADD_INPUTS, (0, 2), key)
+    cache.run(ADD_INPUTS, (0, 1), key)
+    cache.run(ADD_INPUTS, (0, 3), key)
+    assert cache.evictions == 1
+    # (0, 2) was least recently used
+    cache.run(ADD_INPUTS, (0, 1), key)
+    assert cache.hits == 2
+    cache.run(ADD_INPUTS, (0, 2), key)
+    assert cache.misses == 4
@@ -0,0 +1,540 @@
+"""Benchmark every day and keep the results, to catch regressions.
+
+    python support/Suite.py run [--days 5 7] [--repeat 10] [--warmup 1]
+                                [--jobs N] [--timeout SECONDS]
+    python support/Suite.py compare BASE HEAD [--alpha 0.01] [--threshold 0.05]
+
+`run` finds every `dayN/dayN.py`, builds its AOCProblem (alternates are
+registered in the constructor), times each solution of both parts on the
+day's `input.txt` and appends one JSON line per solution to the history
+file, with the git revision and Python version. The revision is the short
+commit hash, with "+dirty" appended if the tree had uncommitted changes.
+
+Each solution is a task for a pool of `--jobs` processes. Every day is
+imported and its input parsed once, before the pool starts, and the workers
+share that; tasks start slowest first (by their last recorded median), so
+the whole run takes about as long as its slowest solution rather than the
+sum of all of them. A task that runs longer than `--timeout` is stopped and
+reported, and the rest carry on. Timings taken side by side are noisier
+than ones taken alone: `--jobs` defaults to one process per CPU, pass
+`--jobs 1` for the steadiest timings, and `compare` warns when the revisions
+were timed with different `--jobs`.
+
+`compare` pools the samples recorded for each solution at two revisions and
+flags a regression when HEAD is slower by more than `threshold` (as a
+fraction of the median) and a one-sided Mann-Whitney U test gives a p-value
+below `alpha`. It exits with 1 if anything regressed, so it can gate a
+change.
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import math
+import os
+import platform
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+from AOCProblem import AOCProblem
+from utils import format_ns
+from utils import mann_whitney_u
+from utils import measure
+from utils import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(ROOT, ".benchmarks", "history.jsonl")
+
+Key = Tuple[int, int, str]
+
+
+def discover(root: str = ROOT) -> List[Tuple[int, str]]:
+    """(day, path) of every `dayN/dayN.py` under `root`, by day."""
+    days = []
+    for entry in os.listdir(root):
+        match = re.fullmatch(r"day(\d+)", entry)
+        path = os.path.join(root, entry, f"{entry}.py")
+        if match and os.path.isfile(path):
+            days.append((int(match.group(1)), path))
+    return sorted(days)
+
+
+def load_problem(path: str) -> AOCProblem:
+    """An instance of the AOCProblem subclass defined in `path`."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    classes = [
+        value
+        for value in vars(module).values()
+        if isinstance(value, type)
+        and issubclass(value, AOCProblem)
+        and value.__module__ == name
+    ]
+    if len(classes) != 1:
+        raise ValueError(f"Expected one AOCProblem in {path}, found {len(classes)}")
+    return classes[0]()
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def current_revision() -> str:
+    commit = _git("rev-parse", "--short", "HEAD")
+    if commit is None:
+        return "unknown"
+    return commit + "+dirty" if _git("status", "--porcelain") else commit
+
+
+def resolve_revision(revision: str) -> str:
+    """`revision` (anything git understands, maybe with "+dirty") as stored."""
+    name, dirty, _ = revision.partition("+dirty")
+    commit = _git("rev-parse", "--short", name) or name
+    return commit + dirty
+
+
+class Task(NamedTuple):
+    """One solution of one part of a day."""
+
+    day: int
+    path: str
+    part: int
+    # Position in the problem's `solutions(part)`
+    position: int
+    name: str
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+# Problems and their parsed inputs by path, shared by all the tasks of a
+# day. `make_tasks` fills it in before the pool starts, so forked workers
+# inherit it instead of importing and parsing again.
+_loaded: Dict[str, Tuple[AOCProblem, List[str]]] = {}
+
+
+def input_path(path: str) -> str:
+    return os.path.join(os.path.dirname(path), "input.txt")
+
+
+def _load(path: str) -> Tuple[AOCProblem, List[str]]:
+    loaded = _loaded.get(path)
+    if loaded is None:
+        problem = load_problem(path)
+        loaded = _loaded[path] = (problem, problem.parse_input(input_path(path)))
+    return loaded
+
+
+def make_tasks(day: int, path: str) -> List[Task]:
+    problem, _ = _load(path)
+    return [
+        Task(day, path, part, position, solution.name)
+        for part in (1, 2)
+        for position, solution in enumerate(problem.solutions(part))
+    ]
+
+
+def longest_first(
+    tasks: Iterable[Task], records: Iterable[Dict[str, Any]]
+) -> List[Task]:
+    """`tasks`, slowest first by their latest median in `records` and those
+    never timed before all of them, so that no slow task starts last."""
+    medians = {
+        (record["day"], record["part"], record["solution"]): record["median_ns"]
+        for record in records
+    }
+    return sorted(
+        tasks, key=lambda task: -medians.get((task.day, task.part, task.name), math.inf)
+    )
+
+
+def _raise_timeout(signum: int, frame: Any) -> None:
+    raise TaskTimeout()
+
+
+def run_task(
+    task: Task, repeat: int, warmup: int, timeout: Optional[float] = None
+) -> Tuple[List[Any], List[int]]:
+    """The answers and times of `task`'s timed runs, as `measure` returns them.
+
+    Raises TaskTimeout if the warmup and timed runs together take longer
+    than `timeout` seconds (where there is SIGALRM to interrupt them).
+    """
+    problem, input_lines = _load(task.path)
+    fn = problem.solutions(task.part)[task.position].fn
+    alarm = timeout is not None and hasattr(signal, "setitimer")
+    if alarm:
+        assert timeout is not None
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return measure(lambda: fn(input_lines), repeat, warmup)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+Outcome = Union[Tuple[List[Any], List[int]], Exception]
+
+
+def run_tasks(
+    tasks: Sequence[Task],
+    repeat: int,
+    warmup: int,
+    jobs: int = 1,
+    timeout: Optional[float] = None,
+) -> Dict[Task, Outcome]:
+    """Run `tasks` in this process, or on a pool of `jobs` processes.
+
+    Maps each task to the result of `run_task`, or to the exception it
+    raised.
+    """
+    outcomes: Dict[Task, Outcome] = {}
+    if jobs <= 1:
+        for task in tasks:
+            try:
+                outcomes[task] = run_task(task, repeat, warmup, timeout)
+            except Exception as e:
+                outcomes[task] = e
+        return outcomes
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = {
+            executor.submit(run_task, task, repeat, warmup, timeout): task
+            for task in tasks
+        }
+        for future in as_completed(futures):
+            try:
+                outcomes[futures[future]] = future.result()
+            except Exception as e:
+                outcomes[futures[future]] = e
+    return outcomes
+
+
+def make_records(outcomes: Dict[Task, Outcome]) -> List[Dict[str, Any]]:
+    """Records of the tasks that finished, in day, part and solution order,
+    with answers checked against the original solution's first answer."""
+    expected = {
+        (task.day, task.part): outcome[0][0]
+        for task, outcome in outcomes.items()
+        if task.position == 0 and not isinstance(outcome, Exception)
+    }
+    records = []
+    for task, outcome in sorted(outcomes.items(), key=lambda item: item[0]):
+        if isinstance(outcome, Exception):
+            continue
+        answers, samples = outcome
+        want = expected.get((task.day, task.part), answers[0])
+        stats = summarize(samples)
+        records.append(
+            {
+                "day": task.day,
+                "part": task.part,
+                "solution": task.name,
+                "answer": str(answers[0]),
+                "ok": all(answer == want for answer in answers),
+                "samples_ns": samples,
+                "min_ns": stats.min,
+                "median_ns": stats.median,
+                "p95_ns": stats.p95,
+                "stddev_ns": stats.stddev,
+            }
+        )
+    return records
+
+
+def append_history(path: str, records: Iterable[Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def read_history(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Comparison(NamedTuple):
+    key: Key
+    base_median: float
+    head_median: float
+    # p-values of HEAD being slower and of it being faster
+    p_slower: float
+    p_faster: float
+
+
+def compare(
+    records: Sequence[Dict[str, Any]], base: str, head: str
+) -> List[Comparison]:
+    """Compare every solution recorded at both revisions."""
+    samples: Dict[Tuple[str, Key], List[float]] = {}
+    for record in records:
+        key = (record["day"], record["part"], record["solution"])
+        samples.setdefault((record["revision"], key), []).extend(record["samples_ns"])
+    comparisons = []
+    keys = sorted({key for revision, key in samples if revision == base})
+    for key in keys:
+        before = samples[base, key]
+        after = samples.get((head, key))
+        if not after:
+            continue
+        comparisons.append(
+            Comparison(
+                key,
+                statistics.median(before),
+                statistics.median(after),
+                mann_whitney_u(before, after),
+                mann_whitney_u(after, before),
+            )
+        )
+    return comparisons
+
+
+def print_comparisons(
+    comparisons: Sequence[Comparison], alpha: float, threshold: float
+) -> int:
+    """Print the comparisons; returns how many are regressions."""
+    regressions = 0
+    for comparison in comparisons:
+        day, part, solution = comparison.key
+        change = comparison.head_median / comparison.base_median - 1
+        verdict = ""
+        if comparison.p_slower < alpha and change > threshold:
+            verdict = "SLOWER"
+            regressions += 1
+        elif comparison.p_faster < alpha and -change > threshold:
+            verdict = "faster"
+        print(
+            f"day{day} part {part} {solution:<20} "
+            f"{format_ns(comparison.base_median):>9} -> "
+            f"{format_ns(comparison.head_median):>9} {change:+7.1%}  {verdict}"
+        )
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", default=HISTORY)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--days", type=int, nargs="*")
+    run_parser.add_argument("--repeat", type=int, default=10)
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes to run solutions on (default: one per CPU); "
+        "timings are noisier above 1",
+    )
+    run_parser.add_argument(
+        "--timeout",
+        type=float,
+        help="seconds each solution gets for all its runs before it is stopped",
+    )
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head", nargs="?", default="HEAD")
+    compare_parser.add_argument("--alpha", type=float, default=0.01)
+    compare_parser.add_argument("--threshold", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        base = resolve_revision(args.base)
+        head = resolve_revision(args.head)
+        records = read_history(args.history)
+        compared = [r for r in records if r["revision"] in (base, head)]
+        pythons = {r["python"] for r in compared}
+        if len(pythons) > 1:
+            print(f"Warning: comparing across Python versions {sorted(pythons)}")
+        jobs = {r.get("jobs", 1) for r in compared}
+        if len(jobs) > 1:
+            print(f"Warning: comparing runs timed with --jobs {sorted(jobs)}")
+        comparisons = compare(records, base, head)
+        if not comparisons:
+            print(f"Nothing recorded at both {base} and {head}")
+            return 1
+        regressions = print_comparisons(comparisons, args.alpha, args.threshold)
+        print(f"{regressions} regression(s) from {base} to {head}")
+        return 1 if regressions else 0
+
+    tasks = []
+    for day, path in discover():
+        if args.days and day not in args.days:
+            continue
+        if not os.path.exists(input_path(path)):
+            print(f"day{day}: no input.txt, skipped")
+            continue
+        tasks += make_tasks(day, path)
+    history = read_history(args.history) if os.path.exists(args.history) else []
+    start = time.perf_counter_ns()
+    outcomes = run_tasks(
+        longest_first(tasks, history), args.repeat, args.warmup, args.jobs, args.timeout
+    )
+    wall_ns = time.perf_counter_ns() - start
+
+    finished = {(r["day"], r["part"], r["solution"]): r for r in make_records(outcomes)}
+    failed = False
+    for task in sorted(tasks):
+        outcome = outcomes[task]
+        record = finished.get((task.day, task.part, task.name))
+        if isinstance(outcome, TaskTimeout):
+            result = f"TIMEOUT after {args.timeout}s"
+        elif isinstance(outcome, Exception):
+            result = f"ERROR: {outcome!r}"
+        else:
+            assert record is not None
+            result = f"{format_ns(record['median_ns']):>9}  {record['answer']}"
+            if not record["ok"]:
+                result += "  WRONG"
+        failed = failed or record is None or not record["ok"]
+        print(f"day{task.day} part {task.part} {task.name:<20} {result}")
+
+    revision = current_revision()
+    context = {
+        "revision": revision,
+        "python": platform.python_version(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "jobs": args.jobs,
+    }
+    for record in finished.values():
+        record.update(context)
+    append_history(args.history, finished.values())
+    timed_ns = sum(sum(record["samples_ns"]) for record in finished.values())
+    print(
+        f"{len(tasks)} solutions in {format_ns(wall_ns)} on {args.jobs} process(es)"
+        f" ({format_ns(timed_ns)} of timed runs)"
+    )
+    print(f"Recorded {revision} (Python {context['python']}) in {args.history}")
+    return 1 if failed else 0
+
+
+def _record(revision: str, solution: str, samples: List[int]) -> Dict[str, Any]:
+    return {
+        "revision": revision,
+        "day": 1,
+        "part": 1,
+        "solution": solution,
+        "samples_ns": samples,
+    }
+
+
+def test_discover() -> None:
+    days = discover()
+    assert [day for day, _ in days][:3] == [1, 2, 3]
+    problem = load_problem(dict(days)[7])
+    assert type(problem).__name__ == "Day7"
+    # Alternates are registered without running the module as a script
+    assert problem._alternate_solutions_1
+
+
+def test_compare(tmp_path: Any, capsys: Any) -> None:
+    path = str(tmp_path / "history.jsonl")
+    steady = [100, 102, 98, 101, 99, 103, 97, 100, 101, 99]
+    append_history(
+        path,
+        [
+            _record("aaa", "original", steady),
+            _record("aaa", "fast", steady),
+            _record("bbb", "original", [x * 2 for x in steady]),
+            _record("bbb", "fast", [x // 2 for x in steady]),
+            _record("bbb", "new", steady),
+        ],
+    )
+    comparisons = compare(read_history(path), "aaa", "bbb")
+    assert [comparison.key[2] for comparison in comparisons] == ["fast", "original"]
+    assert print_comparisons(comparisons, 0.01, 0.05) == 1
+    out = capsys.readouterr().out
+    assert "original" in out.split("SLOWER")[0]
+    assert "faster" in out
+    # Noise isn't a regression
+    assert print_comparisons(compare(read_history(path), "aaa", "aaa"), 0.01, 0.05) == 0
+
+
+def test_compare_warns_about_jobs(tmp_path: Any, capsys: Any) -> None:
+    path = str(tmp_path / "history.jsonl")
+    steady = [100, 102, 98, 101, 99, 103, 97, 100, 101, 99]
+    records = [_record("aaa", "original", steady), _record("bbb", "original", steady)]
+    for record, jobs in zip(records, (1, 4)):
+        record.update(python="3.8.10", jobs=jobs)
+    append_history(path, records)
+    assert main(["--history", path, "compare", "aaa", "bbb"]) == 0
+    assert "Warning: comparing runs timed with --jobs [1, 4]" in capsys.readouterr().out
+
+
+SLOW_DAY = """
+from AOCProblem import AOCProblem
+
+
+class Day99(AOCProblem):
+    def __init__(self):
+        super().__init__()
+        self.add_alternate_1("forever", self.forever)
+        self.add_alternate_2("off by one", lambda lines: len(lines) + 1)
+
+    def compute_1(self, input_lines):
+        return len(input_lines)
+
+    def compute_2(self, input_lines):
+        return len(input_lines)
+
+    def forever(self, input_lines):
+        while True:
+            pass
+"""
+
+
+def test_parallel_run_with_timeout(tmp_path: Any) -> None:
+    path = tmp_path / "day99" / "day99.py"
+    path.parent.mkdir()
+    path.write_text(SLOW_DAY)
+    (path.parent / "input.txt").write_text("a\nb\n")
+    tasks = make_tasks(99, str(path))
+    assert [(task.part, task.name) for task in tasks] == [
+        (1, "original"),
+        (1, "forever"),
+        (2, "original"),
+        (2, "off by one"),
+    ]
+    # The task with a recorded time goes after those never timed
+    previous = [{"day": 99, "part": 1, "solution": "original", "median_ns": 1}]
+    assert longest_first(tasks, previous)[-1] == tasks[0]
+
+    outcomes = run_tasks(tasks, repeat=2, warmup=0, jobs=2, timeout=0.2)
+    assert isinstance(outcomes[tasks[1]], TaskTimeout)
+    records = make_records(outcomes)
+    assert [(r["solution"], r["answer"], r["ok"]) for r in records] == [
+        ("original", "2", True),
+        ("original", "2", True),
+        ("off by one", "3", False),
+    ]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Run batches of independent IntCode jobs on a process pool.
+
+A job is a program and the list of inputs to run it on. Each distinct
+program is put in shared memory once, as a ProgramImage, and jobs only
+refer to it by name; a worker copies a program out of shared memory the
+first time it sees it and afterwards reuses its VM, restoring the cells the
+previous job touched. Jobs are sent in chunks to keep the per-job cost of
+talking to the pool low, and results are yielded as each chunk completes.
+
+A job can be given an instruction limit; a job that hits it stops with
+status PAUSED, and one that asks for more inputs than it was given stops
+with NEEDS_INPUT, rather than failing the whole batch.
+"""
+import itertools
+import os
+from concurrent.futures import as_completed
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from types import TracebackType
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Type
+
+from IntCode import IntCodeCore
+from IntCode import run_program
+from IntCode import Status
+from ProgramImage import ProgramImage
+
+# A program in shared memory: the block's name and the number of cells
+ProgramKey = Tuple[str, int]
+Chunk = Sequence[Tuple[int, ProgramKey, Sequence[int]]]
+
+
+class JobResult(NamedTuple):
+    job: int
+    status: Status
+    outputs: List[int]
+    steps: int
+
+
+# VMs by program, kept by each worker between chunks
+_worker_programs: Dict[ProgramKey, IntCodeCore] = {}
+
+
+def _worker_program(key: ProgramKey, program_class: Type[IntCodeCore]) -> IntCodeCore:
+    program = _worker_programs.get(key)
+    if program is None:
+        with ProgramImage.attach(*key) as image:
+            data = image.cells.tolist()
+        program = _worker_programs[key] = program_class(data)
+    return program
+
+
+def run_job(
+    program: IntCodeCore, inputs: Sequence[int], max_steps: Optional[int] = None
+) -> Tuple[Status, List[int], int]:
+    """Run `program` from its snapshot on `inputs`.
+
+    Returns the final status, the outputs and the instructions executed (0
+    if there was no limit to count against).
+    """
+    program.restore()
+    program.inputs.extend(inputs)
+    program.steps = 0
+    outputs: List[int] = []
+    while True:
+        if max_steps is None:
+            status = program.run()
+        else:
+            status = program.run_for(max_steps - program.steps)
+        if status != Status.OUTPUT:
+            return status, outputs, program.steps
+        assert program.output is not None
+        outputs.append(program.output)
+
+
+def _run_chunk(
+    chunk: Chunk, max_steps: Optional[int], program_class: Type[IntCodeCore]
+) -> List[JobResult]:
+    results = []
+    for job, key, inputs in chunk:
+        program = _worker_program(key, program_class)
+        results.append(JobResult(job, *run_job(program, inputs, max_steps)))
+    return results
+
+
+class VMFarm:
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        chunk_size: int = 32,
+        program_class: Type[IntCodeCore] = IntCodeCore,
+    ) -> None:
+        """With one process, jobs run in this process without a pool."""
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.program_class = program_class
+        self._keys: Dict[Tuple[int, ...], ProgramKey] = {}
+        self._images: List[ProgramImage] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if self.processes > 1:
+            self._executor = ProcessPoolExecutor(self.processes)
+
+    def _key(self, data: Sequence[int]) -> ProgramKey:
+        cells = tuple(data)
+        key = self._keys.get(cells)
+        if key is None:
+            # Raises OverflowError for programs that don't fit in int64 cells
+            image = ProgramImage.from_values(cells).share()
+            assert image.name is not None
+            key = self._keys[cells] = (image.name, len(image))
+            self._images.append(image)
+        return key
+
+    def run(
+        self,
+        jobs: Iterable[Tuple[Sequence[int], Sequence[int]]],
+        max_steps: Optional[int] = None,
+    ) -> Iterator[JobResult]:
+        """Run (program, inputs) jobs, yielding results as they complete.
+
+        Results come in completion order; `job` is the job's position in
+        `jobs`.
+        """
+        numbered = (
+            (job, self._key(data), tuple(inputs))
+            for job, (data, inputs) in enumerate(jobs)
+        )
+        chunks = iter(lambda: list(itertools.islice(numbered, self.chunk_size)), [])
+        if self._executor is None:
+            for chunk in chunks:
+                yield from _run_chunk(chunk, max_steps, self.program_class)
+            return
+        futures: List[Future[List[JobResult]]] = [
+            self._executor.submit(_run_chunk, chunk, max_steps, self.program_class)
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+    def run_all(
+        self,
+        jobs: Iterable[Tuple[Sequence[int], Sequence[int]]],
+        max_steps: Optional[int] = None,
+    ) -> List[JobResult]:
+        """The results of `run`, in job order."""
+        return sorted(self.run(jobs, max_steps))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for key in self._keys.values():
+            _worker_programs.pop(key, None)
+        for image in self._images:
+            image.close()
+        self._keys.clear()
+        self._images.clear()
+
+    def __enter__(self) -> "VMFarm":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+# Outputs 1 if the input equals 8, else 0
+EQUALS_8 = [3, 9, 8, 9, 10, 9, 4, 9, 99, -1, 8]
+
+# Reads n, then outputs n + (n - 1) + ... + 1
+SUM_LOOP = [3, 20, 1, 21, 20, 21, 1001, 20, -1, 20, 1005, 20, 2, 4, 21, 99]
+SUM_LOOP += [0] * 6
+
+
+def test_farm() -> None:
+    jobs = [(EQUALS_8, [n]) for n in range(4, 12)]
+    jobs += [(SUM_LOOP, [n]) for n in range(1, 50)]
+    with VMFarm(processes=2, chunk_size=5) as farm:
+        results = farm.run_all(jobs)
+        # Two programs, however many jobs
+        assert len(farm._images) == 2
+    assert [result.job for result in results] == list(range(len(jobs)))
+    for (data, inputs), result in zip(jobs, results):
+        assert result.status == Status.HALTED
+        assert result.outputs == run_program(data[:], inputs)
+
+
+def test_streaming_and_limits() -> None:
+    with VMFarm(processes=1) as farm:
+        results = farm.run([(SUM_LOOP, [10]), (SUM_LOOP, [1000]), (SUM_LOOP, [])], 500)
+        assert next(results) == JobResult(0, Status.HALTED, [55], 33)
+        assert next(results) == JobResult(1, Status.PAUSED, [], 500)
+        assert next(results) == JobResult(2, Status.NEEDS_INPUT, [], 0)
+        # The VM is reused but starts every job from scratch
+        assert farm.run_all([(SUM_LOOP, [10])])[0].outputs == [55]
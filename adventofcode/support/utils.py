@@ -1,20 +1,340 @@
 import contextlib
+import fnmatch
+import json
+import math
+import os
+import statistics
+import sys
 import time
+import tracemalloc
+from types import FrameType
+from typing import Any
+from typing import Callable
 from typing import Generator
+from typing import List
+from typing import NamedTuple
+from typing import Sequence
+from typing import Tuple
+from typing import TypeVar
+
+import pytest
+
+T = TypeVar("T")
+
+
+def format_ns(ns: float) -> str:
+    """A duration in the largest unit that keeps it at 1 or more."""
+    value, unit = ns, "ns"
+    for scale, scaled_unit in ((1e9, "s"), (1e6, "ms"), (1e3, "μs")):
+        if ns >= scale:
+            value, unit = ns / scale, scaled_unit
+            break
+    if value < 10:
+        return f"{value:.2f} {unit}"
+    if value < 100:
+        return f"{value:.1f} {unit}"
+    return f"{value:.0f} {unit}"
+
+
+def format_bytes(size: float) -> str:
+    """A size in the largest binary unit that keeps it at 1 or more."""
+    for scale, unit in ((2 ** 30, "GiB"), (2 ** 20, "MiB"), (2 ** 10, "KiB")):
+        if size >= scale:
+            value = size / scale
+            if value < 10:
+                return f"{value:.2f} {unit}"
+            if value < 100:
+                return f"{value:.1f} {unit}"
+            return f"{value:.0f} {unit}"
+    return f"{size:.0f} B"
 
 
 @contextlib.contextmanager
 def timing(name: str = "") -> Generator[None, None, None]:
-    start = time.time()
+    start = time.perf_counter_ns()
     try:
         yield
     finally:
-        end = time.time()
-        elapsed = (end - start) * 1000
-        unit = "ms"
-        if elapsed < 100:
-            elapsed *= 1000
-            unit = "μs"
+        elapsed = time.perf_counter_ns() - start
         if name:
             name = f" ({name})"
-        print(f"> {int(elapsed)} {unit}{name}")
+        print(f"> {format_ns(elapsed)}{name}")
+
+
+class Stats(NamedTuple):
+    """Summary of a list of timings, in nanoseconds."""
+
+    runs: int
+    min: float
+    median: float
+    p95: float
+    mean: float
+    stddev: float
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """The `fraction` percentile, interpolating between the nearest ranks."""
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * fraction
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: Sequence[float]) -> Stats:
+    return Stats(
+        len(samples),
+        min(samples),
+        statistics.median(samples),
+        percentile(samples, 0.95),
+        statistics.mean(samples),
+        statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    )
+
+
+def mann_whitney_u(before: Sequence[float], after: Sequence[float]) -> float:
+    """One-sided Mann-Whitney U test that `after` tends to be larger.
+
+    Returns the p-value, using the normal approximation with a correction
+    for ties; it is fine for the 10 or more samples a benchmark collects.
+    """
+    combined = sorted(
+        [(value, 0) for value in before] + [(value, 1) for value in after]
+    )
+    ranks = [0.0] * len(combined)
+    ties = 0.0
+    start = 0
+    while start < len(combined):
+        end = start
+        while end + 1 < len(combined) and combined[end + 1][0] == combined[start][0]:
+            end += 1
+        for index in range(start, end + 1):
+            ranks[index] = (start + end) / 2 + 1
+        count = end - start + 1
+        ties += count ** 3 - count
+        start = end + 1
+    n1, n2 = len(before), len(after)
+    n = n1 + n2
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 1)
+    u = rank_sum - n2 * (n2 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 0.5
+    z = (u - mean) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def measure(
+    fn: Callable[[], T], repeat: int, warmup: int = 0
+) -> Tuple[List[T], List[int]]:
+    """Call `fn` `warmup` times untimed, then `repeat` times timed.
+
+    Returns the results and the time of each timed call in nanoseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    results = []
+    samples = []
+    perf_counter_ns = time.perf_counter_ns
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        results.append(fn())
+        samples.append(perf_counter_ns() - start)
+    return results, samples
+
+
+class AllocationSite(NamedTuple):
+    # "file.py:line"
+    site: str
+    size: int
+    blocks: int
+
+
+class MemoryStats(NamedTuple):
+    """What one call allocated, in bytes, from tracemalloc."""
+
+    peak: int
+    # Blocks, and the sites holding the most memory, at the biggest snapshot
+    blocks: int
+    top: List[AllocationSite]
+
+
+# Take a snapshot each time traced memory grows by this factor
+_SNAPSHOT_GROWTH = 1.5
+
+
+def _profiler_files() -> Tuple[str, ...]:
+    """Prefixes of the files whose allocations are left out of the sites:
+    this module, tracemalloc, and the fnmatch and re that its filters use."""
+    library = os.path.dirname(fnmatch.__file__)
+    return (
+        __file__,
+        tracemalloc.__file__,
+        fnmatch.__file__,
+        # re is a package from Python 3.11, with sre_compile & co. before
+        os.path.join(library, "re.py"),
+        os.path.join(library, "re", ""),
+        os.path.join(library, "sre_"),
+    )
+
+
+def _allocations(
+    top: int, excluded: Tuple[str, ...]
+) -> Tuple[int, List[AllocationSite]]:
+    """Blocks traced now, and the `top` sites holding the most memory,
+    leaving out allocations in files starting with an `excluded` prefix."""
+    stats = [
+        stat
+        for stat in tracemalloc.take_snapshot().statistics("lineno")
+        if not stat.traceback[0].filename.startswith(excluded)
+    ]
+    sites = []
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        site = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+        sites.append(AllocationSite(site, stat.size, stat.count))
+    return sum(stat.count for stat in stats), sites
+
+
+def measure_memory(fn: Callable[[], T], top: int = 5) -> Tuple[T, MemoryStats]:
+    """Call `fn` once with tracemalloc, for its peak memory and what held it.
+
+    Memory a call frees before returning never shows in a snapshot taken
+    after it, so while `fn` runs a profile hook takes a snapshot whenever a
+    function returns with traced memory half as big again as at the last
+    one, while that function's locals are still alive. The biggest snapshot
+    gives the block count and the top allocation sites. The hook makes `fn`
+    much slower, so time it separately. Allocations made in this module, and
+    by the snapshots themselves, are left out of the sites.
+
+    The peak is tracemalloc's, reset after each snapshot so that the
+    snapshot's own memory is left out. Before Python 3.9 there is no
+    `reset_peak`, and from the first snapshot on (or from the start, if
+    something else was already tracing) the peak is the most memory seen
+    when a function returned instead.
+    """
+    excluded = _profiler_files()
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    reset_peak = getattr(tracemalloc, "reset_peak", None)
+    if reset_peak is not None:
+        reset_peak()
+    # Whether tracemalloc's peak covers only this call
+    exact = started or reset_peak is not None
+    get_traced_memory = tracemalloc.get_traced_memory
+    baseline = get_traced_memory()[0]
+    peak = 0
+    blocks = 0
+    sites: List[AllocationSite] = []
+    snapshot_size = 0
+
+    def snapshot() -> None:
+        nonlocal peak, blocks, sites, snapshot_size, exact
+        current, traced_peak = get_traced_memory()
+        peak = max(peak, (traced_peak if exact else current) - baseline)
+        if current - baseline <= snapshot_size * _SNAPSHOT_GROWTH:
+            return
+        snapshot_size = current - baseline
+        blocks, sites = _allocations(top, excluded)
+        if reset_peak is not None:
+            reset_peak()
+        else:
+            exact = False
+
+    def profile(frame: FrameType, event: str, arg: Any) -> None:
+        if event == "return":
+            snapshot()
+
+    previous = sys.getprofile()
+    sys.setprofile(profile)
+    try:
+        result = fn()
+    finally:
+        sys.setprofile(previous)
+    snapshot()
+    if started:
+        tracemalloc.stop()
+    return result, MemoryStats(peak, blocks, sites)
+
+
+def test_format_ns() -> None:
+    assert format_ns(950) == "950 ns"
+    assert format_ns(21_176_000) == "21.2 ms"
+    assert format_ns(4_051) == "4.05 μs"
+    assert format_ns(2_500_000_000) == "2.50 s"
+
+
+def test_format_bytes() -> None:
+    assert format_bytes(512) == "512 B"
+    assert format_bytes(1536) == "1.50 KiB"
+    assert format_bytes(300 * 2 ** 20) == "300 MiB"
+
+
+def test_summarize() -> None:
+    stats = summarize([5, 1, 4, 2, 3])
+    assert stats == Stats(5, 1, 3, pytest.approx(4.8), 3, pytest.approx(1.5811, 1e-4))
+    assert percentile([7], 0.95) == 7
+    assert summarize([7]).stddev == 0
+
+
+def test_mann_whitney_u() -> None:
+    before = [100, 102, 98, 101, 99, 103, 97, 100, 101, 99]
+    assert mann_whitney_u(before, [x + 10 for x in before]) < 0.001
+    assert mann_whitney_u(before, [x - 10 for x in before]) > 0.999
+    assert 0.2 < mann_whitney_u(before, before) < 0.8
+    assert mann_whitney_u([5, 5], [5, 5]) == 0.5
+
+
+def test_measure() -> None:
+    calls: List[int] = []
+
+    def count_calls() -> int:
+        calls.append(1)
+        return len(calls)
+
+    results, samples = measure(count_calls, 3, warmup=2)
+    assert results == [3, 4, 5]
+    assert len(samples) == 3 and all(sample >= 0 for sample in samples)
+
+
+def _rows() -> str:
+    # Parsed in json's frames, since this module's are left out of the sites
+    return json.dumps([[i] * 10 for i in range(10_000)])
+
+
+# Sites that would be the profiler's own allocations
+PROFILER_SITES = (
+    "utils.py:",
+    "tracemalloc.py:",
+    "fnmatch.py:",
+    "_parser.py:",
+    "_compiler.py:",
+    "sre_parse.py:",
+    "sre_compile.py:",
+)
+
+
+def test_measure_memory() -> None:
+    rows = _rows()
+    result, stats = measure_memory(lambda: len(json.loads(rows)))
+    assert result == 10_000
+    # The rows are gone when the call returns, but were seen before
+    assert stats.peak > 10_000 * 100
+    assert stats.blocks >= 10_000
+    top = stats.top[0]
+    assert top.site.startswith("decoder.py:") and top.size > 10_000 * 100
+    assert not any(site.site.startswith(PROFILER_SITES) for site in stats.top)
+    assert not tracemalloc.is_tracing()
+
+
+def test_measure_memory_without_reset_peak(monkeypatch: Any) -> None:
+    # As on Python 3.8
+    monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+    rows = _rows()
+    result, stats = measure_memory(lambda: len(json.loads(rows)))
+    assert result == 10_000
+    assert stats.peak > 10_000 * 100
+    assert stats.top[0].site.startswith("decoder.py:")
+    assert not any(site.site.startswith(PROFILER_SITES) for site in stats.top)